@@ -1,13 +1,26 @@
+import io
 import os
+import math
 import logging
 import json
 import uuid
+import time
+import zipfile
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context
 from werkzeug.utils import secure_filename
-from ocr_processor import InvoiceOCRProcessor
+from ocr_processor import InvoiceOCRProcessor, ProcessingQueueFull, BatchTooLarge
 from field_validator import InvoiceFieldValidator
-from models import db, Invoice, InvoiceLineItem, Company, Item, ProcessingJob
+from extraction_cache import extraction_cache
+from ocr_pool import ocr_process_pool
+from job_events import job_events
+from openai_client import openai_client
+from master_data import company_index
+from invoice_writer import save_invoice
+from invoice_import import InvoiceImporter, parse_ndjson
+from invoice_pagination import InvalidCursor, invoice_count, keyset_page, offset_page
+from invoice_export import EXPORT_FORMATS, EXPORT_MIMETYPES, ExportWatermark, export_overlap, export_query, export_rows, write_export, pa as pyarrow
+from models import db, Invoice, Company, Item, invoice_detail_options
 
 # Initialize blueprint
 api_bp = Blueprint('api', __name__)
@@ -19,11 +32,34 @@ logger = logging.getLogger(__name__)
 ocr_processor = InvoiceOCRProcessor()
 field_validator = InvoiceFieldValidator()
 
+# File types accepted for OCR processing
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'tiff', 'tif'}
+
+# Request bodies read as one invoice per line
+NDJSON_MIMETYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/jsonlines'}
+
+def allowed_file(filename):
+    """Check whether a filename has an extension we can process"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
 # Initialize processors with app in a function that can be called from app.py
 def setup_processors(app):
     """Set up processors with Flask app"""
+    extraction_cache.init_app(app)
+    ocr_process_pool.init_app(app)
+    openai_client.init_app(app)
+    company_index.init_app(app)
+    invoice_count.init_app(app)
     ocr_processor.init_app(app)
     field_validator.init_app(app)
+    
+    # Load master data now rather than on the first validation
+    if company_index.enabled:
+        try:
+            company_index.load()
+        except Exception as e:
+            logger.warning(f"Could not load the company index at startup: {str(e)}")
+            db.session.rollback()
 
 @api_bp.route('/upload', methods=['POST'])
 def upload_invoice():
@@ -38,8 +74,7 @@ def upload_invoice():
         return jsonify({'error': 'No file selected'}), 400
         
     # Check file extension
-    allowed_extensions = {'png', 'jpg', 'jpeg', 'pdf', 'tiff', 'tif'}
-    if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+    if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type. Allowed types: png, jpg, jpeg, pdf, tiff, tif'}), 400
     
     try:
@@ -55,16 +90,216 @@ def upload_invoice():
             'message': 'Invoice uploaded and processing started'
         }), 202
         
+    except ProcessingQueueFull as e:
+        # Don't keep files for work we could not accept
+        ocr_processor.discard_uploads([file_path])
+        logger.warning(f"Rejected upload, OCR queue is full: {ocr_processor.get_queue_stats()}")
+        response = jsonify({'error': 'Server is busy processing other invoices. Please retry shortly.'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+        
     except Exception as e:
         logger.exception(f"Error uploading file: {str(e)}")
         return jsonify({'error': f'Error uploading file: {str(e)}'}), 500
 
+def _save_zip_members(archive, skipped):
+    """
+    Stream supported documents out of an uploaded ZIP archive one member at a time
+    Yields the saved file paths and records unsupported members in skipped
+    """
+    max_member_size = current_app.config.get('MAX_CONTENT_LENGTH')
+    
+    with zipfile.ZipFile(archive.stream) as zf:
+        for member in zf.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or not name or name.startswith('.') or member.filename.startswith('__MACOSX/'):
+                continue
+            
+            if not allowed_file(name):
+                skipped.append({'filename': member.filename, 'reason': 'Invalid file type'})
+                continue
+            
+            if max_member_size and member.file_size > max_member_size:
+                skipped.append({'filename': member.filename, 'reason': 'File too large'})
+                continue
+            
+            with zf.open(member) as member_stream:
+                yield ocr_processor.save_file_stream(member_stream, name)
+
+@api_bp.route('/upload/batch', methods=['POST'])
+def upload_invoice_batch():
+    """
+    Upload many invoice images/PDFs, or ZIP archives of them, as a single batch
+    """
+    max_files = current_app.config.get('BATCH_MAX_FILES', 5000)
+    
+    # Batches are much larger than single uploads; must be set before the form is parsed
+    request.max_content_length = current_app.config.get('BATCH_MAX_CONTENT_LENGTH')
+    request.max_form_parts = max_files + 10
+    
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f and f.filename]
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    saved_paths = []
+    skipped = []
+    
+    try:
+        for file in files:
+            if file.filename.lower().endswith('.zip'):
+                for file_path in _save_zip_members(file, skipped):
+                    saved_paths.append(file_path)
+                    if len(saved_paths) > max_files:
+                        break
+            elif allowed_file(file.filename):
+                saved_paths.append(ocr_processor.save_uploaded_file(file))
+            else:
+                skipped.append({'filename': file.filename, 'reason': 'Invalid file type'})
+            
+            if len(saved_paths) > max_files:
+                ocr_processor.discard_uploads(saved_paths)
+                return jsonify({'error': f'Too many documents in batch. Maximum is {max_files}'}), 413
+        
+        if not saved_paths:
+            return jsonify({'error': 'No supported documents found in upload', 'skipped': skipped}), 400
+        
+        # Start OCR processing for the whole batch
+        batch_id = str(uuid.uuid4())
+        job_ids = ocr_processor.process_batch_async(saved_paths, batch_id=batch_id)
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'job_count': len(job_ids),
+            'job_ids': job_ids,
+            'skipped': skipped,
+            'status_url': url_for('api.get_batch_status', batch_id=batch_id),
+            'message': f'{len(job_ids)} invoices uploaded and processing started'
+        }), 202
+        
+    except zipfile.BadZipFile:
+        ocr_processor.discard_uploads(saved_paths)
+        return jsonify({'error': 'Invalid ZIP archive'}), 400
+        
+    except BatchTooLarge as e:
+        ocr_processor.discard_uploads(saved_paths)
+        return jsonify({'error': f'Too many new documents in batch. Maximum is {e.limit}'}), 413
+        
+    except ProcessingQueueFull as e:
+        ocr_processor.discard_uploads(saved_paths)
+        logger.warning(f"Rejected batch of {len(saved_paths)} files, OCR queue is full: {ocr_processor.get_queue_stats()}")
+        response = jsonify({'error': 'Server does not have capacity for this batch. Please retry shortly or upload fewer files.'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+        
+    except Exception as e:
+        ocr_processor.discard_uploads(saved_paths)
+        logger.exception(f"Error uploading batch: {str(e)}")
+        return jsonify({'error': f'Error uploading batch: {str(e)}'}), 500
+
+@api_bp.route('/batches/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """
+    Get aggregate progress of a batch upload
+    """
+    try:
+        batch_status = ocr_processor.get_batch_status(batch_id)
+        
+        if not batch_status:
+            return jsonify({'error': 'Batch not found'}), 404
+            
+        return jsonify(batch_status), 200
+        
+    except Exception as e:
+        logger.exception(f"Error getting batch status: {str(e)}")
+        return jsonify({'error': f'Error getting batch status: {str(e)}'}), 500
+
+def _parse_job_position(value):
+    """(started_at, id) from a next_after value; raises ValueError if it is malformed"""
+    started_at, separator, row_id = value.rpartition(',')
+    if not separator:
+        raise ValueError(value)
+    return datetime.fromisoformat(started_at), int(row_id)
+
+@api_bp.route('/processing', methods=['GET'])
+def get_processing_statuses():
+    """
+    Get the status of many OCR processing jobs at once
+    Select jobs with ?ids=a,b,c, ?batch_id=... and/or a ?since=/&until= ISO time window;
+    pass ?include_results=true to include extraction results
+    At most JOB_STATUS_MAX_JOBS jobs are returned; when more match, the response has
+    truncated=true and next_after, which is passed as ?after= to get the following jobs
+    """
+    max_jobs = current_app.config.get('JOB_STATUS_MAX_JOBS', 500)
+    job_ids = [job_id.strip() for job_id in request.args.get('ids', '').split(',') if job_id.strip()]
+    job_ids = list(dict.fromkeys(job_ids))  # Drop duplicates, keep order
+    batch_id = request.args.get('batch_id')
+    include_result = request.args.get('include_results', 'false').lower() in ('1', 'true', 'yes')
+    
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+    
+    try:
+        after = _parse_job_position(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return jsonify({'error': 'after must be the next_after value of a previous response'}), 400
+    
+    if not (job_ids or batch_id or since or until):
+        return jsonify({'error': 'Provide ids, batch_id, or a since/until time window'}), 400
+    
+    if len(job_ids) > max_jobs:
+        return jsonify({'error': f'Too many job ids. Maximum is {max_jobs}'}), 400
+    
+    try:
+        jobs, continuation = ocr_processor.get_jobs_status(
+            job_ids=job_ids,
+            batch_id=batch_id,
+            since=since,
+            until=until,
+            include_result=include_result,
+            limit=max_jobs,
+            after=after
+        )
+        
+        response = {'jobs': jobs, 'count': len(jobs), 'truncated': continuation is not None}
+        if continuation:
+            response['next_after'] = f"{continuation[0].isoformat()},{continuation[1]}"
+        if job_ids:
+            found = {job['job_id'] for job in jobs}
+            response['missing'] = [job_id for job_id in job_ids if job_id not in found]
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        logger.exception(f"Error getting job statuses: {str(e)}")
+        return jsonify({'error': f'Error getting job statuses: {str(e)}'}), 500
+
 @api_bp.route('/processing/<job_id>', methods=['GET'])
 def get_processing_status(job_id):
     """
     Get the status of an OCR processing job
+    Long-poll by passing the last seen status and a wait time in seconds, e.g.
+    ?status=processing&wait=30; the response is returned as soon as the status changes
     """
     try:
+        known_status = request.args.get('status')
+        wait = request.args.get('wait', 0, type=float)
+        
+        if known_status and wait > 0:
+            wait = min(wait, current_app.config.get('JOB_STATUS_MAX_WAIT', 60))
+            recheck_interval = current_app.config.get('JOB_STATUS_RECHECK_INTERVAL', 5)
+            job_status = ocr_processor.wait_for_job_status(job_id, known_status, wait, recheck_interval)
+            
+            if not job_status:
+                return jsonify({'error': 'Job not found'}), 404
+            
+            # Nothing changed, skip loading the result
+            if job_status['status'] == known_status:
+                return jsonify(job_status), 200
+        
         job_status = ocr_processor.get_job_status(job_id)
         
         if not job_status:
@@ -76,6 +311,83 @@ def get_processing_status(job_id):
         logger.exception(f"Error getting job status: {str(e)}")
         return jsonify({'error': f'Error getting job status: {str(e)}'}), 500
 
+@api_bp.route('/processing/<job_id>/events', methods=['GET'])
+def stream_processing_status(job_id):
+    """
+    Stream status transitions of an OCR processing job as server-sent events
+    """
+    job_status = ocr_processor.get_job_status(job_id, include_result=False)
+    if not job_status:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Each stream occupies a server thread for its whole lifetime; past the limit clients poll instead
+    max_streams = current_app.config.get('JOB_STATUS_MAX_STREAMS', 24)
+    if not job_events.open_stream(max_streams):
+        logger.warning(f"Refused status stream for job {job_id}, {max_streams} streams already open")
+        response = jsonify({'error': 'Too many open status streams. Poll /api/processing/<job_id> instead.'})
+        response.headers['Retry-After'] = str(current_app.config.get('OCR_RETRY_AFTER', 10))
+        return response, 503
+    
+    stream_timeout = current_app.config.get('JOB_STATUS_STREAM_TIMEOUT', 300)
+    recheck_interval = current_app.config.get('JOB_STATUS_RECHECK_INTERVAL', 5)
+    keep_alive_interval = 15
+    
+    def generate(job_status):
+        deadline = time.monotonic() + stream_timeout
+        yield f"event: status\ndata: {json.dumps(job_status)}\n\n"
+        
+        while job_status['status'] not in ('completed', 'error'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Clients reconnect automatically and get the current status first
+                return
+            
+            latest = ocr_processor.wait_for_job_status(
+                job_id, job_status['status'], min(remaining, keep_alive_interval), recheck_interval
+            )
+            if not latest:
+                return
+            
+            if latest['status'] == job_status['status']:
+                yield ": keep-alive\n\n"
+            else:
+                job_status = latest
+                yield f"event: status\ndata: {json.dumps(job_status)}\n\n"
+    
+    response = Response(generate(job_status), mimetype='text/event-stream')
+    response.call_on_close(job_events.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+@api_bp.route('/queue', methods=['GET'])
+def get_queue_status():
+    """
+    Get OCR worker pool utilisation for this process
+    """
+    return jsonify(ocr_processor.get_queue_stats()), 200
+
+@api_bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    Get extraction cache hit/miss statistics for this process
+    """
+    return jsonify(extraction_cache.get_stats()), 200
+
+@api_bp.route('/openai', methods=['GET'])
+def get_openai_stats():
+    """
+    Get OpenAI request, retry and rate limit statistics for this process
+    """
+    return jsonify(openai_client.get_stats()), 200
+
+@api_bp.route('/master-data', methods=['GET'])
+def get_master_data_stats():
+    """
+    Get GSTIN index size, version and hit/miss statistics for this process
+    """
+    return jsonify(company_index.get_stats()), 200
+
 @api_bp.route('/validate-invoice', methods=['POST'])
 def validate_invoice():
     """
@@ -104,6 +416,169 @@ def validate_invoice():
         logger.exception(f"Error validating invoice: {str(e)}")
         return jsonify({'error': f'Error validating invoice: {str(e)}'}), 500
 
+def _validate_batch(records, offset):
+    """
+    Validate a batch of (invoice, parse_error) records against master data resolved once for the batch
+    Returns one result dict per record, numbered from offset
+    """
+    invoices = [invoice for invoice, error in records if error is None and isinstance(invoice, dict)]
+    master_data = field_validator.resolve_master_data(invoices)
+    
+    results = []
+    for index, (invoice, error) in enumerate(records, start=offset):
+        result = {'index': index}
+        if error is None and not isinstance(invoice, dict):
+            error = 'Invoice must be a JSON object'
+        
+        if error is None:
+            try:
+                is_valid, errors = field_validator.validate_invoice(invoice, master_data)
+                result['valid'] = is_valid
+                result['errors'] = errors if not is_valid else None
+            except Exception as e:
+                error = f'Error validating invoice: {str(e)}'
+        
+        if error is not None:
+            result['valid'] = False
+            result['error'] = error
+        elif 'invoice_number' in invoice:
+            result['invoice_number'] = invoice['invoice_number']
+        
+        if isinstance(invoice, dict) and 'ocr_confidence' in invoice:
+            result['ocr_confidence'] = invoice['ocr_confidence']
+        results.append(result)
+    return results
+
+@api_bp.route('/validate-invoices', methods=['POST'])
+def validate_invoices():
+    """
+    Validate many invoices in one request, sent as a JSON array or as NDJSON (one invoice per line)
+    Master data is resolved per batch of VALIDATION_BATCH_SIZE invoices with a few IN queries.
+    NDJSON requests are read and answered incrementally with one result line per invoice;
+    results always keep the input order.
+    """
+    request.max_content_length = current_app.config.get('VALIDATION_MAX_CONTENT_LENGTH')
+    batch_size = max(1, current_app.config.get('VALIDATION_BATCH_SIZE', 1000))
+    
+    if request.mimetype in NDJSON_MIMETYPES:
+        def generate():
+            batch = []
+            offset = 0
+            try:
+                # The WSGI input stream is unbuffered, so read lines through a buffer
+                lines = io.BufferedReader(request.stream, buffer_size=1024 * 1024)
+                for record in parse_ndjson(lines):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        yield ''.join(json.dumps(result) + '\n' for result in _validate_batch(batch, offset))
+                        offset += len(batch)
+                        batch = []
+                yield ''.join(json.dumps(result) + '\n' for result in _validate_batch(batch, offset))
+            except Exception as e:
+                # Headers are already sent, so report the failure in-band and stop
+                logger.exception(f"Error validating invoice stream: {str(e)}")
+                yield json.dumps({'error': f'Error validating invoices: {str(e)}'}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a JSON array of invoices or an NDJSON body'}), 400
+    
+    try:
+        results = []
+        for start in range(0, len(data), batch_size):
+            results.extend(_validate_batch([(invoice, None) for invoice in data[start:start + batch_size]], start))
+        
+        valid_count = sum(1 for result in results if result['valid'])
+        return jsonify({
+            'results': results,
+            'total': len(results),
+            'valid': valid_count,
+            'invalid': len(results) - valid_count
+        }), 200
+        
+    except Exception as e:
+        logger.exception(f"Error validating invoices: {str(e)}")
+        return jsonify({'error': f'Error validating invoices: {str(e)}'}), 500
+
+@api_bp.route('/import-invoices', methods=['POST'])
+def import_invoices():
+    """
+    Bulk-import pre-extracted invoices sent as NDJSON (one invoice per line)
+    The body is read incrementally and imported in batches of IMPORT_BATCH_SIZE, one
+    transaction each. The response streams one line per failed record, a progress line
+    after every batch and a summary line at the end.
+    """
+    if request.mimetype not in NDJSON_MIMETYPES:
+        return jsonify({'error': 'Expected an NDJSON body (Content-Type: application/x-ndjson)'}), 415
+    
+    request.max_content_length = current_app.config.get('IMPORT_MAX_CONTENT_LENGTH')
+    importer = InvoiceImporter(field_validator, request.args.get('batch_size', type=int) or
+                               current_app.config.get('IMPORT_BATCH_SIZE', 500))
+    
+    def generate():
+        try:
+            # The WSGI input stream is unbuffered, so read lines through a buffer
+            lines = io.BufferedReader(request.stream, buffer_size=1024 * 1024)
+            events = []
+            for event in importer.run(parse_ndjson(lines)):
+                events.append(json.dumps(event) + '\n')
+                if 'progress' in event or 'summary' in event:
+                    yield ''.join(events)
+                    events = []
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band and stop
+            db.session.rollback()
+            logger.exception(f"Error importing invoice stream: {str(e)}")
+            yield json.dumps({'error': f'Error importing invoices: {str(e)}', 'progress': importer.progress()}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api_bp.route('/export/invoices', methods=['GET'])
+def export_invoices():
+    """
+    Stream invoices with their line items as CSV, NDJSON or Parquet (?format=)
+    Filters: date_from and date_to (invoice_date, YYYY-MM-DD), vendor (GSTIN) and status.
+    Rows are ordered by (updated_at, invoice_id); pass after=<updated_at>,<invoice_id>
+    of the last invoice received to continue an interrupted or incremental export.
+    Invoices updated within EXPORT_OVERLAP_SECONDS before that watermark are sent again.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format: {export_format}. Use one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if export_format == 'parquet' and pyarrow is None:
+        return jsonify({'error': 'Parquet export requires the pyarrow package'}), 501
+    
+    try:
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+        after = ExportWatermark.parse(request.args['after']) if request.args.get('after') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid export filter: {str(e)}'}), 400
+    
+    query = export_query(date_from, date_to, request.args.get('vendor'), request.args.get('status'), after,
+                         export_overlap(current_app.config))
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    row_group_size = current_app.config.get('EXPORT_PARQUET_ROW_GROUP_SIZE', 50000)
+    
+    def generate():
+        try:
+            yield from write_export(export_format, export_rows(query, batch_size), row_group_size)
+        except Exception as e:
+            # Headers are already sent; abort the response so the client sees an incomplete transfer
+            db.session.rollback()
+            logger.exception(f"Error exporting invoices: {str(e)}")
+            raise
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename=invoices.{export_format}'}
+    )
+
 @api_bp.route('/submit-invoice', methods=['POST'])
 def submit_invoice():
     """
@@ -114,70 +589,22 @@ def submit_invoice():
         return jsonify({'error': 'No data provided'}), 400
     
     try:
-        # Validate the invoice first
-        is_valid, errors = field_validator.validate_invoice(data)
+        # Validate the invoice first; the vendor, customer and item ids it resolves are reused below
+        master_data = field_validator.resolve_master_data([data])
+        is_valid, errors = field_validator.validate_invoice(data, master_data)
         
         if not is_valid:
             return jsonify({
                 'error': 'Invalid invoice data',
                 'validation_errors': errors
             }), 400
-            
-        # Get vendor and customer by GSTIN
-        vendor = Company.query.filter_by(gstin=data['vendor']['gstin']).first()
-        customer = Company.query.filter_by(gstin=data['customer']['gstin']).first()
         
-        if not vendor or not customer:
+        # Create the invoice, bulk-insert its line items and link the processing job
+        invoice = save_invoice(db.session, data, master_data)
+        if invoice is None:
+            # Defensive: validation already rejects invoices whose vendor or customer is unknown
             return jsonify({'error': 'Vendor or customer not found in master data'}), 400
-            
-        # Create new invoice
-        invoice = Invoice(
-            invoice_number=data['invoice_number'],
-            invoice_date=datetime.strptime(data['invoice_date'], '%Y-%m-%d').date(),
-            due_date=datetime.strptime(data['due_date'], '%Y-%m-%d').date() if data.get('due_date') else None,
-            po_number=data.get('po_number'),
-            vendor_id=vendor.id,
-            customer_id=customer.id,
-            place_of_supply=data.get('place_of_supply'),
-            subtotal=float(data['subtotal']),
-            tax_amount=float(data['tax_amount']),
-            discount=float(data.get('discount', 0)),
-            total_amount=float(data['total_amount']),
-            terms=data.get('terms', 'Immediate'),
-            ocr_confidence=float(data.get('ocr_confidence', 0)),
-            processing_status='completed',
-            notes=data.get('notes')
-        )
-        
-        db.session.add(invoice)
-        db.session.flush()  # Get the invoice ID
         
-        # Create line items
-        for item_data in data['line_items']:
-            # Check if item exists in master data
-            item = None
-            if 'hsn_sac' in item_data:
-                item = Item.query.filter_by(hsn_sac=item_data['hsn_sac']).first()
-            
-            line_item = InvoiceLineItem(
-                invoice_id=invoice.id,
-                item_id=item.id if item else None,
-                description=item_data['description'],
-                hsn_sac=item_data.get('hsn_sac'),
-                quantity=float(item_data['quantity']),
-                rate=float(item_data['rate']),
-                tax_percentage=float(item_data['tax_percentage']),
-                tax_amount=float(item_data['tax_amount']),
-                amount=float(item_data['amount'])
-            )
-            db.session.add(line_item)
-        
-        # Update the processing job with the invoice ID if job_id provided
-        if 'job_id' in data:
-            job = ProcessingJob.query.filter_by(job_id=data['job_id']).first()
-            if job:
-                job.invoice_id = invoice.id
-                
         db.session.commit()
         
         return jsonify({
@@ -197,7 +624,7 @@ def get_invoice(invoice_id):
     Get invoice details by ID
     """
     try:
-        invoice = Invoice.query.get(invoice_id)
+        invoice = db.session.get(Invoice, invoice_id, options=invoice_detail_options())
         
         if not invoice:
             return jsonify({'error': 'Invoice not found'}), 404
@@ -211,24 +638,43 @@ def get_invoice(invoice_id):
 @api_bp.route('/invoices', methods=['GET'])
 def get_invoices():
     """
-    Get all invoices with pagination
+    Get invoices newest first, one page at a time
+    Follow next_cursor / prev_cursor (?cursor=...) to move between pages; ?page=N is
+    still accepted and returns the numbered page with its page count, as does the first
+    page when no cursor is given. total is cached and approximate (see InvoiceCount);
+    pass include_total=false to leave it out.
     """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        invoices = Invoice.query.order_by(Invoice.invoice_date.desc()).paginate(page=page, per_page=per_page)
+        per_page = max(1, request.args.get('per_page', 10, type=int))
+        cursor = request.args.get('cursor')
+        page = request.args.get('page', type=int)
+        include_total = request.args.get('include_total', 'true').lower() != 'false'
+        
+        # Vendors, customers, line items and items are loaded for the whole page, not per invoice
+        query = Invoice.query.options(*invoice_detail_options())
+        if page is not None and cursor is None:
+            invoices = offset_page(query, page, per_page)
+            include_total = True
+        else:
+            invoices = keyset_page(query, per_page, cursor)
         
         result = {
             'items': [invoice.to_dict() for invoice in invoices.items],
-            'page': invoices.page,
             'per_page': invoices.per_page,
-            'total': invoices.total,
-            'pages': invoices.pages
+            'next_cursor': invoices.next_cursor,
+            'prev_cursor': invoices.prev_cursor
         }
+        if include_total:
+            result['total'] = invoice_count.get()
+        if cursor is None and include_total:
+            # Numbered responses keep their page fields; only cursor requests drop them
+            result['page'] = max(page or 1, 1)
+            result['pages'] = math.ceil(result['total'] / per_page)
         
         return jsonify(result), 200
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.exception(f"Error getting invoices: {str(e)}")
         return jsonify({'error': f'Error getting invoices: {str(e)}'}), 500
@@ -274,8 +720,7 @@ def test_openai_ocr():
         return jsonify({'error': 'No file selected', 'success': False}), 400
         
     # Check file extension
-    allowed_extensions = {'png', 'jpg', 'jpeg', 'pdf', 'tiff', 'tif'}
-    if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+    if not allowed_file(file.filename):
         logger.error(f"Invalid file type: {file.filename}")
         return jsonify({
             'error': 'Invalid file type. Allowed types: png, jpg, jpeg, pdf, tiff, tif',
@@ -32,11 +32,96 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 # Configure upload folder
 app.config["UPLOAD_FOLDER"] = os.path.join(os.getcwd(), "uploads")
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16 MB max upload size
+app.config["BATCH_MAX_CONTENT_LENGTH"] = int(os.environ.get("BATCH_MAX_CONTENT_LENGTH", 2 * 1024 * 1024 * 1024))  # 2 GB max batch upload size
+app.config["BATCH_MAX_FILES"] = int(os.environ.get("BATCH_MAX_FILES", 5000))  # Max documents per batch
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
 # Configure OCR settings
 app.config["OCR_CONFIDENCE_THRESHOLD"] = 80  # Confidence threshold for OCR results
 app.config["OCR_TIMEOUT"] = 30  # Timeout for OCR processing in seconds
+app.config["OCR_ENGINE"] = os.environ.get("OCR_ENGINE", "auto")  # tesserocr, pytesseract, or auto (tesserocr when installed)
+app.config["OCR_TESSDATA_PATH"] = os.environ.get("TESSDATA_PREFIX")  # Directory containing eng.traineddata for tesserocr
+
+# Configure multi-page documents (PDF and TIFF)
+app.config["DOCUMENT_DPI"] = int(os.environ.get("DOCUMENT_DPI", 200))  # Resolution PDF pages are rasterized at
+app.config["DOCUMENT_SKIP_BLANK_PAGES"] = os.environ.get("DOCUMENT_SKIP_BLANK_PAGES", "true").lower() == "true"
+app.config["OCR_PAGE_WORKERS"] = int(os.environ.get("OCR_PAGE_WORKERS", os.cpu_count() or 2))  # Pages OCRed concurrently per process
+app.config["OPENAI_MAX_PAGES"] = int(os.environ.get("OPENAI_MAX_PAGES", 10))  # Pages sent to OpenAI per document
+app.config["OPENAI_IMAGE_MAX_DIMENSION"] = int(os.environ.get("OPENAI_IMAGE_MAX_DIMENSION", 2048))  # Longest side of images sent to OpenAI
+app.config["OPENAI_IMAGE_FORMAT"] = os.environ.get("OPENAI_IMAGE_FORMAT", "auto")  # jpeg, png, webp, or auto (smaller of png and jpeg)
+
+# Configure OCR preprocessing: stages run in order on an in-place grayscale buffer; 1x1 kernels are skipped
+app.config["OCR_PREPROCESS_STAGES"] = os.environ.get("OCR_PREPROCESS_STAGES", "resample,blur,threshold,open")  # Any of resample, blur, threshold, open
+app.config["OCR_TARGET_DPI"] = int(os.environ.get("OCR_TARGET_DPI", 300))  # Pages above this resolution are downsampled, 0 disables
+app.config["OCR_PAGE_MEMORY_LIMIT_MB"] = int(os.environ.get("OCR_PAGE_MEMORY_LIMIT_MB", 64))  # Working memory ceiling per page, 0 disables
+app.config["OCR_BLUR_KERNEL"] = int(os.environ.get("OCR_BLUR_KERNEL", 5))  # Gaussian blur kernel size (odd)
+app.config["OCR_THRESHOLD_BLOCK_SIZE"] = int(os.environ.get("OCR_THRESHOLD_BLOCK_SIZE", 11))  # Adaptive threshold neighbourhood (odd)
+app.config["OCR_THRESHOLD_C"] = int(os.environ.get("OCR_THRESHOLD_C", 2))  # Constant subtracted from the neighbourhood mean
+app.config["OCR_OPEN_KERNEL"] = int(os.environ.get("OCR_OPEN_KERNEL", 1))  # Morphological opening kernel size, 1 skips the stage
+
+# Configure the shared OpenAI client: concurrency cap, quotas and retries
+app.config["OPENAI_BASE_URL"] = os.environ.get("OPENAI_BASE_URL")  # e.g. http://127.0.0.1:8089/v1 for benchmarks/fake_openai_server.py
+app.config["OPENAI_MAX_CONCURRENCY"] = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8))  # Requests in flight per process
+app.config["OPENAI_RPM_LIMIT"] = int(os.environ.get("OPENAI_RPM_LIMIT", 500))  # Requests per minute per process, 0 disables
+app.config["OPENAI_TPM_LIMIT"] = int(os.environ.get("OPENAI_TPM_LIMIT", 30000))  # Tokens per minute per process, 0 disables
+app.config["OPENAI_MAX_RETRIES"] = int(os.environ.get("OPENAI_MAX_RETRIES", 5))  # Retries for 429, 5xx and connection errors
+app.config["OPENAI_BACKOFF_BASE"] = float(os.environ.get("OPENAI_BACKOFF_BASE", 1.0))  # First backoff ceiling in seconds, doubled per retry
+app.config["OPENAI_BACKOFF_MAX"] = float(os.environ.get("OPENAI_BACKOFF_MAX", 60))  # Longest wait between retries
+app.config["OPENAI_REQUEST_TIMEOUT"] = float(os.environ.get("OPENAI_REQUEST_TIMEOUT", 120))  # Per-attempt timeout in seconds
+
+# Configure OCR worker pool
+app.config["OCR_MAX_WORKERS"] = int(os.environ.get("OCR_MAX_WORKERS", os.cpu_count() or 2))  # Concurrent OCR jobs per process
+app.config["OCR_QUEUE_SIZE"] = int(os.environ.get("OCR_QUEUE_SIZE", 50))  # Jobs allowed to wait for a free worker
+app.config["OCR_BATCH_BACKLOG_SIZE"] = int(os.environ.get("OCR_BATCH_BACKLOG_SIZE", 10000))  # Batch documents held as pending jobs until a worker slot frees up
+app.config["OCR_RETRY_AFTER"] = int(os.environ.get("OCR_RETRY_AFTER", 10))  # Retry-After seconds sent when the queue is full
+
+# Configure extraction result cache
+app.config["EXTRACTION_CACHE_ENABLED"] = os.environ.get("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+app.config["EXTRACTION_CACHE_MAX_BYTES"] = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # In-memory tier size
+app.config["EXTRACTION_CACHE_DIR"] = os.environ.get("EXTRACTION_CACHE_DIR", os.path.join(os.getcwd(), "extraction_cache"))
+
+# Configure the in-memory GSTIN index over company master data
+app.config["COMPANY_INDEX_ENABLED"] = os.environ.get("COMPANY_INDEX_ENABLED", "true").lower() == "true"
+app.config["COMPANY_INDEX_CHECK_INTERVAL"] = float(os.environ.get("COMPANY_INDEX_CHECK_INTERVAL", 5))  # Seconds between checks for changes made by other processes
+
+# Configure batch validation (/api/validate-invoices)
+app.config["VALIDATION_BATCH_SIZE"] = int(os.environ.get("VALIDATION_BATCH_SIZE", 1000))  # Invoices whose master data is resolved together
+app.config["VALIDATION_MAX_CONTENT_LENGTH"] = int(os.environ.get("VALIDATION_MAX_CONTENT_LENGTH", 1024 * 1024 * 1024))  # 1 GB max request body
+app.config["VALIDATION_RULES_FILE"] = os.environ.get("VALIDATION_RULES_FILE")  # Optional JSON overriding field rules and valid states
+app.config["VALIDATION_COLUMNAR_MIN_LINES"] = int(os.environ.get("VALIDATION_COLUMNAR_MIN_LINES", 500))  # Line items at which invoices are validated as columns
+app.config["VALIDATION_CHECK_LINE_TAX"] = os.environ.get("VALIDATION_CHECK_LINE_TAX", "false").lower() == "true"  # Check each line's tax against its rate
+
+# Configure bulk import (/api/import-invoices and flask import-invoices)
+app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", 500))  # Invoices validated and committed together
+app.config["IMPORT_MAX_CONTENT_LENGTH"] = int(os.environ.get("IMPORT_MAX_CONTENT_LENGTH", 4 * 1024 * 1024 * 1024))  # 4 GB max request body
+
+# Configure invoice exports (/api/export/invoices and flask export-invoices)
+app.config["EXPORT_BATCH_SIZE"] = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))  # Rows fetched per round trip from the server-side cursor
+app.config["EXPORT_PARQUET_ROW_GROUP_SIZE"] = int(os.environ.get("EXPORT_PARQUET_ROW_GROUP_SIZE", 50000))  # Rows buffered per Parquet row group
+app.config["EXPORT_OVERLAP_SECONDS"] = int(os.environ.get("EXPORT_OVERLAP_SECONDS", 60))  # Incremental exports re-read invoices updated this long before the watermark
+
+# Configure invoice listings (/api/invoices and /invoices)
+app.config["INVOICE_COUNT_CACHE_TTL"] = float(os.environ.get("INVOICE_COUNT_CACHE_TTL", 60))  # Seconds the approximate invoice total is reused
+app.config["INVOICE_COUNT_EXACT_LIMIT"] = int(os.environ.get("INVOICE_COUNT_EXACT_LIMIT", 100000))  # PostgreSQL row estimate above which COUNT(*) is skipped
+
+# Configure job execution: "thread" runs OCR in the web process, "process" runs the
+# CPU-bound OCR work in a pool of worker processes, and "queue" leaves jobs in the
+# database for worker.py processes to claim
+app.config["OCR_EXECUTION_MODE"] = os.environ.get("OCR_EXECUTION_MODE", "thread")
+app.config["OCR_PROCESS_WORKERS"] = int(os.environ.get("OCR_PROCESS_WORKERS", 0))  # 0 sizes the process pool to the available cores
+app.config["OCR_PROCESS_THREADS"] = int(os.environ.get("OCR_PROCESS_THREADS", 1))  # OpenCV/OpenMP threads per worker process
+app.config["JOB_LEASE_SECONDS"] = int(os.environ.get("JOB_LEASE_SECONDS", 120))  # Lease length before a job is reclaimed
+app.config["JOB_HEARTBEAT_INTERVAL"] = int(os.environ.get("JOB_HEARTBEAT_INTERVAL", 30))  # Seconds between lease renewals
+app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))  # Claims before a job is marked as failed
+app.config["JOB_POLL_INTERVAL"] = float(os.environ.get("JOB_POLL_INTERVAL", 2))  # Idle worker sleep between claims
+app.config["JOB_QUEUE_MAX_PENDING"] = int(os.environ.get("JOB_QUEUE_MAX_PENDING", 0))  # 0 means unbounded
+
+# Configure job status streaming
+app.config["JOB_STATUS_RECHECK_INTERVAL"] = float(os.environ.get("JOB_STATUS_RECHECK_INTERVAL", 5))  # DB recheck for changes made by other processes
+app.config["JOB_STATUS_MAX_WAIT"] = int(os.environ.get("JOB_STATUS_MAX_WAIT", 60))  # Longest long-poll wait in seconds
+app.config["JOB_STATUS_STREAM_TIMEOUT"] = int(os.environ.get("JOB_STATUS_STREAM_TIMEOUT", 300))  # Server-sent event stream lifetime
+app.config["JOB_STATUS_MAX_STREAMS"] = int(os.environ.get("JOB_STATUS_MAX_STREAMS", 24))  # Concurrent event streams per process, 0 for no limit; keep below the gunicorn thread count
+app.config["JOB_STATUS_MAX_JOBS"] = int(os.environ.get("JOB_STATUS_MAX_JOBS", 500))  # Max jobs returned by one multi-job status request
 
 # Initialize database with app
 db.init_app(app)
@@ -49,9 +134,24 @@ with app.app_context():
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(view_bp)
     
+    # Register CLI commands
+    from invoice_import import import_invoices_command
+    app.cli.add_command(import_invoices_command)
+    from invoice_export import export_invoices_command
+    app.cli.add_command(export_invoices_command)
+    
     # Import models and create tables
     import models
+    app.cli.add_command(models.create_indexes_command)
     db.create_all()
+    # create_all() only creates missing tables: bring existing ones up to the models
+    added = models.add_missing_columns(db.engine)
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+    # Building indexes on existing tables can take long and is left to `flask create-indexes`
+    missing = models.missing_indexes(db.engine)
+    if missing:
+        logger.warning(f"Missing indexes: {', '.join(index.name for index in missing)}; run `flask --app main create-indexes`")
     
     # Initialize processors and create mock data
     setup_processors(app)
@@ -0,0 +1,167 @@
+"""
+Golden check and microbenchmark for the Tesseract text extraction (invoice_extractor.py).
+
+    python benchmarks/bench_extraction.py --repeat 2000
+    python benchmarks/bench_extraction.py --update
+    python benchmarks/bench_extraction.py --table-rows 50 500 2000
+
+Each fixture in benchmarks/golden/ holds the OCR output of a sample invoice
+(raw text and word-level data) and the fields extracted from it. The script
+fails if the extractor's output differs from any fixture, then times it.
+--update rewrites the expected fields after an intended extraction change.
+--table-rows also times line item extraction from the word boxes of tables
+with that many rows, made by repeating the item rows of a sample invoice.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_extractor import extract_invoice_data, parse_item_row
+from ocr_engine import text_from_ocr_data
+from table_extractor import extract_line_items
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+def load_fixtures():
+    """Return (path, fixture dict) for every golden file"""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(GOLDEN_DIR, '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            fixtures.append((path, json.load(f)))
+    return fixtures
+
+def write_fixture(path, fixture):
+    """Write a fixture with one line per OCR data column so diffs stay readable"""
+    parts = []
+    for key, value in fixture.items():
+        if key == 'ocr_data':
+            columns = ',\n'.join(f'  {json.dumps(column)}: {json.dumps(values, ensure_ascii=False)}'
+                                  for column, values in value.items())
+            parts.append(f' "ocr_data": {{\n{columns}\n }}')
+        else:
+            parts.append(f' {json.dumps(key)}: ' + json.dumps(value, indent=1, ensure_ascii=False).replace('\n', '\n '))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n' + ',\n'.join(parts) + '\n}\n')
+
+def check(fixtures, update=False):
+    """Compare extraction against the expected fields; return the names that differ"""
+    failures = []
+    for path, fixture in fixtures:
+        extracted = extract_invoice_data(fixture['raw_text'], fixture['ocr_data'])
+        if extracted == fixture['expected']:
+            continue
+        
+        name = os.path.basename(path)
+        if update:
+            fixture['expected'] = extracted
+            write_fixture(path, fixture)
+            print(f"updated {name}")
+            continue
+        
+        failures.append(name)
+        for key in fixture['expected']:
+            if extracted.get(key) != fixture['expected'][key]:
+                print(f"{name}: {key} expected {fixture['expected'][key]!r}, got {extracted.get(key)!r}")
+    return failures
+
+def synthetic_table(ocr_data, rows):
+    """
+    Repeat the item rows of an invoice's table to the given row count
+    Item rows are the Tesseract lines between the header (HSN/SAC) and Subtotal lines;
+    copies are stacked at the table's row pitch and the lines below are moved down
+    """
+    line_keys = list(zip(ocr_data['page_num'], ocr_data['block_num'], ocr_data['par_num'], ocr_data['line_num']))
+    lines = list(dict.fromkeys(key for key, level in zip(line_keys, ocr_data['level']) if level == 5))
+    line_text = {line: ' '.join(text for key, text in zip(line_keys, ocr_data['text']) if key == line) for line in lines}
+    header = next(i for i, line in enumerate(lines) if 'HSN/SAC' in line_text[line])
+    end = next(i for i, line in enumerate(lines) if i > header and 'Subtotal' in line_text[line])
+    item_lines = lines[header + 1:end]
+    tops = {line: min(top for key, top in zip(line_keys, ocr_data['top']) if key == line) for line in item_lines}
+    pitch = (tops[item_lines[-1]] - tops[item_lines[0]]) / max(1, len(item_lines) - 1) or 25
+    
+    synthetic = {key: [] for key in ocr_data}
+    def copy_word(i, top_offset, line_num):
+        for key in ocr_data:
+            value = ocr_data[key][i]
+            if key == 'top':
+                value += top_offset
+            elif key == 'line_num':
+                value = line_num
+            synthetic[key].append(value)
+    
+    words_by_line = {}
+    for i, key in enumerate(line_keys):
+        words_by_line.setdefault(key, []).append(i)
+    shift = int(pitch * (rows - len(item_lines)))
+    for position, line in enumerate(lines):
+        if position <= header:
+            for i in words_by_line[line]:
+                copy_word(i, 0, line[3])
+        elif position == end:
+            for row in range(rows):
+                source = item_lines[row % len(item_lines)]
+                for i in words_by_line[source]:
+                    copy_word(i, int(pitch * row) - (tops[source] - tops[item_lines[0]]), lines[header][3] + 1 + row)
+        if position >= end:
+            for i in words_by_line[line]:
+                copy_word(i, shift, line[3] + rows)
+    return synthetic
+
+def time_table_extraction(fixture, row_counts, repeat):
+    """Time line item extraction from word boxes against parsing the text rows with regex"""
+    for rows in row_counts:
+        ocr_data = synthetic_table(fixture['ocr_data'], rows)
+        text_rows = [line for line in text_from_ocr_data(ocr_data).split('\n') if line[:1].isdigit()]
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            line_items = extract_line_items(ocr_data)
+        table_ms = (time.perf_counter() - start) * 1000 / repeat
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            regex_items = [item for item in map(parse_item_row, text_rows) if item]
+        regex_ms = (time.perf_counter() - start) * 1000 / repeat
+        
+        print(f"{rows} rows: word boxes {table_ms:.2f}ms ({len(line_items)} items), "
+              f"text row regex {regex_ms:.2f}ms ({len(regex_items)} items)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=1000, help='Timed extractions per fixture')
+    parser.add_argument('--update', action='store_true', help='Rewrite expected fields from the current extractor')
+    parser.add_argument('--table-rows', type=int, nargs='*', default=[], help='Also time tables with these row counts')
+    parser.add_argument('--table-fixture', default='invoice_detailed_1.json', help='Fixture whose item rows are repeated')
+    args = parser.parse_args()
+    
+    fixtures = load_fixtures()
+    failures = check(fixtures, update=args.update)
+    if failures:
+        print(f"{len(failures)} of {len(fixtures)} fixtures differ")
+        sys.exit(1)
+    print(f"{len(fixtures)} fixtures match")
+    
+    timings = []
+    lines = 0
+    for _, fixture in fixtures:
+        lines += fixture['raw_text'].count('\n') + 1
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            extract_invoice_data(fixture['raw_text'], fixture['ocr_data'])
+        timings.append((time.perf_counter() - start) * 1e6 / args.repeat)
+    
+    print(f"per invoice: mean {statistics.mean(timings):.1f}us, max {max(timings):.1f}us "
+          f"({statistics.mean(timings) * len(fixtures) / lines:.2f}us per line)")
+    
+    if args.table_rows:
+        fixture = dict(fixtures)[os.path.join(GOLDEN_DIR, args.table_fixture)]
+        time_table_extraction(fixture, args.table_rows, max(1, args.repeat // 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Line item validation of large invoices: the row-by-row checks in
+InvoiceFieldValidator versus the columnar path (line_item_validation.py).
+
+    python benchmarks/bench_line_items.py --lines 500 5000 50000 --repeat 5
+
+Invoices are generated with numeric and string amounts; a share of them get
+malformed lines. Both paths must report the same errors before they are timed.
+HSN/SAC codes are passed in as resolved master data, so an in-memory SQLite
+database is enough to import the app.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app
+from field_validator import InvoiceFieldValidator, ResolvedMasterData
+
+HSN_CODES = [f"{code:04d}" for code in range(1000, 1100)]
+
+def random_line(rng, malformed):
+    """A line item with two-decimal amounts, sometimes as strings, or a malformed one"""
+    quantity = rng.randint(1, 50)
+    rate = round(rng.uniform(1, 5000), 2)
+    amount = round(quantity * rate, 2)
+    tax_percentage = rng.choice([0, 5, 12, 18, 28])
+    item = {
+        'description': f"Item {rng.randint(1, 10**6)}",
+        'hsn_sac': rng.choice(HSN_CODES),
+        'quantity': quantity,
+        'rate': rate,
+        'tax_percentage': tax_percentage,
+        'tax_amount': round(amount * tax_percentage / 100, 2),
+        'amount': str(amount) if rng.random() < 0.3 else amount
+    }
+    if malformed:
+        field = rng.choice(['description', 'quantity', 'rate', 'tax_percentage', 'amount', 'hsn_sac', 'tax_amount'])
+        item[field] = rng.choice([None, '', ' ', 'abc', -1, '-2.5', [1], '9999'])
+        if rng.random() < 0.3:
+            del item[rng.choice(list(item))]
+    return item
+
+def random_invoice(rng, lines, malformed_share):
+    line_items = [random_line(rng, rng.random() < malformed_share) for _ in range(lines)]
+    subtotal = round(sum(float(item['amount']) for item in line_items if isinstance(item.get('amount'), (int, float, str))
+                         and str(item['amount']).replace('.', '', 1).isdigit()), 2)
+    tax = round(sum(item['tax_amount'] for item in line_items if isinstance(item.get('tax_amount'), float)), 2)
+    return {
+        'line_items': line_items,
+        'subtotal': subtotal,
+        'tax_amount': tax if rng.random() < 0.8 else tax + 1,
+        'discount': 0,
+        'total_amount': round(subtotal + tax, 2)
+    }
+
+def check(validate, invoice, master_data):
+    errors = {}
+    validate(invoice, master_data, errors)
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, nargs='+', default=[100, 500, 5000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--check-line-tax', action='store_true')
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    validator = InvoiceFieldValidator()
+    validator.check_line_tax = args.check_line_tax
+    master_data = ResolvedMasterData({}, {code: idx for idx, code in enumerate(HSN_CODES)})
+    
+    # Same errors from both paths, on invoices with and without malformed lines. The row path
+    # raises when a line's tax_amount cannot be summed; the columnar path reports it per line
+    unsummable = 0
+    for trial in range(500):
+        invoice = random_invoice(rng, rng.randint(1, 60), rng.choice([0, 0, 0.02, 0.2]))
+        actual = check(validator._validate_line_items_columnar, invoice, master_data)
+        try:
+            expected = check(validator._validate_line_items, invoice, master_data)
+        except (KeyError, TypeError, ValueError):
+            unsummable += 1
+            continue
+        if actual != expected:
+            print(f"Mismatch in trial {trial}:\n  rows    {expected}\n  columns {actual}")
+            sys.exit(1)
+    print(f"{500 - unsummable} generated invoices give identical errors ({unsummable} the row path cannot total)\n")
+    
+    print(f"{'lines':>8}{'malformed':>11}{'rows ms':>10}{'columns ms':>12}{'speedup':>9}")
+    for lines in args.lines:
+        for malformed_share in (0, 0.01):
+            invoice = random_invoice(rng, lines, malformed_share)
+            timings = {}
+            for name, validate in (('rows', validator._validate_line_items),
+                                   ('columns', validator._validate_line_items_columnar)):
+                samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    check(validate, invoice, master_data)
+                    samples.append((time.perf_counter() - start) * 1000)
+                timings[name] = statistics.median(samples)
+            print(f"{lines:>8}{malformed_share:>11.0%}{timings['rows']:>10.2f}{timings['columns']:>12.2f}"
+                  f"{timings['rows'] / timings['columns']:>8.1f}x")
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
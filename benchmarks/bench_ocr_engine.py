@@ -0,0 +1,109 @@
+"""
+Per-page OCR latency of the legacy two-call pytesseract path versus the
+single-pass OCR engines in ocr_engine.py, on the sample invoices.
+
+    python benchmarks/bench_ocr_engine.py --repeat 5
+
+Engines whose dependencies are missing (tesseract CLI, tesserocr) are skipped.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+
+import pytesseract
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_engine import TESSERACT_CONFIG, PytesseractEngine, TesserocrEngine, tesserocr
+from document_loader import iter_document_pages
+from image_preprocessor import PreprocessingPipeline
+
+def preprocess(image_path):
+    """Same preprocessing as DocumentOCR with the default settings"""
+    page = next(iter_document_pages(image_path, skip_blank=False))
+    return Image.fromarray(PreprocessingPipeline().run(page.image, page.dpi).image)
+
+def legacy_recognize(image):
+    """The original path: two tesseract subprocesses per page"""
+    ocr_data = pytesseract.image_to_data(image, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+    raw_text = pytesseract.image_to_string(image)
+    return raw_text, ocr_data
+
+def legacy_proxy_recognize(tessdata_path):
+    """
+    In-process stand-in for the legacy path when the tesseract CLI is unavailable:
+    load a fresh engine and run two recognition passes per page, like two CLI calls do
+    (excludes the extra process start-up and temp file round trip of the real thing)
+    """
+    def recognize(image):
+        for _ in range(2):
+            TesserocrEngine(tessdata_path=tessdata_path).recognize(image)
+    return recognize
+
+def time_engine(recognize, images, repeat):
+    """Return (first call ms, list of per-page ms for the warm runs)"""
+    start = time.perf_counter()
+    recognize(images[0])
+    first_ms = (time.perf_counter() - start) * 1000
+    
+    timings = []
+    for _ in range(repeat):
+        for image in images:
+            start = time.perf_counter()
+            recognize(image)
+            timings.append((time.perf_counter() - start) * 1000)
+    return first_ms, timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default='attached_assets/invoice_detailed_*.png')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tessdata', default=os.environ.get('TESSDATA_PREFIX'))
+    parser.add_argument('--tesseract-cmd', default=None, help='Path to the tesseract binary for pytesseract')
+    args = parser.parse_args()
+    
+    if args.tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+    
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        sys.exit(f"No images match {args.images}")
+    images = [preprocess(path) for path in paths]
+    print(f"{len(images)} pages, {args.repeat} warm runs each\n")
+    
+    engines = []
+    try:
+        pytesseract.get_tesseract_version()
+        engines.append(('legacy (image_to_data + image_to_string)', legacy_recognize))
+        engines.append(('pytesseract single pass', PytesseractEngine().recognize))
+    except Exception as e:
+        print(f"Skipping pytesseract engines: {e}")
+    if tesserocr is not None:
+        if not engines:
+            engines.append(('legacy proxy (fresh engine, two passes)', legacy_proxy_recognize(args.tessdata)))
+        engines.append(('tesserocr persistent API', TesserocrEngine(tessdata_path=args.tessdata).recognize))
+    else:
+        print("Skipping tesserocr engine: tesserocr is not installed")
+    
+    print(f"{'engine':<45}{'first ms':>10}{'median ms':>12}{'p95 ms':>10}")
+    results = {}
+    for name, recognize in engines:
+        first_ms, timings = time_engine(recognize, images, args.repeat)
+        timings.sort()
+        median = statistics.median(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        results[name] = median
+        print(f"{name:<45}{first_ms:>10.1f}{median:>12.1f}{p95:>10.1f}")
+    
+    baseline_name = next((name for name in results if name.startswith('legacy')), None)
+    if baseline_name:
+        print()
+        for name, median in results.items():
+            print(f"{name:<45}{results[baseline_name] / median:>10.2f}x vs {baseline_name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Drive the shared OpenAI client (openai_client.py) against the local fake server
+to see how the concurrency cap, rate limit buckets and retries behave under load.
+
+    python benchmarks/bench_openai_client.py --requests 40 --threads 16 --server-rpm 30 --client-rpm 30
+    python benchmarks/bench_openai_client.py --client-rpm 0 --error-rate 0.2
+
+Without a client-side RPM limit the server answers bursts with 429s and the
+client backs off; with --client-rpm matching the server quota it should not.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai_client import OpenAIClientPool
+from fake_openai_server import make_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent callers, like OCR job threads')
+    parser.add_argument('--server-rpm', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--client-rpm', type=int, default=30, help='Client request bucket (0 disables)')
+    parser.add_argument('--client-tpm', type=int, default=0, help='Client token bucket (0 disables)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--backoff-base', type=float, default=0.5)
+    args = parser.parse_args()
+    
+    server = make_server(port=0, rpm=args.server_rpm, latency=args.latency, error_rate=args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault('OPENAI_API_KEY', 'fake')
+    
+    client = OpenAIClientPool(SimpleNamespace(config={
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{server.server_address[1]}/v1",
+        'OPENAI_MAX_CONCURRENCY': args.concurrency,
+        'OPENAI_RPM_LIMIT': args.client_rpm,
+        'OPENAI_TPM_LIMIT': args.client_tpm,
+        'OPENAI_MAX_RETRIES': args.max_retries,
+        'OPENAI_BACKOFF_BASE': args.backoff_base,
+        'OPENAI_BACKOFF_MAX': 30.0
+    }))
+    
+    def call(index):
+        start = time.perf_counter()
+        try:
+            client.create_chat_completion(
+                model='gpt-4o',
+                messages=[{'role': 'user', 'content': [{'type': 'text', 'text': f'request {index}'}]}],
+                max_tokens=500
+            )
+            return True, time.perf_counter() - start
+        except Exception as e:
+            print(f"request {index} failed: {e}")
+            return False, time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        outcomes = list(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    
+    latencies = sorted(latency for _, latency in outcomes)
+    succeeded = sum(1 for ok, _ in outcomes if ok)
+    print(f"{succeeded}/{args.requests} succeeded in {elapsed:.1f}s "
+          f"(p50 {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s)")
+    print(f"client: {client.get_stats()}")
+    print(f"server: {server.RequestHandlerClass.state.stats}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
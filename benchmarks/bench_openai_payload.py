@@ -0,0 +1,61 @@
+"""
+Size of the image payload sent to the OpenAI Vision API before and after
+normalization (image_normalizer.py), and the time spent normalizing, on the
+sample invoices or any files given on the command line.
+
+    python benchmarks/bench_openai_payload.py --max-dimension 2048 --format auto
+    python benchmarks/bench_openai_payload.py path/to/scan.tif path/to/invoice.pdf
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageOps
+
+from document_loader import is_paged_document, iter_document_pages
+from image_normalizer import normalize_image
+
+def load_images(file_path, dpi):
+    if is_paged_document(file_path):
+        return [page.image for page in iter_document_pages(file_path, dpi=dpi)]
+    with Image.open(file_path) as image:
+        return [ImageOps.exif_transpose(image)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='Invoice files (defaults to attached_assets/*.png)')
+    parser.add_argument('--max-dimension', type=int, default=2048)
+    parser.add_argument('--format', default='auto')
+    parser.add_argument('--dpi', type=int, default=200, help='Rasterization DPI for PDF pages')
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = args.files or sorted(glob.glob(os.path.join(root, 'attached_assets', '*.png')))
+    
+    total_before = total_after = 0
+    print(f"{'file':<32} {'before KB':>10} {'after KB':>9} {'ratio':>6} {'ms':>7}  output")
+    for file_path in files:
+        before = os.path.getsize(file_path)
+        start = time.perf_counter()
+        outputs = [normalize_image(image, args.max_dimension, args.format) for image in load_images(file_path, args.dpi)]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        after = sum(len(output.data) for output in outputs)
+        
+        total_before += before
+        total_after += after
+        first = outputs[0]
+        description = f"{len(outputs)}x {first.mime_type} {first.width}x{first.height}{' gray' if first.grayscale else ''}"
+        print(f"{os.path.basename(file_path)[:32]:<32} {before / 1024:>10.1f} {after / 1024:>9.1f} "
+              f"{after / before:>6.2f} {elapsed_ms:>7.1f}  {description}")
+    
+    if total_before:
+        # Base64 inflates the request body by 4/3 either way
+        print(f"\ntotal: {total_before / 1024:.1f} KB -> {total_after / 1024:.1f} KB "
+              f"({100 * (1 - total_after / total_before):.1f}% smaller request images)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Peak memory and time of OCR preprocessing: the original four-copy steps versus
+the in-place PreprocessingPipeline (image_preprocessor.py).
+
+    python benchmarks/bench_preprocess.py --repeat 5
+    python benchmarks/bench_preprocess.py --images 'scans/*.tif' --target-dpi 300
+
+Peak memory is the largest amount of NumPy/OpenCV buffer memory allocated while
+a page is preprocessed, measured with tracemalloc, excluding the decoded page.
+Pages at or below the target DPI should come out identical to the original steps.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_loader import iter_document_pages
+from image_preprocessor import PreprocessingPipeline
+
+def legacy_preprocess(image, dpi=None):
+    """The original steps of InvoiceOCRProcessor._preprocess_image, including the RGB to BGR copy"""
+    img = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    kernel = np.ones((1, 1), np.uint8)
+    return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+
+def measure(preprocess, page, repeat):
+    """Return (output array, peak traced bytes, median ms)"""
+    tracemalloc.start()
+    output = preprocess(page.image, page.dpi)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        preprocess(page.image, page.dpi)
+        timings.append((time.perf_counter() - start) * 1000)
+    return output, peak, statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default='attached_assets/invoice_detailed_*.png')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--target-dpi', type=int, default=300)
+    parser.add_argument('--memory-limit-mb', type=int, default=64)
+    args = parser.parse_args()
+    
+    paths = sorted(glob.glob(args.images))
+    if not paths:
+        sys.exit(f"No images match {args.images}")
+    pipeline = PreprocessingPipeline(target_dpi=args.target_dpi, memory_limit_mb=args.memory_limit_mb)
+    print(f"pipeline: {pipeline.describe()}\n")
+    
+    print(f"{'page':<40}{'size':>12}{'legacy MB':>11}{'MB':>7}{'legacy ms':>11}{'ms':>8}  output")
+    for path in paths:
+        for page in iter_document_pages(path, skip_blank=False):
+            legacy, legacy_peak, legacy_ms = measure(legacy_preprocess, page, args.repeat)
+            result, peak, ms = measure(lambda image, dpi: pipeline.run(image, dpi).image, page, args.repeat)
+            if result.shape == legacy.shape:
+                output = 'identical' if np.array_equal(result, legacy) else f"{np.count_nonzero(result != legacy)} pixels differ"
+            else:
+                output = f"downsampled to {result.shape[1]}x{result.shape[0]}"
+            name = f"{os.path.basename(path)}:{page.number}"
+            size = f"{page.image.width}x{page.image.height}"
+            print(f"{name:<40}{size:>12}{legacy_peak / 2**20:>11.1f}{peak / 2**20:>7.1f}{legacy_ms:>11.1f}{ms:>8.1f}  {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-invoice cost of the field rule checks in InvoiceFieldValidator: the original
+loop over validation_rules (re.match with pattern strings, strptime, list scan of
+states) versus the compiled ValidationPlan (validation_plan.py).
+
+    python benchmarks/bench_validation.py --invoices 2000 --repeat 20
+
+The script first checks that both produce the same errors for generated
+invoices with valid, malformed and missing values, then times them.
+Master data lookups and line items are not part of either path.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation_plan import DEFAULT_VALIDATION_RULES, INDIAN_STATES, ValidationPlan
+
+def legacy_check_fields(invoice_data, validation_rules, valid_states):
+    """The original field loop of InvoiceFieldValidator.validate_invoice"""
+    errors = {}
+    for field, rules in validation_rules.items():
+        if field == 'vendor_gstin':
+            value = invoice_data.get('vendor', {}).get('gstin')
+        elif field == 'customer_gstin':
+            value = invoice_data.get('customer', {}).get('gstin')
+        else:
+            value = invoice_data.get(field)
+        
+        if rules.get('required', False) and not value:
+            errors[field] = f"{field.replace('_', ' ').title()} is required"
+            continue
+        if not value and not rules.get('required', False):
+            continue
+        if 'pattern' in rules and value:
+            if not re.match(rules['pattern'], value):
+                errors[field] = rules['error_msg']
+        if 'date_format' in rules and value:
+            try:
+                datetime.strptime(value, rules['date_format'])
+            except ValueError:
+                errors[field] = rules['error_msg']
+        if 'min_value' in rules and value is not None:
+            try:
+                num_value = float(value)
+                if num_value < rules['min_value']:
+                    errors[field] = rules['error_msg']
+            except (ValueError, TypeError):
+                errors[field] = f"{field.replace('_', ' ').title()} must be a number"
+    
+    if invoice_data.get('place_of_supply') and invoice_data['place_of_supply'] not in valid_states:
+        errors['place_of_supply'] = "Place of supply must be a valid Indian state"
+    return errors
+
+def plan_check_fields(invoice_data, plan):
+    """The same checks through the compiled plan, as validate_invoice runs them"""
+    errors = {}
+    plan.check_fields(invoice_data, errors)
+    if invoice_data.get('place_of_supply') and not plan.is_valid_state(invoice_data['place_of_supply']):
+        errors['place_of_supply'] = "Place of supply must be a valid Indian state"
+    return errors
+
+def random_invoice(rng, clean):
+    """An invoice with valid fields, or (when not clean) a mix of valid, malformed and missing ones"""
+    def pick(valid, *invalid):
+        return valid if clean or rng.random() < 0.6 else rng.choice(invalid)
+    
+    return {
+        'invoice_number': pick(f"INV-{rng.randint(10, 99)}-{rng.randint(100, 999)}", None, '', 'INV-1-2', 'inv-25-100'),
+        'invoice_date': pick(f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                             None, '2025-1-5', '2025-02-30', '2025-13-01', '05/01/2025', '2025-01-05 ', '20250105'),
+        'due_date': pick(f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", None, '', '2025-6-7', '2025-06-31'),
+        'po_number': pick(f"PO-{rng.randint(10, 99)}-{rng.randint(100, 999)}", None, 'PO 12', 'PO-25-1000'),
+        'vendor': {'gstin': pick('27AAPCA1234F1Z5', None, '', '27AAPCA1234F1Z', '27aapca1234f1z5')},
+        'customer': {'gstin': pick('29AABCG9999Q1Z2', None, '29AABCG9999Q1X2')},
+        'place_of_supply': pick(rng.choice(INDIAN_STATES), None, '', 'Maharastra', 'delhi'),
+        'subtotal': pick(round(rng.uniform(1, 100000), 2), None, 0, -5, '12.5', 'abc'),
+        'tax_amount': pick(round(rng.uniform(1, 18000), 2), None, 0, '-1', 'n/a'),
+        'total_amount': pick(round(rng.uniform(1, 118000), 2), None, '1,000.00', -0.01)
+    }
+
+def time_per_invoice(check, invoices, repeat):
+    """Median microseconds per invoice over repeat passes"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for invoice in invoices:
+            check(invoice)
+        timings.append((time.perf_counter() - start) * 1e6 / len(invoices))
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invoices', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    plan = ValidationPlan(DEFAULT_VALIDATION_RULES, INDIAN_STATES)
+    
+    mixed = [random_invoice(rng, clean=False) for _ in range(args.invoices)]
+    for invoice in mixed:
+        expected = legacy_check_fields(invoice, DEFAULT_VALIDATION_RULES, INDIAN_STATES)
+        actual = plan_check_fields(invoice, plan)
+        if actual != expected:
+            print(f"Mismatch for {invoice}:\n  legacy {expected}\n  plan   {actual}")
+            sys.exit(1)
+    print(f"{len(mixed)} generated invoices give identical errors")
+    
+    clean = [random_invoice(rng, clean=True) for _ in range(args.invoices)]
+    for name, invoices in (('valid invoices', clean), ('mixed invoices', mixed)):
+        legacy_us = time_per_invoice(lambda invoice: legacy_check_fields(invoice, DEFAULT_VALIDATION_RULES, INDIAN_STATES),
+                                     invoices, args.repeat)
+        plan_us = time_per_invoice(lambda invoice: plan_check_fields(invoice, plan), invoices, args.repeat)
+        print(f"{name}: legacy {legacy_us:.2f}us, plan {plan_us:.2f}us per invoice ({legacy_us / plan_us:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Database performance harness: seeds companies, items, invoices with line items and
+processing jobs, runs the queries the API, views, validator and job queue issue,
+and reports their median timings and query plans without and then with the
+secondary indexes in INDEXES.
+
+    python benchmarks/db_harness.py --invoices 200000 --report db_report.md
+    python benchmarks/db_harness.py --database-url postgresql://localhost/kodo_bench --invoices 1000000
+
+Without --database-url a SQLite file in a temporary directory is used. A database
+given with --database-url must be a scratch database: all of the app's tables are
+dropped and recreated in it.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Indexes the harness measures; they are dropped for the "before" run and recreated for the "after" run
+INDEXES = (
+    'ix_invoice_date_id',
+    'ix_invoice_created_at',
+    'ix_invoice_updated_at_id',
+    'ix_invoice_line_item_invoice_id',
+    'ix_item_hsn_sac',
+    'ix_processing_job_started_at',
+    'ix_processing_job_status_id',
+)
+
+CHUNK_SIZE = 10000
+LOOKUP_SIZE = 500  # Keys per IN (...) lookup, like one validation or import batch
+EPOCH = datetime(2023, 1, 1)
+SPAN_DAYS = 3 * 365
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Scratch database to use; all tables are dropped (default: a temporary SQLite file)')
+    parser.add_argument('--companies', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--invoices', type=int, default=100000)
+    parser.add_argument('--lines', type=int, default=5, help='Line items per invoice')
+    parser.add_argument('--jobs', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', help='Write the Markdown report to this file instead of standard output')
+    return parser.parse_args()
+
+args = parse_args()
+os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'db_harness.db')}"
+
+from sqlalchemy import event, func, insert, select, text
+from app import app
+from models import (db, Company, Item, Invoice, InvoiceLineItem, ProcessingJob,
+                    invoice_detail_options, invoice_list_options)
+from invoice_pagination import encode_cursor, keyset_page, offset_page, NEWEST_FIRST
+from job_queue import JobQueue
+from invoice_export import ExportWatermark, export_query, export_rows
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def gstin(n):
+    return f"{n % 35 + 1:02d}{n:09d}Z5A"
+
+def hsn_sac(n):
+    return f"{10000000 + n:08d}"
+
+def insert_chunked(model, rows):
+    """Insert rows in executemany chunks so large volumes do not build one huge statement"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+    db.session.commit()
+
+def seed(rng):
+    """Seed the configured volume; ids are assigned here so line items can refer to invoices directly"""
+    log(f"Seeding {args.companies} companies, {args.items} items, {args.invoices} invoices "
+        f"with {args.lines} lines each and {args.jobs} jobs")
+    insert_chunked(Company, ({
+        'id': n + 1, 'name': f"Company {n}", 'gstin': gstin(n), 'address': f"{n} Industrial Area",
+        'city': 'Pune', 'state': 'Maharashtra', 'pin_code': '411001', 'country': 'India'
+    } for n in range(args.companies)))
+    insert_chunked(Item, ({
+        'id': n + 1, 'name': f"Item {n}", 'hsn_sac': hsn_sac(n), 'description': f"Item {n} description"
+    } for n in range(args.items)))
+    
+    def invoices():
+        for n in range(args.invoices):
+            created_at = EPOCH + timedelta(seconds=rng.randrange(SPAN_DAYS * 86400))
+            yield {
+                'id': n + 1, 'invoice_number': f"INV-{n:09d}",
+                'invoice_date': (created_at - timedelta(days=rng.randrange(30))).date(),
+                'vendor_id': rng.randrange(args.companies) + 1, 'customer_id': rng.randrange(args.companies) + 1,
+                'subtotal': 100.0 * args.lines, 'tax_amount': 18.0 * args.lines, 'discount': 0.0,
+                'total_amount': 118.0 * args.lines, 'terms': 'Immediate', 'ocr_confidence': 0.0,
+                'processing_status': 'completed', 'created_at': created_at, 'updated_at': created_at
+            }
+    insert_chunked(Invoice, invoices())
+    
+    def line_items():
+        for invoice_id in range(1, args.invoices + 1):
+            for k in range(args.lines):
+                item = rng.randrange(args.items)
+                yield {
+                    'invoice_id': invoice_id, 'item_id': item + 1, 'description': f"Line {k}", 'hsn_sac': hsn_sac(item),
+                    'quantity': 1.0, 'rate': 100.0, 'tax_percentage': 18.0, 'tax_amount': 18.0, 'amount': 100.0
+                }
+    insert_chunked(InvoiceLineItem, line_items())
+    
+    def jobs():
+        now = datetime.utcnow()
+        for n in range(args.jobs):
+            started_at = EPOCH + timedelta(seconds=rng.randrange(SPAN_DAYS * 86400))
+            status = rng.choices(['completed', 'error', 'pending', 'processing'], [94, 4, 1.5, 0.5])[0]
+            yield {
+                'id': n + 1, 'job_id': f"job-{n:09d}", 'file_path': f"uploads/{n:09d}.pdf", 'status': status,
+                'batch_id': f"batch-{n // 50:07d}", 'started_at': started_at,
+                'completed_at': started_at + timedelta(seconds=20) if status in ('completed', 'error') else None,
+                'attempts': 1 if status != 'pending' else 0,
+                'lease_expires_at': now + timedelta(seconds=rng.randrange(-600, 600)) if status == 'processing' else None
+            }
+    insert_chunked(ProcessingJob, jobs())
+
+def build_queries(rng):
+    """(name, callable) for each query, mirroring the code that issues it"""
+    listing = Invoice.query.options(*invoice_list_options())
+    api_listing = Invoice.query.options(*invoice_detail_options())
+    deep_row = int(args.invoices * 0.9)
+    deep_invoice = listing.order_by(*NEWEST_FIRST).offset(deep_row).first()
+    deep_cursor = encode_cursor(deep_invoice, 'next') if deep_invoice else None
+    detail_id = rng.randrange(args.invoices) + 1
+    hsn_codes = [hsn_sac(rng.randrange(args.items)) for _ in range(LOOKUP_SIZE)]
+    gstins = [gstin(rng.randrange(args.companies)) for _ in range(LOOKUP_SIZE)]
+    invoice_numbers = [f"INV-{rng.randrange(args.invoices * 2):09d}" for _ in range(LOOKUP_SIZE)]
+    job_id = f"job-{rng.randrange(args.jobs):09d}"
+    batch_id = f"batch-{rng.randrange(max(args.jobs // 50, 1)):07d}"
+    since = EPOCH + timedelta(days=rng.randrange(SPAN_DAYS - 1))
+    changed_since = ExportWatermark(EPOCH + timedelta(days=SPAN_DAYS - 1), 0)  # About a day of changes
+    queue = JobQueue(app)
+    
+    return [
+        ('/invoices, first page', lambda: keyset_page(listing, 10)),
+        ('/invoices, cursor at 90%', lambda: keyset_page(listing, 10, deep_cursor)),
+        ('/invoices?page=N at 90%', lambda: offset_page(listing, deep_row // 10, 10)),
+        ('/api/invoices, first page', lambda: keyset_page(api_listing, 10)),
+        ('/api/invoices/<id>', lambda: db.session.get(Invoice, detail_id, options=invoice_detail_options())),
+        ('invoice count', lambda: db.session.execute(select(func.count()).select_from(Invoice)).scalar()),
+        ('/dashboard, recent invoices', lambda: listing.order_by(Invoice.created_at.desc()).limit(10).all()),
+        ('/dashboard, recent jobs', lambda: ProcessingJob.query.order_by(ProcessingJob.started_at.desc()).limit(5).all()),
+        ('item by HSN/SAC', lambda: Item.query.filter_by(hsn_sac=hsn_codes[0]).first()),
+        (f'items by HSN/SAC, {LOOKUP_SIZE} codes', lambda: db.session.execute(
+            select(Item.hsn_sac, func.min(Item.id)).where(Item.hsn_sac.in_(hsn_codes)).group_by(Item.hsn_sac)).all()),
+        (f'companies by GSTIN, {LOOKUP_SIZE}', lambda: db.session.execute(
+            select(Company.id, Company.gstin).where(Company.gstin.in_(gstins))).all()),
+        (f'existing invoice numbers, {LOOKUP_SIZE}', lambda: db.session.execute(
+            select(Invoice.invoice_number).where(Invoice.invoice_number.in_(invoice_numbers))).all()),
+        ('job by job_id', lambda: ProcessingJob.query.filter_by(job_id=job_id).first()),
+        ('jobs in a batch', lambda: ProcessingJob.query.filter(ProcessingJob.batch_id == batch_id).all()),
+        ('job statuses in a day', lambda: db.session.query(ProcessingJob.job_id, ProcessingJob.status)
+            .filter(ProcessingJob.started_at >= since, ProcessingJob.started_at < since + timedelta(days=1))
+            .order_by(ProcessingJob.started_at, ProcessingJob.id).limit(500).all()),
+        ('queue claim candidates', lambda: db.session.query(ProcessingJob.id, ProcessingJob.job_id, ProcessingJob.file_path)
+            .filter(queue._claimable(datetime.utcnow())).order_by(ProcessingJob.id).limit(10).all()),
+        ('queue pending count', lambda: ProcessingJob.query.filter_by(status='pending').count()),
+        ('queue stats', queue.get_stats),
+        ('export, one day of changes', lambda: sum(1 for _ in export_rows(export_query(after=changed_since)))),
+    ]
+
+def explain(statements):
+    """Query plan of each captured statement, as text"""
+    connection = db.session.connection()
+    plans = []
+    for statement, parameters in statements:
+        if connection.dialect.name == 'sqlite':
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plans.append('\n'.join(row[-1] for row in rows))
+        else:
+            rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).all()
+            plans.append('\n'.join(row[0] for row in rows))
+    db.session.rollback()
+    return '\n\n'.join(plans)
+
+def measure(queries):
+    """{name: (median ms, plan)} for each query"""
+    captured = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+    
+    results = {}
+    for name, run in queries:
+        db.session.expunge_all()
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            run()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        db.session.rollback()
+        plan = explain(captured)
+        captured.clear()
+        
+        samples = []
+        for _ in range(args.repeat):
+            db.session.expunge_all()  # Fetch rows again rather than reuse loaded objects
+            start = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+        results[name] = (statistics.median(samples), plan)
+        log(f"  {name}: {results[name][0]:.2f} ms")
+    return results
+
+def analyze():
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def report(before, after, seed_seconds):
+    dialect = db.engine.dialect
+    version = '.'.join(str(part) for part in dialect.server_version_info or ())
+    lines = [
+        '# Database harness report', '',
+        f"{dialect.name} {version}: {args.companies:,} companies, {args.items:,} items, {args.invoices:,} invoices "
+        f"with {args.lines} line items each, {args.jobs:,} jobs (seeded in {seed_seconds:.0f} s). "
+        f"Median of {args.repeat} runs.", '',
+        f"Indexes measured: {', '.join(f'`{name}`' for name in INDEXES)}", '',
+        '| Query | Without indexes (ms) | With indexes (ms) | Speedup |',
+        '|---|---:|---:|---:|'
+    ]
+    for name in before:
+        ms_before, ms_after = before[name][0], after[name][0]
+        lines.append(f"| {name} | {ms_before:.2f} | {ms_after:.2f} | {ms_before / ms_after:.1f}x |")
+    lines += ['', '## Query plans']
+    for name in before:
+        lines += ['', f"### {name}", '', 'Without indexes:', '', '```', before[name][1], '```', '',
+                  'With indexes:', '', '```', after[name][1], '```']
+    return '\n'.join(lines) + '\n'
+
+def main():
+    rng = random.Random(args.seed)
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    
+    db.drop_all()
+    db.create_all()
+    for name in INDEXES:
+        indexes[name].drop(db.engine)
+    
+    started = time.perf_counter()
+    seed(rng)
+    seed_seconds = time.perf_counter() - started
+    analyze()
+    
+    queries = build_queries(rng)
+    log('Without indexes')
+    before = measure(queries)
+    
+    for name in INDEXES:
+        indexes[name].create(db.engine)
+    analyze()
+    log('With indexes')
+    after = measure(queries)
+    
+    output = report(before, after, seed_seconds)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output)
+        log(f"Report written to {args.report}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    with app.app_context():
+        main()
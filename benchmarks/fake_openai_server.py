@@ -0,0 +1,160 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for exercising the
+client's concurrency cap, rate limiting and retries without network access.
+
+    python benchmarks/fake_openai_server.py --port 8089 --rpm 60 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake python main.py
+
+Requests beyond --rpm in a sliding minute get 429 with retry-after headers, a
+fraction of requests fail with 500/503, and every response takes --latency seconds.
+The reply is a fixed invoice extraction in the format the system prompt asks for.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_INVOICE = {
+    "vendor": {"name": "Apex Nova Pvt Ltd", "gstin": "27AAPCA1234F1Z2", "address": "Plot 10, Tech Park, Mumbai"},
+    "customer": {"name": "Galaxy Supplies", "gstin": "27AABCG9999Q1Z5", "address": "Pune, MH"},
+    "invoice_number": "INV-25-100",
+    "invoice_date": "2025-05-07",
+    "due_date": "2025-05-22",
+    "po_number": "PO-25-200",
+    "place_of_supply": "Karnataka",
+    "line_items": [
+        {"description": "PVC Pipes (20mm)", "hsn_sac": "3917", "quantity": 34, "rate": 150.0,
+         "tax_percentage": 18, "tax_amount": 918.0, "amount": 5100.0}
+    ],
+    "subtotal": 5100.0,
+    "tax_amount": 918.0,
+    "discount": 0.0,
+    "total_amount": 6018.0,
+    "terms": "Immediate"
+}
+
+class FakeOpenAIState:
+    """Shared counters and the sliding window used to emulate a requests-per-minute quota"""
+    def __init__(self, rpm, latency, error_rate):
+        self.rpm = rpm
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'errors': 0, 'max_in_flight': 0}
+    
+    def admit(self):
+        """Return None if the request is within quota, else the seconds until a slot frees up"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats['requests'] += 1
+            while self.window and now - self.window[0] >= 60:
+                self.window.popleft()
+            if self.rpm and len(self.window) >= self.rpm:
+                self.stats['rate_limited'] += 1
+                return 60 - (now - self.window[0])
+            self.window.append(now)
+            return None
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    state = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+            return
+        self._send_json(404, {'error': {'message': 'Not found'}})
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request_body = json.loads(self.rfile.read(length) or b'{}')
+        
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+        
+        state = self.state
+        wait = state.admit()
+        if wait is not None:
+            self._send_json(429, {'error': {'message': 'Rate limit reached for requests', 'type': 'requests',
+                                            'code': 'rate_limit_exceeded'}},
+                            headers={'retry-after': str(max(1, int(wait + 0.999))),
+                                     'retry-after-ms': str(int(wait * 1000))})
+            return
+        
+        with state.lock:
+            state.in_flight += 1
+            state.stats['max_in_flight'] = max(state.stats['max_in_flight'], state.in_flight)
+        try:
+            time.sleep(state.latency)
+            if random.random() < state.error_rate:
+                with state.lock:
+                    state.stats['errors'] += 1
+                self._send_json(random.choice([500, 503]), {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+                return
+            
+            images = sum(1 for message in request_body.get('messages', [])
+                         if isinstance(message.get('content'), list)
+                         for part in message['content'] if part.get('type') == 'image_url')
+            prompt_tokens = 400 + 1105 * images
+            completion_tokens = 350
+            with state.lock:
+                state.stats['ok'] += 1
+            self._send_json(200, {
+                'id': f"chatcmpl-fake-{random.getrandbits(32):08x}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request_body.get('model', 'gpt-4o'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': json.dumps(SAMPLE_INVOICE)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}
+            })
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+def make_server(host='127.0.0.1', port=8089, rpm=60, latency=0.5, error_rate=0.0):
+    """Create (but do not start) a fake server; port 0 picks a free port"""
+    handler = type('Handler', (FakeOpenAIHandler,), {'state': FakeOpenAIState(rpm, latency, error_rate)})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--rpm', type=int, default=60, help='Requests per minute before answering 429 (0 = unlimited)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds each successful request takes')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500/503')
+    args = parser.parse_args()
+    
+    server = make_server(args.host, args.port, args.rpm, args.latency, args.error_rate)
+    print(f"Fake OpenAI API on http://{args.host}:{server.server_address[1]}/v1 (stats at /v1/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+SQL statements issued by the invoice pages and API endpoints, checked against a
+fixed budget so lazy loading (one query per invoice, line item or item) cannot
+creep back in.
+
+    python benchmarks/query_counts.py --invoices 100 --lines 20
+
+Seeds an in-memory SQLite database, requests each endpoint once to warm up and
+once with a statement counter attached, and exits with status 1 if any endpoint
+needs more statements than its budget. The budgets do not depend on how many
+invoices or line items are on the page.
+"""
+import os
+import sys
+import argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from sqlalchemy import event, insert
+from app import app
+from models import db, Company, Item, Invoice, InvoiceLineItem
+
+# Endpoint -> most statements it may issue
+BUDGETS = {
+    '/api/invoices?per_page={per_page}': 2,  # invoices with parties, line items with items; the total is cached
+    '/api/invoices/{invoice_id}': 2,
+    '/invoices?per_page={per_page}': 1,
+    '/invoices/{invoice_id}': 2,
+    '/dashboard': 2,  # recent invoices with parties, recent jobs
+}
+
+def seed(invoices, lines):
+    """Insert invoices with line items spread over the mock companies and items"""
+    companies = [company.id for company in Company.query.all()]
+    items = [(item.id, item.hsn_sac) for item in Item.query.all()]
+    invoice_ids = db.session.execute(insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), [{
+        'invoice_number': f"INV-QC-{n:05d}",
+        'invoice_date': date(2025, 1, 1) + timedelta(days=n % 365),
+        'vendor_id': companies[n % len(companies)],
+        'customer_id': companies[(n + 1) % len(companies)],
+        'subtotal': 100.0 * lines,
+        'tax_amount': 18.0 * lines,
+        'total_amount': 118.0 * lines,
+        'processing_status': 'completed'
+    } for n in range(invoices)]).scalars().all()
+    db.session.execute(insert(InvoiceLineItem), [{
+        'invoice_id': invoice_id,
+        'item_id': items[(invoice_id + k) % len(items)][0],
+        'description': f"Line {k}",
+        'hsn_sac': items[(invoice_id + k) % len(items)][1],
+        'quantity': 1.0,
+        'rate': 100.0,
+        'tax_percentage': 18.0,
+        'tax_amount': 18.0,
+        'amount': 100.0
+    } for invoice_id in invoice_ids for k in range(lines)])
+    db.session.commit()
+    return invoice_ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invoices', type=int, default=100)
+    parser.add_argument('--lines', type=int, default=20)
+    args = parser.parse_args()
+    
+    with app.app_context():
+        invoice_ids = seed(args.invoices, args.lines)
+        engine = db.engine
+    
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *rest: statements.append(statement))
+    
+    client = app.test_client()
+    over_budget = []
+    print(f"{args.invoices} invoices with {args.lines} line items each\n")
+    print(f"{'endpoint':<40}{'statements':>12}{'budget':>8}")
+    for template, budget in BUDGETS.items():
+        url = template.format(per_page=args.invoices, invoice_id=invoice_ids[-1])
+        client.get(url)
+        statements.clear()
+        response = client.get(url)
+        count = len(statements)
+        print(f"{url:<40}{count:>12}{budget:>8}{'' if count <= budget else '  OVER BUDGET'}")
+        if response.status_code != 200 or count > budget:
+            over_budget.append((url, response.status_code, list(statements)))
+    
+    for url, status, issued in over_budget:
+        print(f"\n{url} returned {status} after {len(issued)} statements:")
+        for statement in issued[:10]:
+            print(f"  {' '.join(statement.split())[:150]}")
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
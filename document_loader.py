@@ -0,0 +1,95 @@
+import os
+import logging
+from collections import namedtuple
+from threading import Lock
+import numpy as np
+from PIL import Image, ImageOps, ImageSequence
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Optional, only needed for PDF uploads
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# Formats that may hold more than one page and are rasterized page by page
+PAGED_EXTENSIONS = {'.pdf', '.tif', '.tiff'}
+
+# PDFium is not thread-safe, so rendering is serialized across OCR threads
+_pdfium_lock = Lock()
+
+# dpi is the rasterization resolution for PDFs and the file's metadata for images, None when unknown
+DocumentPage = namedtuple('DocumentPage', ['number', 'image', 'dpi'])
+
+def is_paged_document(file_path):
+    """Check whether a file is a PDF or TIFF that may contain several pages"""
+    return os.path.splitext(file_path)[1].lower() in PAGED_EXTENSIONS
+
+def is_blank_page(image, ink_ratio=0.001):
+    """
+    Check whether a page has (almost) no dark pixels
+    Scanner speckle below ink_ratio of the page area is ignored
+    """
+    gray = np.asarray(image.convert('L'))
+    return np.count_nonzero(gray < 128) < gray.size * ink_ratio
+
+def image_dpi(image):
+    """Horizontal resolution from an image's metadata, or None when it has none"""
+    dpi = image.info.get('dpi')
+    try:
+        return float(dpi[0]) if dpi else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def iter_document_pages(file_path, dpi=200, skip_blank=True):
+    """
+    Lazily yield the pages of an image, multi-page TIFF or PDF as RGB PIL images
+    PDF pages are rasterized at the given DPI only when they are requested
+    """
+    if os.path.splitext(file_path)[1].lower() == '.pdf':
+        pages = ((image, dpi) for image in _iter_pdf_pages(file_path, dpi))
+    else:
+        pages = _iter_image_pages(file_path)
+    
+    for number, (image, page_dpi) in enumerate(pages, start=1):
+        if skip_blank and is_blank_page(image):
+            logger.info(f"Skipping blank page {number} of {file_path}")
+            continue
+        yield DocumentPage(number, image, page_dpi)
+
+def _iter_image_pages(file_path):
+    """Yield (image, dpi) for every frame of an image file; single-page formats yield one frame"""
+    try:
+        img = Image.open(file_path)
+    except OSError as e:
+        raise ValueError(f"Failed to load image from {file_path}: {str(e)}")
+    
+    with img:
+        for frame in ImageSequence.Iterator(img):
+            # Honour EXIF orientation like cv2.imread does
+            yield ImageOps.exif_transpose(frame).convert('RGB'), image_dpi(frame)
+
+def _iter_pdf_pages(file_path, dpi):
+    """Rasterize PDF pages one at a time"""
+    if pdfium is None:
+        raise RuntimeError("PDF support requires the pypdfium2 package")
+    
+    with _pdfium_lock:
+        try:
+            pdf = pdfium.PdfDocument(file_path)
+        except pdfium.PdfiumError as e:
+            raise ValueError(f"Failed to load PDF from {file_path}: {str(e)}")
+        page_count = len(pdf)
+    
+    try:
+        for index in range(page_count):
+            with _pdfium_lock:
+                page = pdf[index]
+                try:
+                    image = page.render(scale=dpi / 72).to_pil().convert('RGB')
+                finally:
+                    page.close()
+            yield image
+    finally:
+        with _pdfium_lock:
+            pdf.close()
@@ -0,0 +1,158 @@
+import logging
+from threading import Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is then not recorded
+    resource = None
+import pytesseract
+from PIL import Image
+from ocr_engine import TESSERACT_CONFIG, create_ocr_engine, merge_page_ocr
+from invoice_extractor import extract_invoice_data
+from document_loader import iter_document_pages
+from image_preprocessor import PreprocessingPipeline, preprocess_settings
+from job_metrics import record_metric, add_metric
+
+logger = logging.getLogger(__name__)
+
+# Set the path to the Tesseract executable
+pytesseract.pytesseract.tesseract_cmd = '/nix/store/44vcjbcy1p2yhc974bcw250k2r5x5cpa-tesseract-5.3.4/bin/tesseract'
+
+def document_ocr_settings(config):
+    """Read DocumentOCR's keyword arguments from a Flask config"""
+    return {
+        'engine': config.get('OCR_ENGINE', 'auto'),
+        'tessdata_path': config.get('OCR_TESSDATA_PATH'),
+        'document_dpi': config.get('DOCUMENT_DPI', 200),
+        'skip_blank_pages': config.get('DOCUMENT_SKIP_BLANK_PAGES', True),
+        'page_workers': max(1, config.get('OCR_PAGE_WORKERS', 2)),
+        'preprocess': preprocess_settings(config)
+    }
+
+class DocumentOCR:
+    """
+    Standard OCR of a document: pages are streamed, preprocessed and recognized,
+    then extracted as one invoice. Needs no Flask app or database, so OCR worker
+    processes can build one from plain settings.
+    """
+    def __init__(self, engine='auto', tessdata_path=None, document_dpi=200, skip_blank_pages=True,
+                 page_workers=2, preprocess=None):
+        self.engine_name = engine
+        self.tessdata_path = tessdata_path
+        self.document_dpi = document_dpi
+        self.skip_blank_pages = skip_blank_pages
+        self.page_workers = page_workers
+        self.preprocessor = PreprocessingPipeline(**(preprocess or {}))
+        
+        self.ocr_engine = None
+        self._ocr_engine_id = None
+        self._page_executor = None
+        self._lock = Lock()
+    
+    def _get_page_executor(self):
+        """Create the page OCR pool on first use, shared by all jobs in the process"""
+        with self._lock:
+            if self._page_executor is None:
+                self._page_executor = ThreadPoolExecutor(
+                    max_workers=self.page_workers,
+                    thread_name_prefix='ocr-page'
+                )
+            return self._page_executor
+    
+    def get_ocr_engine(self):
+        """Get the configured OCR engine, creating it on first use"""
+        if self.ocr_engine is None:
+            self.ocr_engine = create_ocr_engine(self.engine_name, self.tessdata_path)
+        return self.ocr_engine
+    
+    def get_ocr_engine_id(self):
+        """Identify the OCR engine, version and config for cache keys, looked up once"""
+        if self._ocr_engine_id is None:
+            engine = self.get_ocr_engine()
+            try:
+                version = engine.version()
+            except Exception as e:
+                logger.warning(f"Could not determine {engine.name} version: {str(e)}")
+                version = "unknown"
+            self._ocr_engine_id = f"{engine.name} {version} {TESSERACT_CONFIG}"
+        return self._ocr_engine_id
+    
+    def warm_up(self):
+        """Load the language model now instead of on the first document"""
+        self.get_ocr_engine().recognize(Image.new('L', (64, 32), 255))
+    
+    def ocr_document(self, image_path):
+        """
+        Run standard OCR and extraction on every page of a document
+        Returns (extracted_data, page_count)
+        """
+        # Stream the pages of the document (a single image, TIFF or PDF) and OCR them concurrently
+        pages = iter_document_pages(image_path, dpi=self.document_dpi, skip_blank=self.skip_blank_pages)
+        page_results = self._recognize_pages(pages)
+        if not page_results:
+            raise ValueError(f"No non-blank pages found in {image_path}")
+        
+        # Join the pages so line-item tables continue across page breaks
+        raw_text, ocr_data = merge_page_ocr([result[:3] for result in page_results])
+        
+        record_metric('ocr_pages', len(page_results))
+        self._record_preprocess_metrics([result[3] for result in page_results])
+        
+        # Process the OCR data to extract structured information
+        return extract_invoice_data(raw_text, ocr_data), len(page_results)
+    
+    def _recognize_pages(self, pages):
+        """
+        OCR document pages on the page pool and return (page_number, raw_text, ocr_data, preprocess_stats)
+        in page order. Pages are consumed lazily, so only a few rasterized pages are held in memory at a time
+        """
+        if self.page_workers == 1:
+            return [(page.number, *self._recognize_page(page)) for page in pages]
+        
+        executor = self._get_page_executor()
+        max_pending = self.page_workers * 2
+        pending = deque()
+        page_results = []
+        
+        try:
+            for page in pages:
+                pending.append((page.number, executor.submit(self._recognize_page, page)))
+                if len(pending) >= max_pending:
+                    page_number, future = pending.popleft()
+                    page_results.append((page_number, *future.result()))
+            
+            while pending:
+                page_number, future = pending.popleft()
+                page_results.append((page_number, *future.result()))
+        except Exception:
+            for _, future in pending:
+                future.cancel()
+            raise
+        
+        return page_results
+    
+    def _recognize_page(self, page):
+        """
+        Preprocess a single page and extract word-level data and raw text with one Tesseract pass
+        Returns (raw_text, ocr_data, preprocess_stats); runs on page threads, so metrics are returned, not recorded
+        """
+        preprocessed = self.preprocessor.run(page.image, page.dpi)
+        
+        # Convert back to PIL Image for Tesseract
+        raw_text, ocr_data = self.get_ocr_engine().recognize(Image.fromarray(preprocessed.image))
+        return raw_text, ocr_data, preprocessed.stats
+    
+    def _record_preprocess_metrics(self, page_stats):
+        """Record per-stage preprocessing time and peak page memory on the current job"""
+        for stats in page_stats:
+            for stage, ms in stats['stage_ms'].items():
+                add_metric(f'preprocess_{stage}_ms', round(ms, 1))
+        
+        # Pages run concurrently, so up to page_workers page buffers are alive at once
+        peak_bytes = sorted((stats['peak_bytes'] for stats in page_stats), reverse=True)[:self.page_workers]
+        record_metric('preprocess_peak_mb', round(sum(peak_bytes) / (1024 * 1024), 1))
+        record_metric('preprocess_min_scale', round(min(stats['scale'] for stats in page_stats), 3))
+        if resource is not None:
+            # High-water mark of the whole process (ru_maxrss is in KiB on Linux)
+            record_metric('ocr_peak_rss_mb', round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1))
@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(file_path):
+    """Compute the SHA-256 hex digest of a file without loading it into memory"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class ExtractionCache:
+    """
+    Two-tier cache for extraction results.
+    An in-memory LRU bounded by total size sits in front of an on-disk store
+    shared by every process on the node. Keys combine the document hash with the
+    engine, model and prompt/extractor version, so changing any of them misses.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = True
+        self.max_memory_bytes = 64 * 1024 * 1024
+        self.cache_dir = None
+        
+        self._entries = OrderedDict()  # key -> serialized result
+        self._memory_bytes = 0
+        self._lock = Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.enabled = app.config.get('EXTRACTION_CACHE_ENABLED', True)
+        self.max_memory_bytes = app.config.get('EXTRACTION_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        self.cache_dir = app.config.get('EXTRACTION_CACHE_DIR')
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def make_key(self, content_hash, engine, model, version):
+        """Build a cache key for a document processed by a specific engine configuration"""
+        raw_key = '|'.join([content_hash, engine, str(model), str(version)])
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def get(self, key):
+        """Get a cached result, or None on a miss"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return json.loads(payload)
+        
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    payload = f.read()
+                result = json.loads(payload)
+            except FileNotFoundError:
+                result = None
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable cache entry {key}: {str(e)}")
+                result = None
+            
+            if result is not None:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                    self._remember(key, payload)
+                return result
+        
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+    
+    def set(self, key, result):
+        """Store a result in memory and on disk"""
+        if not self.enabled:
+            return
+        
+        payload = json.dumps(result)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(key, payload)
+        
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file first so readers never see partial entries
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Failed to write cache entry {key}: {str(e)}")
+    
+    def _remember(self, key, payload):
+        """Add an entry to the memory tier and evict least recently used entries over the size limit"""
+        size = len(payload)
+        if size > self.max_memory_bytes:
+            return
+        
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        
+        self._entries[key] = payload
+        self._memory_bytes += size
+        
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['evictions'] += 1
+    
+    def get_stats(self):
+        """Get hit/miss counters and memory tier usage"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+            stats['memory_bytes'] = self._memory_bytes
+        
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else None
+        stats['max_memory_bytes'] = self.max_memory_bytes
+        stats['enabled'] = self.enabled
+        return stats
+
+# Shared by every processor instance in the process
+extraction_cache = ExtractionCache()
@@ -1,11 +1,23 @@
-import re
 import logging
 import json
-from datetime import datetime
-from models import Company, Item
+from collections import namedtuple
+from sqlalchemy import func, select
+from models import Item, db
+from master_data import company_index
+from validation_plan import DEFAULT_VALIDATION_RULES, INDIAN_STATES, ValidationPlan, load_rules_file
+from line_item_validation import (
+    LINE_ITEM_NUMERIC_FIELDS, LINE_ITEM_REQUIRED_FIELDS, TOLERANCE_PAISE, LineItemColumns,
+    line_item_totals, line_tax_error, reconcile_totals, validate_line_items_columnar
+)
 
 logger = logging.getLogger(__name__)
 
+# Master data referenced by a set of invoices: gstin -> CompanyRecord and hsn_sac -> Item id
+ResolvedMasterData = namedtuple('ResolvedMasterData', ['companies', 'items'])
+
+# Codes per IN query, well below the bound parameter limits of SQLite and PostgreSQL
+LOOKUP_CHUNK_SIZE = 500
+
 class InvoiceFieldValidator:
     """
     Class for validating extracted invoice fields against business rules and master data
@@ -13,69 +25,16 @@ class InvoiceFieldValidator:
     def __init__(self, app=None):
         self.app = app
         
-        # Define field validation rules
-        self.validation_rules = {
-            'invoice_number': {
-                'required': True,
-                'pattern': r'^INV-\d{2}-\d{3}$',
-                'error_msg': 'Invoice number must be in format INV-XX-XXX'
-            },
-            'invoice_date': {
-                'required': True,
-                'date_format': '%Y-%m-%d',
-                'error_msg': 'Invoice date must be in format YYYY-MM-DD'
-            },
-            'due_date': {
-                'required': False,
-                'date_format': '%Y-%m-%d',
-                'error_msg': 'Due date must be in format YYYY-MM-DD'
-            },
-            'po_number': {
-                'required': False,
-                'pattern': r'^PO-\d{2}-\d{3}$',
-                'error_msg': 'PO number must be in format PO-XX-XXX'
-            },
-            'vendor_gstin': {
-                'required': True,
-                'pattern': r'^\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}$',
-                'error_msg': 'GSTIN must be a valid 15-character code'
-            },
-            'customer_gstin': {
-                'required': True,
-                'pattern': r'^\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}$',
-                'error_msg': 'GSTIN must be a valid 15-character code'
-            },
-            'place_of_supply': {
-                'required': False,
-                'error_msg': 'Place of supply must be a valid state name'
-            },
-            'subtotal': {
-                'required': True,
-                'min_value': 0,
-                'error_msg': 'Subtotal must be a positive number'
-            },
-            'tax_amount': {
-                'required': True,
-                'min_value': 0,
-                'error_msg': 'Tax amount must be a positive number'
-            },
-            'total_amount': {
-                'required': True,
-                'min_value': 0,
-                'error_msg': 'Total amount must be a positive number'
-            }
-        }
-        
-        # Valid Indian states for place of supply
-        self.valid_states = [
-            'Andhra Pradesh', 'Arunachal Pradesh', 'Assam', 'Bihar', 'Chhattisgarh',
-            'Goa', 'Gujarat', 'Haryana', 'Himachal Pradesh', 'Jharkhand', 'Karnataka',
-            'Kerala', 'Madhya Pradesh', 'Maharashtra', 'Manipur', 'Meghalaya', 'Mizoram',
-            'Nagaland', 'Odisha', 'Punjab', 'Rajasthan', 'Sikkim', 'Tamil Nadu',
-            'Telangana', 'Tripura', 'Uttar Pradesh', 'Uttarakhand', 'West Bengal',
-            'Andaman and Nicobar Islands', 'Chandigarh', 'Dadra and Nagar Haveli',
-            'Daman and Diu', 'Delhi', 'Jammu and Kashmir', 'Ladakh', 'Lakshadweep', 'Puducherry'
-        ]
+        # Field validation rules and valid states for place of supply; see validation_plan.py
+        self.validation_rules = {name: dict(rule) for name, rule in DEFAULT_VALIDATION_RULES.items()}
+        self.valid_states = list(INDIAN_STATES)
+        
+        # Invoices with at least this many line items are validated column by column
+        self.columnar_min_lines = 500
+        # Whether each line's tax_amount must match amount * tax_percentage / 100
+        self.check_line_tax = False
+        
+        self.compile_rules()
         
         if app:
             self.init_app(app)
@@ -83,155 +42,190 @@ class InvoiceFieldValidator:
     def init_app(self, app):
         """Initialize with Flask app"""
         self.app = app
+        self.columnar_min_lines = app.config.get('VALIDATION_COLUMNAR_MIN_LINES', 500)
+        self.check_line_tax = app.config.get('VALIDATION_CHECK_LINE_TAX', False)
+        
+        # Optional JSON file overriding field rules and valid states
+        rules_file = app.config.get('VALIDATION_RULES_FILE')
+        if rules_file:
+            self.validation_rules, self.valid_states = load_rules_file(rules_file, self.validation_rules, self.valid_states)
+            self.compile_rules()
+    
+    def compile_rules(self):
+        """Compile validation_rules and valid_states into the plan validate_invoice runs; call after changing them"""
+        self.plan = ValidationPlan(self.validation_rules, self.valid_states)
+    
+    def resolve_master_data(self, invoices):
+        """
+        Look up every GSTIN and HSN/SAC code referenced by the invoices at once
+        Companies come from the in-memory GSTIN index and items from a few IN queries;
+        returns ResolvedMasterData for validate_invoice
+        """
+        gstins = set()
+        hsn_codes = set()
+        for invoice_data in invoices:
+            for party in ('vendor', 'customer'):
+                gstin = (invoice_data.get(party) or {}).get('gstin')
+                if isinstance(gstin, str) and gstin:
+                    gstins.add(gstin)
+            for item in invoice_data.get('line_items') or []:
+                if isinstance(item, dict) and isinstance(item.get('hsn_sac'), str) and item['hsn_sac']:
+                    hsn_codes.add(item['hsn_sac'])
+        
+        companies = company_index.get_many(gstins) if gstins else {}
+        return ResolvedMasterData(companies, self.lookup_items(hsn_codes))
+    
+    def lookup_items(self, hsn_codes):
+        """Map HSN/SAC codes to the id of the first matching item, querying in chunks"""
+        hsn_codes = list(hsn_codes)
+        items = {}
+        for start in range(0, len(hsn_codes), LOOKUP_CHUNK_SIZE):
+            chunk = hsn_codes[start:start + LOOKUP_CHUNK_SIZE]
+            rows = db.session.execute(
+                select(Item.hsn_sac, func.min(Item.id)).where(Item.hsn_sac.in_(chunk)).group_by(Item.hsn_sac)
+            )
+            items.update(rows.all())
+        return items
+    
+    def validate_invoices(self, invoices):
+        """
+        Validate many invoices against master data resolved once for all of them
+        Returns a list of (is_valid, errors_dict) in input order
+        """
+        master_data = self.resolve_master_data(invoices)
+        return [self.validate_invoice(invoice_data, master_data) for invoice_data in invoices]
     
-    def validate_invoice(self, invoice_data):
+    def validate_invoice(self, invoice_data, master_data=None):
         """
         Validate all invoice fields against business rules and master data
+        master_data is a ResolvedMasterData covering this invoice, resolved here when omitted
         Returns a tuple (is_valid, errors_dict)
         """
         errors = {}
         
-        # Validate basic fields
-        for field, rules in self.validation_rules.items():
-            if field == 'vendor_gstin':
-                value = invoice_data.get('vendor', {}).get('gstin')
-            elif field == 'customer_gstin':
-                value = invoice_data.get('customer', {}).get('gstin')
-            else:
-                value = invoice_data.get(field)
-                
-            # Check required fields
-            if rules.get('required', False) and not value:
-                errors[field] = f"{field.replace('_', ' ').title()} is required"
-                continue
-                
-            # Skip validation if field is empty and not required
-            if not value and not rules.get('required', False):
-                continue
-                
-            # Validate patterns
-            if 'pattern' in rules and value:
-                if not re.match(rules['pattern'], value):
-                    errors[field] = rules['error_msg']
-                    
-            # Validate date formats
-            if 'date_format' in rules and value:
-                try:
-                    datetime.strptime(value, rules['date_format'])
-                except ValueError:
-                    errors[field] = rules['error_msg']
-                    
-            # Validate numeric minimum values
-            if 'min_value' in rules and value is not None:
-                try:
-                    num_value = float(value)
-                    if num_value < rules['min_value']:
-                        errors[field] = rules['error_msg']
-                except (ValueError, TypeError):
-                    errors[field] = f"{field.replace('_', ' ').title()} must be a number"
+        if master_data is None:
+            try:
+                master_data = self.resolve_master_data([invoice_data])
+            except Exception as e:
+                logger.error(f"Error resolving master data: {str(e)}")
+                master_data = ResolvedMasterData({}, {})
+        
+        # Validate basic fields with the compiled rules
+        self.plan.check_fields(invoice_data, errors)
         
         # Validate place of supply
-        if invoice_data.get('place_of_supply') and invoice_data['place_of_supply'] not in self.valid_states:
+        if invoice_data.get('place_of_supply') and not self.plan.is_valid_state(invoice_data['place_of_supply']):
             errors['place_of_supply'] = f"Place of supply must be a valid Indian state"
         
         # Validate company data against database
         if invoice_data.get('vendor', {}).get('gstin'):
-            company = self.validate_company(invoice_data['vendor']['gstin'])
+            company = master_data.companies.get(invoice_data['vendor']['gstin'])
             if not company:
                 errors['vendor'] = f"Vendor with GSTIN {invoice_data['vendor']['gstin']} not found in master data"
         
         if invoice_data.get('customer', {}).get('gstin'):
-            company = self.validate_company(invoice_data['customer']['gstin'])
+            company = master_data.companies.get(invoice_data['customer']['gstin'])
             if not company:
                 errors['customer'] = f"Customer with GSTIN {invoice_data['customer']['gstin']} not found in master data"
         
         # Validate line items
-        if not invoice_data.get('line_items'):
+        line_items = invoice_data.get('line_items')
+        if not line_items:
             errors['line_items'] = "At least one line item is required"
+        elif len(line_items) >= self.columnar_min_lines:
+            self._validate_line_items_columnar(invoice_data, master_data, errors)
         else:
-            line_item_errors = []
-            for idx, item in enumerate(invoice_data['line_items']):
-                item_errors = {}
-                
-                # Required fields
-                for field in ['description', 'quantity', 'rate', 'tax_percentage', 'amount']:
-                    if field not in item or item[field] is None or (isinstance(item[field], str) and not item[field].strip()):
-                        item_errors[field] = f"{field.replace('_', ' ').title()} is required"
-                
-                # Validate HSN/SAC code exists in master data
-                if 'hsn_sac' in item and item['hsn_sac']:
-                    hsn_valid = self.validate_hsn_sac(item['hsn_sac'])
-                    if not hsn_valid:
-                        item_errors['hsn_sac'] = f"HSN/SAC code {item['hsn_sac']} not found in master data"
-                
-                # Check numeric fields
-                for field in ['quantity', 'rate', 'tax_percentage', 'amount']:
-                    if field in item and not item_errors.get(field):
-                        try:
-                            value = float(item[field]) if isinstance(item[field], str) else item[field]
-                            if value < 0:
-                                item_errors[field] = f"{field.replace('_', ' ').title()} must be a positive number"
-                        except (ValueError, TypeError):
-                            item_errors[field] = f"{field.replace('_', ' ').title()} must be a number"
-                
-                if item_errors:
-                    line_item_errors.append({
-                        'index': idx,
-                        'errors': item_errors
-                    })
+            self._validate_line_items(invoice_data, master_data, errors)
+        
+        return (len(errors) == 0, errors)
+    
+    def _validate_line_items(self, invoice_data, master_data, errors):
+        """Validate line items one at a time; totals are summed in whole paise like the columnar path"""
+        required_fields = LINE_ITEM_REQUIRED_FIELDS + (('tax_amount',) if self.check_line_tax else ())
+        numeric_fields = LINE_ITEM_NUMERIC_FIELDS + (('tax_amount',) if self.check_line_tax else ())
+        
+        line_item_errors = []
+        for idx, item in enumerate(invoice_data['line_items']):
+            item_errors = {}
+            if not isinstance(item, dict):
+                item = {}  # Reported as missing every field, as LineItemColumns does
             
-            if line_item_errors:
-                errors['line_items'] = line_item_errors
-        
-        # Calculate and validate totals
-        if not errors.get('line_items') and not errors.get('subtotal') and not errors.get('tax_amount') and not errors.get('total_amount'):
-            # Calculate expected values
-            calculated_subtotal = sum(float(item['amount']) for item in invoice_data['line_items'])
-            calculated_tax = sum(float(item['tax_amount']) for item in invoice_data['line_items'])
-            calculated_total = calculated_subtotal - float(invoice_data.get('discount', 0)) + calculated_tax
+            # Required fields
+            for field in required_fields:
+                if field not in item or item[field] is None or (isinstance(item[field], str) and not item[field].strip()):
+                    item_errors[field] = f"{field.replace('_', ' ').title()} is required"
             
-            # Allow for small floating point differences
-            subtotal_diff = abs(calculated_subtotal - float(invoice_data['subtotal']))
-            tax_diff = abs(calculated_tax - float(invoice_data['tax_amount']))
-            total_diff = abs(calculated_total - float(invoice_data['total_amount']))
+            # Validate HSN/SAC code exists in master data
+            if 'hsn_sac' in item and item['hsn_sac']:
+                hsn_valid = isinstance(item['hsn_sac'], str) and item['hsn_sac'] in master_data.items
+                if not hsn_valid:
+                    item_errors['hsn_sac'] = f"HSN/SAC code {item['hsn_sac']} not found in master data"
             
-            tolerance = 0.05  # Allow small differences due to rounding
+            # Check numeric fields
+            for field in numeric_fields:
+                if field in item and not item_errors.get(field):
+                    try:
+                        value = float(item[field]) if isinstance(item[field], str) else item[field]
+                        if value < 0:
+                            item_errors[field] = f"{field.replace('_', ' ').title()} must be a positive number"
+                    except (ValueError, TypeError):
+                        item_errors[field] = f"{field.replace('_', ' ').title()} must be a number"
             
-            if subtotal_diff > tolerance:
-                errors['subtotal'] = f"Calculated subtotal ({calculated_subtotal:.2f}) doesn't match invoice subtotal ({invoice_data['subtotal']})"
+            # Check the line's tax against its rate
+            if self.check_line_tax and not item_errors:
+                expected = float(item['amount']) * float(item['tax_percentage']) / 100
+                if abs(float(item['tax_amount']) - expected) * 100 > TOLERANCE_PAISE:
+                    item_errors['tax_amount'] = line_tax_error(item, expected)
             
-            if tax_diff > tolerance:
-                errors['tax_amount'] = f"Calculated tax ({calculated_tax:.2f}) doesn't match invoice tax ({invoice_data['tax_amount']})"
-                
-            if total_diff > tolerance:
-                errors['total_amount'] = f"Calculated total ({calculated_total:.2f}) doesn't match invoice total ({invoice_data['total_amount']})"
+            if item_errors:
+                line_item_errors.append({
+                    'index': idx,
+                    'errors': item_errors
+                })
         
-        return (len(errors) == 0, errors)
+        if line_item_errors:
+            errors['line_items'] = line_item_errors
+        else:
+            self._reconcile_line_item_totals(invoice_data, LineItemColumns(invoice_data['line_items']), errors)
+    
+    def _validate_line_items_columnar(self, invoice_data, master_data, errors):
+        """
+        Validate a large invoice's line items as typed columns (see line_item_validation.py)
+        Errors have the same shape as the row-by-row path; totals are summed in whole paise
+        """
+        line_item_errors, columns = validate_line_items_columnar(invoice_data['line_items'], master_data.items,
+                                                                 self.check_line_tax)
+        if line_item_errors:
+            errors['line_items'] = line_item_errors
+        else:
+            self._reconcile_line_item_totals(invoice_data, columns, errors)
+    
+    def _reconcile_line_item_totals(self, invoice_data, columns, errors):
+        """
+        Check the invoice's subtotal, tax and total against its line items summed in whole paise
+        Shared by both line item paths, so an invoice gets the same result whatever its size
+        """
+        if errors.get('subtotal') or errors.get('tax_amount') or errors.get('total_amount'):
+            return
+        
+        totals, line_item_errors = line_item_totals(columns)
+        if line_item_errors:
+            errors['line_items'] = line_item_errors
+        else:
+            reconcile_totals(invoice_data, totals, errors)
     
     def validate_company(self, gstin):
         """
         Validate company GSTIN against master data
-        Returns company object if found, None otherwise
+        Returns the company record from the in-memory GSTIN index if found, None otherwise
         """
         try:
-            company = Company.query.filter_by(gstin=gstin).first()
+            company = company_index.get(gstin)
             return company
         except Exception as e:
             logger.error(f"Error validating company GSTIN {gstin}: {str(e)}")
             return None
     
-    def validate_hsn_sac(self, hsn_sac):
-        """
-        Validate HSN/SAC code against master data
-        Returns True if valid, False otherwise
-        """
-        try:
-            item = Item.query.filter_by(hsn_sac=hsn_sac).first()
-            return item is not None
-        except Exception as e:
-            logger.error(f"Error validating HSN/SAC {hsn_sac}: {str(e)}")
-            return False
-    
     def format_validation_errors(self, errors):
         """Format validation errors as a JSON string"""
         return json.dumps(errors)
@@ -0,0 +1,74 @@
+import io
+from collections import namedtuple
+import numpy as np
+from PIL import Image
+
+# Encodings the vision API accepts, by PIL format name
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+NormalizedImage = namedtuple('NormalizedImage', ['data', 'mime_type', 'width', 'height', 'grayscale'])
+
+def flatten_image(image):
+    """Convert any PIL mode to RGB or L, compositing transparent areas onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, 'white')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    if image.mode in ('1', 'L'):
+        return image.convert('L')
+    return image.convert('RGB')
+
+def is_monochrome(image, tolerance=16, max_color_ratio=0.005):
+    """
+    Check whether an RGB image is effectively grayscale
+    Pixels whose channels differ by more than tolerance count as colored;
+    a few colored pixels (stamps, logo edges, scanner fringing) are allowed
+    """
+    if image.mode == 'L':
+        return True
+    
+    sample = image.copy()
+    sample.thumbnail((512, 512))
+    rgb = np.asarray(sample.convert('RGB'), dtype=np.int16)
+    spread = rgb.max(axis=2) - rgb.min(axis=2)
+    return np.count_nonzero(spread > tolerance) <= spread.size * max_color_ratio
+
+def encode_image(image, image_format, jpeg_quality=85):
+    """Encode a PIL image in the given format and return the bytes"""
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.save(buffer, format='JPEG', quality=jpeg_quality, optimize=True)
+    elif image_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=jpeg_quality)
+    else:
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def normalize_image(image, max_dimension=2048, image_format='auto', jpeg_quality=85):
+    """
+    Prepare a decoded image for upload to a vision model
+    Downsizes so neither side exceeds max_dimension, drops color from monochrome
+    documents and re-encodes as image_format; 'auto' keeps the smaller of PNG and JPEG
+    """
+    image = flatten_image(image)
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    
+    grayscale = is_monochrome(image)
+    if grayscale and image.mode != 'L':
+        image = image.convert('L')
+    
+    if image_format.lower() == 'auto':
+        formats = ['PNG', 'JPEG']
+    else:
+        formats = [image_format.upper().replace('JPG', 'JPEG')]
+    best_data, best_format = None, None
+    for candidate in formats:
+        if candidate not in MIME_TYPES:
+            raise ValueError(f"Unsupported image format for the vision API: {candidate}")
+        data = encode_image(image, candidate, jpeg_quality)
+        if best_data is None or len(data) < len(best_data):
+            best_data, best_format = data, candidate
+    
+    return NormalizedImage(best_data, MIME_TYPES[best_format], image.width, image.height, grayscale)
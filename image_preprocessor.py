@@ -0,0 +1,155 @@
+import math
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# Stages available to OCR_PREPROCESS_STAGES; every page is converted to grayscale first
+STAGE_NAMES = ('resample', 'blur', 'threshold', 'open')
+DEFAULT_STAGES = STAGE_NAMES
+
+# Long side of an A4 page in inches, used to estimate the resolution of images without DPI metadata
+ASSUMED_PAGE_INCHES = 11.69
+
+# Resolution metadata below this is treated as missing (e.g. TIFFs saved with 1x1 DPI)
+MIN_PLAUSIBLE_DPI = 72
+
+# Working bytes per pixel a page needs at the pipeline's peak: the page buffer plus
+# the resampled copy or OpenCV's threshold scratch buffer
+WORKING_BYTES_PER_PIXEL = 2
+
+PreprocessResult = namedtuple('PreprocessResult', ['image', 'stats'])
+
+def preprocess_settings(config):
+    """Read the pipeline's keyword arguments from a Flask config"""
+    stages = config.get('OCR_PREPROCESS_STAGES', ','.join(DEFAULT_STAGES))
+    if isinstance(stages, str):
+        stages = [stage.strip() for stage in stages.split(',') if stage.strip()]
+    return {
+        'stages': list(stages),
+        'target_dpi': config.get('OCR_TARGET_DPI', 300),
+        'memory_limit_mb': config.get('OCR_PAGE_MEMORY_LIMIT_MB', 64),
+        'blur_kernel': config.get('OCR_BLUR_KERNEL', 5),
+        'threshold_block_size': config.get('OCR_THRESHOLD_BLOCK_SIZE', 11),
+        'threshold_c': config.get('OCR_THRESHOLD_C', 2),
+        'open_kernel': config.get('OCR_OPEN_KERNEL', 1)
+    }
+
+def estimate_dpi(width, height, dpi=None):
+    """Resolution of a page, from its metadata when plausible, otherwise assuming an A4 page"""
+    if dpi and dpi >= MIN_PLAUSIBLE_DPI:
+        return dpi
+    return max(width, height) / ASSUMED_PAGE_INCHES
+
+class PreprocessingPipeline:
+    """
+    Declarative OCR preprocessing: a page is converted to an 8-bit grayscale buffer
+    once and the configured stages then work on that buffer in place where OpenCV
+    allows it. Stages that would not change the image (1x1 blur or opening kernels)
+    are dropped when the pipeline is built, and pages above the target DPI or the
+    per-page memory ceiling are downsampled before the filters run.
+    """
+    def __init__(self, stages=DEFAULT_STAGES, target_dpi=300, memory_limit_mb=64, blur_kernel=5,
+                 threshold_block_size=11, threshold_c=2, open_kernel=1):
+        unknown = [stage for stage in stages if stage not in STAGE_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing stages: {', '.join(unknown)}")
+        if blur_kernel > 1 and blur_kernel % 2 == 0:
+            raise ValueError(f"Blur kernel must be odd, got {blur_kernel}")
+        if threshold_block_size < 3 or threshold_block_size % 2 == 0:
+            raise ValueError(f"Threshold block size must be odd and at least 3, got {threshold_block_size}")
+        
+        self.target_dpi = target_dpi
+        self.memory_limit_mb = memory_limit_mb
+        self.blur_kernel = blur_kernel
+        self.threshold_block_size = threshold_block_size
+        self.threshold_c = threshold_c
+        self.open_kernel = open_kernel
+        self.stages = [stage for stage in stages if not self._is_noop(stage)]
+        self._stage_functions = [(stage, getattr(self, f'_{stage}')) for stage in self.stages]
+    
+    def _is_noop(self, stage):
+        """Check whether a stage would return its input unchanged with the current settings"""
+        if stage == 'blur':
+            return self.blur_kernel <= 1
+        if stage == 'open':
+            return self.open_kernel <= 1
+        if stage == 'resample':
+            return not self.target_dpi and not self.memory_limit_mb
+        return False
+    
+    def describe(self):
+        """Stable description of the stages and their settings, for cache keys"""
+        settings = {
+            'resample': f"resample@{self.target_dpi}dpi/{self.memory_limit_mb}mb",
+            'blur': f"blur{self.blur_kernel}",
+            'threshold': f"threshold{self.threshold_block_size}/{self.threshold_c}",
+            'open': f"open{self.open_kernel}"
+        }
+        return ','.join(settings[stage] for stage in self.stages) or 'grayscale'
+    
+    def scale_for(self, width, height, dpi=None):
+        """Downsampling factor (at most 1) that meets the target DPI and the memory ceiling"""
+        scale = 1.0
+        if self.target_dpi:
+            scale = min(scale, self.target_dpi / estimate_dpi(width, height, dpi))
+        if self.memory_limit_mb:
+            max_pixels = self.memory_limit_mb * 1024 * 1024 / WORKING_BYTES_PER_PIXEL
+            scale = min(scale, math.sqrt(max_pixels / (width * height)))
+        return scale
+    
+    def run(self, image, dpi=None):
+        """
+        Preprocess a PIL page for OCR and return PreprocessResult(image, stats)
+        stats holds per-stage milliseconds, the downsampling scale and the peak bytes
+        of the page buffers held by the pipeline (excluding the decoded page itself)
+        """
+        stage_ms = {}
+        start = time.perf_counter()
+        img = np.array(image.convert('L'))
+        stage_ms['grayscale'] = (time.perf_counter() - start) * 1000
+        context = {'dpi': dpi, 'scale': 1.0, 'peak_bytes': img.nbytes}
+        
+        for stage, function in self._stage_functions:
+            start = time.perf_counter()
+            result = function(img, context)
+            stage_ms[stage] = (time.perf_counter() - start) * 1000
+            if result is not img:
+                context['peak_bytes'] = max(context['peak_bytes'], img.nbytes + result.nbytes)
+                img = result
+        
+        return PreprocessResult(img, {
+            'stage_ms': stage_ms,
+            'scale': context['scale'],
+            'peak_bytes': context['peak_bytes'],
+            'width': img.shape[1],
+            'height': img.shape[0]
+        })
+    
+    def _resample(self, img, context):
+        """Downsample with area averaging, which keeps thin strokes legible"""
+        height, width = img.shape
+        scale = self.scale_for(width, height, context['dpi'])
+        if scale >= 0.98:
+            return img
+        context['scale'] = scale
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    
+    def _blur(self, img, context):
+        """Gaussian blur to reduce scanner noise, in place"""
+        cv2.GaussianBlur(img, (self.blur_kernel, self.blur_kernel), 0, dst=img)
+        return img
+    
+    def _threshold(self, img, context):
+        """Adaptive binarization, in place; OpenCV allocates one scratch buffer for the local means"""
+        cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                              self.threshold_block_size, self.threshold_c, dst=img)
+        context['peak_bytes'] = max(context['peak_bytes'], img.nbytes * 2)
+        return img
+    
+    def _open(self, img, context):
+        """Morphological opening to remove specks smaller than the kernel, in place"""
+        kernel = np.ones((self.open_kernel, self.open_kernel), np.uint8)
+        cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel, dst=img)
+        return img
@@ -0,0 +1,318 @@
+import io
+import os
+import csv
+import json
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import aliased
+from models import Company, Invoice, InvoiceLineItem, db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, only needed for Parquet exports
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Text is sent in chunks of about this many bytes
+CHUNK_BYTES = 256 * 1024
+
+_Vendor = aliased(Company, name='vendor')
+_Customer = aliased(Company, name='customer')
+
+# (name, column, Parquet type) of each exported column; one row per line item, invoice columns repeated
+_INVOICE_COLUMNS = [
+    ('invoice_id', Invoice.id, 'int64'),
+    ('invoice_number', Invoice.invoice_number, 'string'),
+    ('invoice_date', Invoice.invoice_date, 'date32'),
+    ('due_date', Invoice.due_date, 'date32'),
+    ('po_number', Invoice.po_number, 'string'),
+    ('vendor_gstin', _Vendor.gstin, 'string'),
+    ('vendor_name', _Vendor.name, 'string'),
+    ('customer_gstin', _Customer.gstin, 'string'),
+    ('customer_name', _Customer.name, 'string'),
+    ('place_of_supply', Invoice.place_of_supply, 'string'),
+    ('subtotal', Invoice.subtotal, 'float64'),
+    ('tax_amount', Invoice.tax_amount, 'float64'),
+    ('discount', Invoice.discount, 'float64'),
+    ('total_amount', Invoice.total_amount, 'float64'),
+    ('terms', Invoice.terms, 'string'),
+    ('processing_status', Invoice.processing_status, 'string'),
+    ('ocr_confidence', Invoice.ocr_confidence, 'float64'),
+    ('created_at', Invoice.created_at, 'timestamp'),
+    ('updated_at', Invoice.updated_at, 'timestamp'),
+]
+_LINE_ITEM_COLUMNS = [
+    ('line_id', InvoiceLineItem.id, 'int64'),
+    ('line_description', InvoiceLineItem.description, 'string'),
+    ('line_hsn_sac', InvoiceLineItem.hsn_sac, 'string'),
+    ('line_quantity', InvoiceLineItem.quantity, 'float64'),
+    ('line_rate', InvoiceLineItem.rate, 'float64'),
+    ('line_tax_percentage', InvoiceLineItem.tax_percentage, 'float64'),
+    ('line_tax_amount', InvoiceLineItem.tax_amount, 'float64'),
+    ('line_amount', InvoiceLineItem.amount, 'float64'),
+]
+INVOICE_FIELDS = [name for name, _, _ in _INVOICE_COLUMNS]
+LINE_ITEM_FIELDS = [name for name, _, _ in _LINE_ITEM_COLUMNS]
+EXPORT_FIELDS = INVOICE_FIELDS + LINE_ITEM_FIELDS
+_TIMESTAMP_POSITIONS = [idx for idx, (_, _, kind) in enumerate(_INVOICE_COLUMNS + _LINE_ITEM_COLUMNS) if kind == 'timestamp']
+
+class ExportWatermark(namedtuple('ExportWatermark', ['updated_at', 'invoice_id'])):
+    """
+    Position in an export, which is ordered by (updated_at, invoice_id): the last invoice
+    written. Written as "<updated_at ISO timestamp>,<invoice_id>", e.g. "2025-01-31T18:04:05.123456,1042".
+    """
+    __slots__ = ()
+    
+    @classmethod
+    def parse(cls, value):
+        """Parse the text form; raises ValueError if it is malformed"""
+        updated_at, separator, invoice_id = value.strip().rpartition(',')
+        if not separator:
+            raise ValueError(f"Invalid export watermark: {value}")
+        return cls(datetime.fromisoformat(updated_at), int(invoice_id))
+    
+    def __str__(self):
+        return f"{self.updated_at.isoformat()},{self.invoice_id}"
+
+def export_query(date_from=None, date_to=None, vendor=None, status=None, after=None, overlap=timedelta(0)):
+    """
+    Invoices joined to their vendor, customer and line items, in (updated_at, id) order
+    date_from and date_to bound invoice_date (inclusive), vendor is a vendor GSTIN,
+    status a processing_status and after an ExportWatermark to continue from.
+    With an overlap, invoices updated up to that long before the watermark are exported
+    again, so transactions that commit out of updated_at order are not skipped; loads
+    must upsert on invoice_id.
+    Invoices without line items give one row with empty line item columns.
+    """
+    query = (
+        select(*[column.label(name) for name, column, _ in _INVOICE_COLUMNS + _LINE_ITEM_COLUMNS])
+        .join(_Vendor, Invoice.vendor_id == _Vendor.id)
+        .join(_Customer, Invoice.customer_id == _Customer.id)
+        .outerjoin(InvoiceLineItem, InvoiceLineItem.invoice_id == Invoice.id)
+        .order_by(Invoice.updated_at, Invoice.id, InvoiceLineItem.id)
+    )
+    if date_from:
+        query = query.where(Invoice.invoice_date >= date_from)
+    if date_to:
+        query = query.where(Invoice.invoice_date <= date_to)
+    if vendor:
+        query = query.where(_Vendor.gstin == vendor)
+    if status:
+        query = query.where(Invoice.processing_status == status)
+    if after and overlap:
+        query = query.where(Invoice.updated_at >= after.updated_at - overlap)
+    elif after:
+        query = query.where(tuple_(Invoice.updated_at, Invoice.id) > (after.updated_at, after.invoice_id))
+    return query
+
+def export_overlap(config):
+    """How far before the watermark an incremental export re-reads, from a Flask config"""
+    return timedelta(seconds=config.get('EXPORT_OVERLAP_SECONDS', 60))
+
+def export_rows(query, batch_size=1000):
+    """
+    Stream the rows of an export_query in batches of batch_size
+    yield_per keeps memory constant: PostgreSQL reads through a server-side cursor and
+    no ORM objects are built.
+    """
+    result = db.session.execute(query, execution_options={'yield_per': batch_size})
+    for partition in result.partitions():
+        yield from partition
+
+class ExportTracker:
+    """Pass-through over export rows that counts rows and invoices and keeps the last invoice's watermark"""
+    def __init__(self, rows):
+        self._rows = rows
+        self.rows = 0
+        self.invoices = 0
+        self.watermark = None
+    
+    def __iter__(self):
+        for row in self._rows:
+            if self.watermark is None or row.invoice_id != self.watermark.invoice_id:
+                self.invoices += 1
+                self.watermark = ExportWatermark(row.updated_at, row.invoice_id)
+            self.rows += 1
+            yield row
+
+def _text_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def write_csv(rows):
+    """CSV text chunks with a header row, one row per line item"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        # Dates already print as ISO dates; timestamps need isoformat() for the T separator
+        values = list(row)
+        for idx in _TIMESTAMP_POSITIONS:
+            if values[idx] is not None:
+                values[idx] = values[idx].isoformat()
+        writer.writerow(values)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def write_ndjson(rows):
+    """NDJSON text chunks, one invoice per line with its line items nested under line_items"""
+    invoice_width = len(INVOICE_FIELDS)
+    line_keys = [name[len('line_'):] for name in LINE_ITEM_FIELDS]
+    chunk = []
+    size = 0
+    invoice = None
+    
+    def dump(invoice):
+        return json.dumps(invoice, default=_text_value) + '\n'
+    
+    for row in rows:
+        if invoice is None or row.invoice_id != invoice['invoice_id']:
+            if invoice is not None:
+                line = dump(invoice)
+                chunk.append(line)
+                size += len(line)
+                if size >= CHUNK_BYTES:
+                    yield ''.join(chunk)
+                    chunk = []
+                    size = 0
+            invoice = dict(zip(INVOICE_FIELDS, row[:invoice_width]))
+            invoice['line_items'] = []
+        if row.line_id is not None:
+            invoice['line_items'].append(dict(zip(line_keys, row[invoice_width:])))
+    if invoice is not None:
+        chunk.append(dump(invoice))
+    yield ''.join(chunk)
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever has been written since the last drain"""
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def parquet_schema():
+    types = {'int64': pa.int64(), 'string': pa.string(), 'float64': pa.float64(),
+             'date32': pa.date32(), 'timestamp': pa.timestamp('us')}
+    return pa.schema([(name, types[kind]) for name, _, kind in _INVOICE_COLUMNS + _LINE_ITEM_COLUMNS])
+
+def write_parquet(rows, row_group_size=50000):
+    """
+    Parquet bytes, one row per line item, written and sent one row group at a time
+    so no more than row_group_size rows are held in memory
+    """
+    if pa is None:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+    
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    columns = [[] for _ in EXPORT_FIELDS]
+    
+    def write_group():
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+        ))
+        for values in columns:
+            values.clear()
+    
+    count = 0
+    for row in rows:
+        for values, value in zip(columns, row):
+            values.append(value)
+        count += 1
+        if count == row_group_size:
+            write_group()
+            count = 0
+            yield sink.drain()
+    if count:
+        write_group()
+    writer.close()
+    yield sink.drain()
+
+def write_export(export_format, rows, row_group_size=50000):
+    """Chunks of an export in one of EXPORT_FORMATS: str for csv and ndjson, bytes for parquet"""
+    if export_format == 'csv':
+        return write_csv(rows)
+    if export_format == 'ndjson':
+        return write_ndjson(rows)
+    if export_format == 'parquet':
+        return write_parquet(rows, row_group_size)
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+def _parse_date(ctx, param, value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        raise click.BadParameter('expected YYYY-MM-DD')
+
+def _parse_watermark(ctx, param, value):
+    try:
+        return ExportWatermark.parse(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+@click.command('export-invoices')
+@click.argument('output', type=click.File('wb'))
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default=None,
+              help='Output format (default: from the OUTPUT extension, otherwise csv).')
+@click.option('--date-from', callback=_parse_date, help='First invoice date, YYYY-MM-DD.')
+@click.option('--date-to', callback=_parse_date, help='Last invoice date, YYYY-MM-DD.')
+@click.option('--vendor', help='Vendor GSTIN.')
+@click.option('--status', help='Processing status, e.g. completed.')
+@click.option('--after', callback=_parse_watermark,
+              help='Only invoices updated after this watermark, less EXPORT_OVERLAP_SECONDS.')
+@click.option('--state-file', type=click.Path(dir_okay=False),
+              help='Read --after from this file and store the new watermark in it after a successful export.')
+@click.option('--batch-size', type=int, default=None, help='Rows fetched per round trip (default EXPORT_BATCH_SIZE).')
+@with_appcontext
+def export_invoices_command(output, export_format, date_from, date_to, vendor, status, after, state_file, batch_size):
+    """Export invoices and their line items to OUTPUT (- for standard output)."""
+    if export_format is None:
+        extension = os.path.splitext(output.name)[1].lstrip('.').lower()
+        export_format = extension if extension in EXPORT_FORMATS else 'csv'
+    if export_format == 'parquet' and pa is None:
+        raise click.UsageError('Parquet export requires the pyarrow package')
+    if after is None and state_file and os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as f:
+            after = _parse_watermark(None, None, f.read())
+    
+    query = export_query(date_from, date_to, vendor, status, after, export_overlap(current_app.config))
+    rows = ExportTracker(export_rows(query, batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)))
+    for chunk in write_export(export_format, rows, current_app.config.get('EXPORT_PARQUET_ROW_GROUP_SIZE', 50000)):
+        output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    output.flush()
+    
+    watermark = rows.watermark or after
+    if state_file and watermark:
+        with open(state_file, 'w', encoding='utf-8') as f:
+            f.write(str(watermark) + '\n')
+    click.echo(f"Exported {rows.invoices} invoices ({rows.rows} rows) as {export_format}"
+               + (f", watermark {watermark}" if watermark else ''), err=True)
@@ -0,0 +1,264 @@
+import re
+from collections import namedtuple
+from table_extractor import extract_line_items
+
+# Field patterns, compiled once at import
+VENDOR_PATTERN = re.compile(r'^([A-Za-z0-9\s]+(?:Pvt|Private|Ltd|Limited|Co\.|Corporation|Industries|Technologies|Systems|Components)\s*(?:Ltd|Limited|LLP|Co\.|Corporation)?)', re.IGNORECASE)
+GSTIN_PATTERN = re.compile(r'GSTIN:\s*([0-9A-Z]{15})')
+INVOICE_NUM_PATTERN = re.compile(r'Invoice\s*No\s*[.:]\s*(INV-[0-9-]+)', re.IGNORECASE)
+INVOICE_DATE_PATTERN = re.compile(r'Invoice\s*Date\s*[.:]\s*(\d{4}-\d{2}-\d{2})', re.IGNORECASE)
+DUE_DATE_PATTERN = re.compile(r'Due\s*Date\s*[.:]\s*(\d{4}-\d{2}-\d{2})', re.IGNORECASE)
+PO_PATTERN = re.compile(r'P\.?O\.?\s*#?\s*[.:]\s*(PO-[0-9-]+)', re.IGNORECASE)
+BILL_TO_PATTERN = re.compile(r'Bill\s*To\s*([A-Za-z0-9\s]+)', re.IGNORECASE)
+SHIP_TO_PATTERN = re.compile(r'Ship\s*To\s*([A-Za-z0-9\s,]+)', re.IGNORECASE)
+SUBTOTAL_PATTERN = re.compile(r'Subtotal\s*([0-9,.]+)', re.IGNORECASE)
+TAX_PATTERN = re.compile(r'(?:GST|Tax|IGST)\s*(?:18%|18)\s*([0-9,.]+)', re.IGNORECASE)
+DISCOUNT_PATTERN = re.compile(r'Discount\s*\([0-9%]+\)\s*-?([0-9,.]+)', re.IGNORECASE)
+TOTAL_PATTERN = re.compile(r'Total\s*([₹₨]?\s*[0-9,.]+)', re.IGNORECASE)
+
+# Line item table markers and rows
+ITEM_SECTION_START_PATTERN = re.compile(r'#\s*Item\s*&\s*Description|HSN/SAC\s*Qty\s*Rate', re.IGNORECASE)
+ITEM_SECTION_END_PATTERN = re.compile(r'Subtotal|Total\s*Taxable', re.IGNORECASE)
+ITEM_ROW_CANDIDATE_PATTERN = re.compile(r'\d+\s+\S+')
+ITEM_ROW_PATTERN = re.compile(r'(\d+)\s+([^0-9]+)\s+(\d+)\s+(\d+)\s+([0-9,.]+)\s+(\d+)%\s+([0-9,.]+)\s+([0-9,.]+)')
+
+# A rule is tried on a line only while pending and when the line contains one of its
+# keywords (ignoring case); every keyword is a literal the pattern cannot match without.
+# apply returns True when the line is consumed and no later rule should see it.
+ExtractionRule = namedtuple('ExtractionRule', ['name', 'keywords', 'search', 'pending', 'apply'])
+
+def _set_field(*path):
+    """Build an apply function storing the stripped first match group at extracted_data[path]"""
+    def apply(extracted_data, match, lines, index):
+        target = extracted_data
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = match.group(1).strip()
+        return True
+    return apply
+
+def _set_amount(key, strip_chars=''):
+    """Build an apply function parsing a matched amount into extracted_data[key]; unparseable amounts are ignored"""
+    def apply(extracted_data, match, lines, index):
+        amount_str = match.group(1)
+        for char in strip_chars:
+            amount_str = amount_str.replace(char, '')
+        try:
+            extracted_data[key] = float(amount_str.replace(',', '').strip())
+        except ValueError:
+            pass
+        return True
+    return apply
+
+def _set_customer(extracted_data, match, lines, index):
+    """Store the Bill To name and the first GSTIN within the next few lines as the customer's"""
+    extracted_data['customer']['name'] = match.group(1).strip()
+    for next_line in lines[index + 1:index + 5]:
+        gstin_match = GSTIN_PATTERN.search(next_line)
+        if gstin_match:
+            extracted_data['customer']['gstin'] = gstin_match.group(1).strip()
+            break
+    return True
+
+def _set_place_of_supply(extracted_data, match, lines, index):
+    """Store the text after the first colon; the line is consumed even when there is none"""
+    pos_parts = match.split(":")
+    if len(pos_parts) > 1:
+        extracted_data['place_of_supply'] = pos_parts[1].strip()
+    return True
+
+# Rules for header fields, tried in order before the line item checks
+HEADER_RULES = (
+    ExtractionRule('vendor_name',
+                   ('pvt', 'private', 'ltd', 'limited', 'co.', 'corporation', 'industries', 'technologies', 'systems', 'components'),
+                   VENDOR_PATTERN.search,
+                   lambda data, index: index < 5 and not data['vendor']['name'],
+                   _set_field('vendor', 'name')),
+    ExtractionRule('vendor_gstin', ('gstin:',), GSTIN_PATTERN.search,
+                   lambda data, index: not data['vendor']['gstin'],
+                   _set_field('vendor', 'gstin')),
+    ExtractionRule('invoice_number', ('inv-',), INVOICE_NUM_PATTERN.search,
+                   lambda data, index: not data['invoice_number'],
+                   _set_field('invoice_number')),
+    ExtractionRule('invoice_date', ('invoice',), INVOICE_DATE_PATTERN.search,
+                   lambda data, index: not data['invoice_date'],
+                   _set_field('invoice_date')),
+    ExtractionRule('due_date', ('due',), DUE_DATE_PATTERN.search,
+                   lambda data, index: not data['due_date'],
+                   _set_field('due_date')),
+    ExtractionRule('po_number', ('po-',), PO_PATTERN.search,
+                   lambda data, index: not data['po_number'],
+                   _set_field('po_number')),
+    ExtractionRule('customer', ('bill',), BILL_TO_PATTERN.search,
+                   lambda data, index: not data['customer']['name'],
+                   _set_customer),
+    ExtractionRule('customer_address', ('ship',), SHIP_TO_PATTERN.search,
+                   lambda data, index: not data['customer']['address'],
+                   _set_field('customer', 'address')),
+    ExtractionRule('place_of_supply', ('place of supply',),
+                   lambda line: line if "Place Of Supply" in line else None,
+                   lambda data, index: not data['place_of_supply'],
+                   _set_place_of_supply),
+)
+
+# Rules for totals, tried after the line item checks
+TOTAL_RULES = (
+    ExtractionRule('subtotal', ('subtotal',), SUBTOTAL_PATTERN.search,
+                   lambda data, index: not data['subtotal'],
+                   _set_amount('subtotal')),
+    ExtractionRule('tax_amount', ('18',), TAX_PATTERN.search,
+                   lambda data, index: not data['tax_amount'],
+                   _set_amount('tax_amount')),
+    ExtractionRule('discount', ('discount',), DISCOUNT_PATTERN.search,
+                   lambda data, index: True,
+                   _set_amount('discount')),
+    ExtractionRule('total_amount', ('total',),
+                   lambda line: TOTAL_PATTERN.search(line) if 'Balance Due' in line else None,
+                   lambda data, index: not data['total_amount'],
+                   _set_amount('total_amount', strip_chars='₹₨')),
+)
+
+# Keywords of the line item section markers
+ITEM_SECTION_START_KEYWORDS = ('description', 'hsn/sac')
+ITEM_SECTION_END_KEYWORDS = ('total',)
+
+def _overlaps(keyword, other):
+    """Whether other could start inside keyword and run past its end"""
+    return any(other.startswith(keyword[i:]) for i in range(1, len(keyword)))
+
+def _build_keyword_scan(keyword_groups):
+    """
+    Compile a single scan of lowercased lines for the keywords of every group
+    Returns the pattern and a dict mapping each keyword to a bitmask of the groups it
+    enables. The scan reports non-overlapping keywords, longest first, so a keyword also
+    enables the groups of keywords it contains (e.g. 'subtotal' enables 'total') or that
+    could start inside it (e.g. 'systems' enables 'ship').
+    """
+    keywords = sorted({keyword for group in keyword_groups for keyword in group}, key=len, reverse=True)
+    masks = {}
+    for keyword in keywords:
+        masks[keyword] = 0
+        for bit, group in enumerate(keyword_groups):
+            if any(other in keyword or _overlaps(keyword, other) for other in group):
+                masks[keyword] |= 1 << bit
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords)), masks
+
+# Rule i is enabled by bit i; the item section markers take the two bits after the rules
+_RULES = HEADER_RULES + TOTAL_RULES
+KEYWORD_SCAN, KEYWORD_MASKS = _build_keyword_scan(
+    [rule.keywords for rule in _RULES] + [ITEM_SECTION_START_KEYWORDS, ITEM_SECTION_END_KEYWORDS]
+)
+HEADER_RULE_BITS = [(1 << i, rule) for i, rule in enumerate(HEADER_RULES)]
+TOTAL_RULE_BITS = [(1 << (len(HEADER_RULES) + i), rule) for i, rule in enumerate(TOTAL_RULES)]
+ITEM_SECTION_START_BIT = 1 << len(_RULES)
+ITEM_SECTION_END_BIT = 1 << (len(_RULES) + 1)
+
+# The only non-ASCII letters case-insensitive patterns match against ASCII letters
+_ASCII_CASE_FOLDS = str.maketrans({'ı': 'i', 'İ': 'i', 'ſ': 's', 'K': 'k'})
+
+def line_rule_mask(line):
+    """Bitmask of the rules and markers whose keywords occur in a line, ignoring case"""
+    lowered = line.lower() if line.isascii() else line.translate(_ASCII_CASE_FOLDS).lower()
+    mask = 0
+    for keyword in KEYWORD_SCAN.findall(lowered):
+        mask |= KEYWORD_MASKS[keyword]
+    return mask
+
+def _apply_rules(rule_bits, mask, extracted_data, line, lines, index):
+    """Try the rules enabled by mask in order on a line; return True once one consumes it"""
+    for bit, rule in rule_bits:
+        if not mask & bit or not rule.pending(extracted_data, index):
+            continue
+        match = rule.search(line)
+        if match and rule.apply(extracted_data, match, lines, index):
+            return True
+    return False
+
+def parse_item_row(row):
+    """Parse a line item table row into a dict, or return None if it does not fit the expected columns"""
+    item_match = ITEM_ROW_PATTERN.search(row)
+    if not item_match:
+        return None
+    try:
+        return {
+            'description': item_match.group(2).strip(),
+            'hsn_sac': item_match.group(3).strip(),
+            'quantity': float(item_match.group(4)),
+            'rate': float(item_match.group(5).replace(',', '')),
+            'tax_percentage': float(item_match.group(6)),
+            'tax_amount': float(item_match.group(7).replace(',', '')),
+            'amount': float(item_match.group(8).replace(',', ''))
+        }
+    except (ValueError, IndexError):
+        return None
+
+def extract_invoice_data(raw_text, ocr_data):
+    """
+    Extract structured data from OCR results in a single pass over the text lines
+    Returns a dict with extracted fields and confidence values
+    """
+    # Calculate average confidence
+    conf_values = [c for c in ocr_data['conf'] if c != -1]
+    avg_confidence = sum(conf_values) / len(conf_values) if conf_values else 0
+    
+    # Split text into lines for processing
+    lines = raw_text.split('\n')
+    
+    # Initialize extracted data dict
+    extracted_data = {
+        'vendor': {'name': None, 'gstin': None, 'address': None},
+        'customer': {'name': None, 'gstin': None, 'address': None},
+        'invoice_number': None,
+        'invoice_date': None,
+        'due_date': None,
+        'po_number': None,
+        'place_of_supply': None,
+        'line_items': [],
+        'subtotal': None,
+        'tax_amount': None,
+        'discount': 0.0,
+        'total_amount': None,
+        'terms': None,
+        'ocr_confidence': avg_confidence
+    }
+    
+    item_section = False
+    item_rows = []
+    
+    for i, line in enumerate(lines):
+        # Skip empty lines
+        if not line.strip():
+            continue
+        
+        # One keyword scan selects the rules worth running on this line
+        mask = line_rule_mask(line)
+        
+        if _apply_rules(HEADER_RULE_BITS, mask, extracted_data, line, lines, i):
+            continue
+        
+        # Check for line items section start
+        if mask & ITEM_SECTION_START_BIT and ITEM_SECTION_START_PATTERN.search(line):
+            item_section = True
+            continue
+        
+        if item_section:
+            # Check for the end of line items section
+            if mask & ITEM_SECTION_END_BIT and ITEM_SECTION_END_PATTERN.search(line):
+                item_section = False
+            # Collect line item rows
+            elif ITEM_ROW_CANDIDATE_PATTERN.search(line):
+                item_rows.append(line.strip())
+        
+        _apply_rules(TOTAL_RULE_BITS, mask, extracted_data, line, lines, i)
+    
+    # Read line items from the word boxes of the item table, falling back to
+    # parsing the collected text rows when no table is found in the layout
+    line_items = extract_line_items(ocr_data) if 'left' in ocr_data else None
+    if not line_items:
+        line_items = [line_item for line_item in map(parse_item_row, item_rows) if line_item]
+    extracted_data['line_items'] = line_items
+    
+    # Set default terms
+    extracted_data['terms'] = "Immediate"  # Default observed in sample invoices
+    
+    return extracted_data
@@ -0,0 +1,161 @@
+import json
+import time
+import logging
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from models import Invoice, db
+from field_validator import LOOKUP_CHUNK_SIZE
+from invoice_writer import save_invoice, save_invoices
+
+logger = logging.getLogger(__name__)
+
+def parse_ndjson(lines):
+    """Yield (invoice, parse_error) for every non-blank line of an NDJSON body"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as e:
+            yield None, f"Invalid JSON on line {line_number}: {str(e)}"
+
+class InvoiceImporter:
+    """
+    Bulk import of pre-extracted invoices from a stream of (invoice, parse_error) records.
+    Records are taken batch_size at a time: master data is resolved once per batch, the
+    invoices are validated against it, and the valid ones are inserted and committed
+    together (see invoice_writer.save_invoices). If a batch cannot be inserted it is
+    retried one invoice per transaction, so a bad record fails on its own and the rest
+    of the stream carries on.
+    """
+    def __init__(self, validator, batch_size=500):
+        self.validator = validator
+        self.batch_size = max(1, batch_size)
+        self.stats = {'processed': 0, 'imported': 0, 'failed': 0, 'batches': 0}
+        self._started = None
+    
+    def run(self, records):
+        """
+        Import every record and yield events as it goes: a failure dict per rejected record
+        ({'index', 'invoice_number', 'error', 'errors'}), {'progress': ...} after each batch
+        and {'summary': ...} at the end
+        """
+        self._started = time.monotonic()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield from self._import_batch(batch)
+                batch = []
+        if batch:
+            yield from self._import_batch(batch)
+        yield {'summary': self.progress()}
+    
+    def progress(self):
+        """Counts so far, elapsed time and throughput"""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        progress = dict(self.stats)
+        progress['elapsed_seconds'] = round(elapsed, 3)
+        progress['invoices_per_second'] = round(self.stats['processed'] / elapsed, 1) if elapsed else 0.0
+        return progress
+    
+    def _import_batch(self, batch):
+        offset = self.stats['processed']
+        invoices = [invoice for invoice, error in batch if error is None and isinstance(invoice, dict)]
+        master_data = self.validator.resolve_master_data(invoices)
+        existing = self._existing_invoice_numbers(invoices)
+        
+        accepted = []
+        seen = set()
+        for index, (invoice, error) in enumerate(batch, start=offset):
+            failure = {'index': index}
+            if isinstance(invoice, dict) and 'invoice_number' in invoice:
+                failure['invoice_number'] = invoice['invoice_number']
+            
+            if error is None and not isinstance(invoice, dict):
+                error = 'Invoice must be a JSON object'
+            if error is None:
+                try:
+                    is_valid, errors = self.validator.validate_invoice(invoice, master_data)
+                    if not is_valid:
+                        error = 'Invalid invoice data'
+                        failure['errors'] = errors
+                    elif invoice['invoice_number'] in existing:
+                        error = f"Invoice {invoice['invoice_number']} already exists"
+                    elif invoice['invoice_number'] in seen:
+                        error = f"Invoice {invoice['invoice_number']} appears more than once in the import"
+                except Exception as e:
+                    error = f'Error validating invoice: {str(e)}'
+            
+            if error is None:
+                seen.add(invoice['invoice_number'])
+                accepted.append((index, invoice))
+            else:
+                failure['error'] = error
+                self.stats['failed'] += 1
+                yield failure
+        
+        if accepted:
+            yield from self._insert(accepted, master_data)
+        
+        self.stats['processed'] += len(batch)
+        self.stats['batches'] += 1
+        yield {'progress': self.progress()}
+    
+    def _existing_invoice_numbers(self, invoices):
+        """Invoice numbers from the batch that are already in the database"""
+        numbers = list({invoice['invoice_number'] for invoice in invoices if isinstance(invoice.get('invoice_number'), str)})
+        existing = set()
+        for start in range(0, len(numbers), LOOKUP_CHUNK_SIZE):
+            chunk = numbers[start:start + LOOKUP_CHUNK_SIZE]
+            existing.update(db.session.execute(select(Invoice.invoice_number).where(Invoice.invoice_number.in_(chunk))).scalars())
+        return existing
+    
+    def _insert(self, accepted, master_data):
+        """Insert a batch's valid invoices in one transaction, falling back to one transaction per invoice"""
+        try:
+            save_invoices(db.session, [invoice for _, invoice in accepted], master_data)
+            db.session.commit()
+            self.stats['imported'] += len(accepted)
+            return
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Could not insert a batch of {len(accepted)} invoices, retrying one at a time: {str(e)}")
+        
+        for index, invoice in accepted:
+            try:
+                save_invoice(db.session, invoice, master_data)
+                db.session.commit()
+                self.stats['imported'] += 1
+            except Exception as e:
+                db.session.rollback()
+                self.stats['failed'] += 1
+                # Report the driver's message rather than the whole statement and its parameters
+                message = str(e.orig) if isinstance(e, DBAPIError) else str(e)
+                yield {'index': index, 'invoice_number': invoice['invoice_number'], 'error': f'Error saving invoice: {message}'}
+
+@click.command('import-invoices')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', type=int, default=None, help='Invoices per batch and transaction (default IMPORT_BATCH_SIZE).')
+@click.option('--failures', type=click.File('w', encoding='utf-8'), default=None,
+              help='Write failed records to this NDJSON file instead of standard output.')
+@with_appcontext
+def import_invoices_command(source, batch_size, failures):
+    """Import pre-extracted invoices from an NDJSON file (- for standard input)."""
+    from api_routes import field_validator
+    
+    importer = InvoiceImporter(field_validator, batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 500))
+    for event in importer.run(parse_ndjson(source)):
+        if 'progress' in event or 'summary' in event:
+            progress = event.get('progress') or event['summary']
+            label = 'Imported' if 'summary' in event else 'Progress:'
+            click.echo(f"{label} {progress['imported']} of {progress['processed']} invoices, {progress['failed']} failed "
+                       f"({progress['invoices_per_second']}/s)", err=True)
+        elif failures is not None:
+            failures.write(json.dumps(event) + '\n')
+        else:
+            click.echo(json.dumps(event))
@@ -0,0 +1,139 @@
+import json
+import time
+import base64
+import logging
+from datetime import date
+from threading import Lock
+from sqlalchemy import func, select, text, tuple_
+from models import Invoice, db
+
+logger = logging.getLogger(__name__)
+
+# Invoice listings are ordered newest first; id breaks ties between invoices on the same date
+NEWEST_FIRST = (Invoice.invoice_date.desc(), Invoice.id.desc())
+OLDEST_FIRST = (Invoice.invoice_date.asc(), Invoice.id.asc())
+_SORT_KEY = tuple_(Invoice.invoice_date, Invoice.id)
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not issued by encode_cursor"""
+
+def encode_cursor(invoice, direction):
+    """Opaque token for the page after ('next') or before ('prev') an invoice in NEWEST_FIRST order"""
+    payload = json.dumps([direction, invoice.invoice_date.isoformat(), invoice.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(direction, invoice_date, invoice_id) from a token made by encode_cursor"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, invoice_date, invoice_id = json.loads(payload)
+        if direction not in ('next', 'prev') or not isinstance(invoice_id, int):
+            raise ValueError(direction)
+        return direction, date.fromisoformat(invoice_date), invoice_id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+class KeysetPage:
+    """
+    One page of invoices in NEWEST_FIRST order with cursors for its neighbours
+    next_cursor and prev_cursor are None at either end of the listing.
+    """
+    def __init__(self, items, per_page, has_prev, has_next):
+        self.items = items
+        self.per_page = per_page
+        self.has_prev = has_prev and bool(items)
+        self.has_next = has_next and bool(items)
+        self.prev_cursor = encode_cursor(items[0], 'prev') if self.has_prev else None
+        self.next_cursor = encode_cursor(items[-1], 'next') if self.has_next else None
+
+def keyset_page(query, per_page, cursor=None):
+    """
+    The page of an Invoice query that a cursor points to, or the first page without one
+    The query may carry filters and loader options but no ordering. Each page is an
+    index range scan on (invoice_date, id) of per_page + 1 rows, the extra row telling
+    whether there is a further page, so deep pages cost the same as the first one.
+    Raises InvalidCursor for tokens that were not made by encode_cursor.
+    """
+    if cursor is None:
+        rows = query.order_by(*NEWEST_FIRST).limit(per_page + 1).all()
+        return KeysetPage(rows[:per_page], per_page, has_prev=False, has_next=len(rows) > per_page)
+    
+    direction, invoice_date, invoice_id = decode_cursor(cursor)
+    if direction == 'next':
+        rows = query.filter(_SORT_KEY < (invoice_date, invoice_id)).order_by(*NEWEST_FIRST).limit(per_page + 1).all()
+        return KeysetPage(rows[:per_page], per_page, has_prev=True, has_next=len(rows) > per_page)
+    
+    # Walk backwards from the cursor and flip the rows back into listing order
+    rows = query.filter(_SORT_KEY > (invoice_date, invoice_id)).order_by(*OLDEST_FIRST).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page][::-1], per_page, has_prev=len(rows) > per_page, has_next=True)
+
+def offset_page(query, page, per_page):
+    """
+    The page-numbered slice of an Invoice query as a KeysetPage, for links that still use ?page=N
+    Only the requested page pays for the OFFSET; its cursors continue from there by key.
+    """
+    offset = (max(page, 1) - 1) * per_page
+    rows = query.order_by(*NEWEST_FIRST).offset(offset).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], per_page, has_prev=offset > 0, has_next=len(rows) > per_page)
+
+class InvoiceCount:
+    """
+    Approximate number of invoices for listing pages, cached per process for ttl
+    seconds instead of a COUNT(*) on every request. On PostgreSQL, tables whose
+    planner estimate (pg_class.reltuples) is at least exact_limit rows use that
+    estimate, so a cache miss does not scan a large table either.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.ttl = 60.0
+        self.exact_limit = 100000
+        
+        self._count = None
+        self._counted_at = 0.0
+        self._lock = Lock()
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.ttl = app.config.get('INVOICE_COUNT_CACHE_TTL', 60.0)
+        self.exact_limit = app.config.get('INVOICE_COUNT_EXACT_LIMIT', 100000)
+    
+    def get(self):
+        """The cached invoice count, recounted once it is older than ttl; must run inside an app context"""
+        with self._lock:
+            if self._count is not None and time.monotonic() - self._counted_at < self.ttl:
+                return self._count
+        
+        count = self._estimate()
+        if count is None:
+            count = db.session.execute(select(func.count()).select_from(Invoice)).scalar()
+        
+        with self._lock:
+            self._count = count
+            self._counted_at = time.monotonic()
+        return count
+    
+    def invalidate(self):
+        """Recount on the next get()"""
+        with self._lock:
+            self._count = None
+    
+    def _estimate(self):
+        """The planner's row estimate for large PostgreSQL tables, otherwise None"""
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        try:
+            estimate = db.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {'table': Invoice.__tablename__}
+            ).scalar()
+        except Exception as e:
+            logger.warning(f"Could not read the invoice row estimate: {str(e)}")
+            db.session.rollback()
+            return None
+        return estimate if estimate is not None and estimate >= self.exact_limit else None
+
+invoice_count = InvoiceCount()
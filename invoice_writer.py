@@ -0,0 +1,103 @@
+from datetime import datetime
+from sqlalchemy import insert, update
+from models import Invoice, InvoiceLineItem, ProcessingJob
+
+def invoice_row(data, vendor_id, customer_id):
+    """Column values of an Invoice built from validated invoice data"""
+    return {
+        'invoice_number': data['invoice_number'],
+        'invoice_date': datetime.strptime(data['invoice_date'], '%Y-%m-%d').date(),
+        'due_date': datetime.strptime(data['due_date'], '%Y-%m-%d').date() if data.get('due_date') else None,
+        'po_number': data.get('po_number'),
+        'vendor_id': vendor_id,
+        'customer_id': customer_id,
+        'place_of_supply': data.get('place_of_supply'),
+        'subtotal': float(data['subtotal']),
+        'tax_amount': float(data['tax_amount']),
+        'discount': float(data.get('discount', 0)),
+        'total_amount': float(data['total_amount']),
+        'terms': data.get('terms', 'Immediate'),
+        'ocr_confidence': float(data.get('ocr_confidence', 0)),
+        'processing_status': 'completed',
+        'notes': data.get('notes')
+    }
+
+def invoice_from_data(data, vendor_id, customer_id):
+    """Build an Invoice from validated invoice data"""
+    return Invoice(**invoice_row(data, vendor_id, customer_id))
+
+def line_item_rows(invoice_id, line_items, item_ids):
+    """Parameter rows for a bulk INSERT of an invoice's line items; item_ids maps hsn_sac -> Item id"""
+    rows = []
+    for item_data in line_items:
+        hsn_sac = item_data.get('hsn_sac')
+        rows.append({
+            'invoice_id': invoice_id,
+            'item_id': item_ids.get(hsn_sac) if isinstance(hsn_sac, str) else None,
+            'description': item_data['description'],
+            'hsn_sac': hsn_sac,
+            'quantity': float(item_data['quantity']),
+            'rate': float(item_data['rate']),
+            'tax_percentage': float(item_data['tax_percentage']),
+            'tax_amount': float(item_data['tax_amount']),
+            'amount': float(item_data['amount'])
+        })
+    return rows
+
+def save_invoice(session, data, master_data):
+    """
+    Add a validated invoice and its line items to the session's transaction
+    master_data is the ResolvedMasterData the invoice was validated against, so
+    vendor, customer and item ids are not looked up again. Line items go in as one
+    executemany INSERT instead of one ORM object each. Returns the flushed Invoice,
+    or None if the vendor or customer is not in master_data.
+    """
+    vendor = master_data.companies.get(data['vendor']['gstin'])
+    customer = master_data.companies.get(data['customer']['gstin'])
+    if not vendor or not customer:
+        return None
+    
+    invoice = invoice_from_data(data, vendor.id, customer.id)
+    session.add(invoice)
+    session.flush()  # Get the invoice ID
+    
+    session.execute(insert(InvoiceLineItem), line_item_rows(invoice.id, data['line_items'], master_data.items))
+    
+    # Link the processing job that extracted the invoice, if any
+    if 'job_id' in data:
+        link_processing_job(session, data['job_id'], invoice.id)
+    
+    return invoice
+
+def save_invoices(session, invoices, master_data):
+    """
+    Add many validated invoices to the session's transaction with one INSERT for the
+    invoices and one for all of their line items; returns the new ids in input order
+    Every invoice must have passed validate_invoice against master_data.
+    """
+    rows = []
+    for data in invoices:
+        vendor = master_data.companies[data['vendor']['gstin']]
+        customer = master_data.companies[data['customer']['gstin']]
+        rows.append(invoice_row(data, vendor.id, customer.id))
+    
+    invoice_ids = session.execute(
+        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    
+    line_rows = []
+    for invoice_id, data in zip(invoice_ids, invoices):
+        line_rows.extend(line_item_rows(invoice_id, data['line_items'], master_data.items))
+        if 'job_id' in data:
+            link_processing_job(session, data['job_id'], invoice_id)
+    if line_rows:
+        session.execute(insert(InvoiceLineItem), line_rows)
+    
+    return invoice_ids
+
+def link_processing_job(session, job_id, invoice_id):
+    """Record the invoice a processing job was extracted into"""
+    session.execute(
+        update(ProcessingJob).where(ProcessingJob.job_id == job_id).values(invoice_id=invoice_id),
+        execution_options={'synchronize_session': False}
+    )
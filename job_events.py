@@ -0,0 +1,73 @@
+import time
+import logging
+from threading import Condition
+
+logger = logging.getLogger(__name__)
+
+class JobEventBroker:
+    """
+    Process-local notifications of job status transitions.
+    Status streams wait here instead of polling the database; transitions made in
+    other processes (other gunicorn workers, queue workers) are picked up by the
+    periodic recheck the waiters fall back to.
+    """
+    def __init__(self, max_jobs=10000):
+        self._condition = Condition()
+        self._versions = {}  # job_id -> number of transitions seen in this process
+        self._streams = 0
+        self.max_jobs = max_jobs
+    
+    def publish(self, job_id):
+        """Signal that a job changed status"""
+        with self._condition:
+            version = self._versions.pop(job_id, 0) + 1
+            self._versions[job_id] = version
+            
+            # Keep memory bounded by dropping the least recently changed jobs
+            while len(self._versions) > self.max_jobs:
+                self._versions.pop(next(iter(self._versions)))
+            
+            self._condition.notify_all()
+    
+    def version(self, job_id):
+        """Get the current transition counter for a job"""
+        with self._condition:
+            return self._versions.get(job_id, 0)
+    
+    def wait(self, job_id, since_version, timeout):
+        """
+        Block until the job changes after since_version or the timeout expires
+        Returns True if a transition was published
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._versions.get(job_id, 0) == since_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def open_stream(self, limit):
+        """
+        Reserve one of limit concurrent status streams in this process
+        Returns False when all are in use; every True must be paired with close_stream()
+        """
+        with self._condition:
+            if limit and self._streams >= limit:
+                return False
+            self._streams += 1
+            return True
+    
+    def close_stream(self):
+        """Release a stream reserved by open_stream()"""
+        with self._condition:
+            self._streams -= 1
+    
+    @property
+    def open_streams(self):
+        with self._condition:
+            return self._streams
+
+# Shared by the job runner and the status endpoints
+job_events = JobEventBroker()
@@ -0,0 +1,30 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Metrics of the job being processed by the current thread, if any
+_current_metrics = ContextVar('job_metrics', default=None)
+
+@contextmanager
+def collect_job_metrics():
+    """
+    Collect metrics recorded while processing a job
+    Yields the dict that record_metric/add_metric write to
+    """
+    metrics = {}
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+def record_metric(name, value):
+    """Set a metric on the current job; a no-op outside collect_job_metrics"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics[name] = value
+
+def add_metric(name, value):
+    """Add to a counter or timer on the current job; a no-op outside collect_job_metrics"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics[name] = metrics.get(name, 0) + value
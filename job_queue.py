@@ -0,0 +1,215 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func, update
+from models import ProcessingJob, db
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Database-backed queue of ProcessingJob rows.
+    Workers claim jobs by taking a time-limited lease and renew it with heartbeats.
+    Jobs whose lease expires (worker crashed or was killed) are claimed again,
+    up to a maximum number of attempts.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.lease_seconds = 120
+        self.max_attempts = 3
+        self.max_pending = 0
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.lease_seconds = app.config.get('JOB_LEASE_SECONDS', 120)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 3)
+        self.max_pending = app.config.get('JOB_QUEUE_MAX_PENDING', 0)
+    
+    def _claimable(self, now):
+        """Filter for jobs that are waiting or whose lease has expired"""
+        return and_(
+            or_(
+                ProcessingJob.status == 'pending',
+                and_(
+                    ProcessingJob.status == 'processing',
+                    ProcessingJob.lease_expires_at.isnot(None),
+                    ProcessingJob.lease_expires_at < now
+                )
+            ),
+            func.coalesce(ProcessingJob.attempts, 0) < self.max_attempts
+        )
+    
+    def _supports_skip_locked(self):
+        return db.session.get_bind().dialect.name == 'postgresql'
+    
+    def is_full(self, incoming=1):
+        """Check whether adding incoming jobs would exceed the configured pending limit"""
+        if not self.max_pending:
+            return False
+        pending = ProcessingJob.query.filter_by(status='pending').count()
+        return pending + incoming > self.max_pending
+    
+    def claim(self, worker_id):
+        """
+        Claim the oldest available job for a worker
+        Returns a (job_id, file_path) tuple, or None when the queue is empty
+        """
+        now = datetime.utcnow()
+        lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+        
+        if self._supports_skip_locked():
+            # Row locks let many workers claim concurrently without blocking each other
+            job = (ProcessingJob.query
+                   .filter(self._claimable(now))
+                   .order_by(ProcessingJob.id)
+                   .with_for_update(skip_locked=True)
+                   .first())
+            if not job:
+                db.session.rollback()
+                return None
+            
+            job.status = 'processing'
+            job.lease_owner = worker_id
+            job.lease_expires_at = lease_expires_at
+            job.heartbeat_at = now
+            job.attempts = (job.attempts or 0) + 1
+            claimed = (job.job_id, job.file_path)
+            db.session.commit()
+            return claimed
+        
+        # Without SKIP LOCKED, claim with a conditional update and move on if another
+        # worker won the race for the same row
+        candidates = (db.session.query(ProcessingJob.id, ProcessingJob.job_id, ProcessingJob.file_path)
+                      .filter(self._claimable(now))
+                      .order_by(ProcessingJob.id)
+                      .limit(10)
+                      .all())
+        for candidate_id, job_id, file_path in candidates:
+            result = db.session.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id == candidate_id, self._claimable(now))
+                .values(
+                    status='processing',
+                    lease_owner=worker_id,
+                    lease_expires_at=lease_expires_at,
+                    heartbeat_at=now,
+                    attempts=func.coalesce(ProcessingJob.attempts, 0) + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return (job_id, file_path)
+        
+        return None
+    
+    def heartbeat(self, job_id, worker_id):
+        """
+        Extend the lease on a claimed job
+        Returns False if the worker no longer owns the job
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.job_id == job_id,
+                ProcessingJob.lease_owner == worker_id,
+                ProcessingJob.status == 'processing'
+            )
+            .values(
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    
+    def complete(self, job_id, worker_id, results, metrics=None, extractor_id=None):
+        """Store the results, processing metrics and extractor of a claimed job and release its lease"""
+        return self._finish(
+            job_id, worker_id, status='completed', result=json.dumps(results),
+            metrics=json.dumps(metrics) if metrics else None, extractor_id=extractor_id
+        )
+    
+    def fail(self, job_id, worker_id, error_message):
+        """Mark a claimed job as failed and release its lease"""
+        return self._finish(job_id, worker_id, status='error', error_message=error_message)
+    
+    def _finish(self, job_id, worker_id, **values):
+        result = db.session.execute(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.job_id == job_id,
+                ProcessingJob.lease_owner == worker_id,
+                ProcessingJob.status == 'processing'
+            )
+            .values(
+                completed_at=datetime.utcnow(),
+                lease_owner=None,
+                lease_expires_at=None,
+                **values
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        if result.rowcount != 1:
+            logger.warning(f"Worker {worker_id} lost the lease on job {job_id}, discarding its outcome")
+            return False
+        return True
+    
+    def reclaim_expired(self):
+        """
+        Fail jobs whose lease expired after their last allowed attempt
+        Jobs with attempts left are picked up again by claim()
+        Returns the number of jobs marked as failed
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.status == 'processing',
+                ProcessingJob.lease_expires_at.isnot(None),
+                ProcessingJob.lease_expires_at < now,
+                func.coalesce(ProcessingJob.attempts, 0) >= self.max_attempts
+            )
+            .values(
+                status='error',
+                error_message=f'Processing abandoned after {self.max_attempts} attempts',
+                completed_at=now,
+                lease_owner=None,
+                lease_expires_at=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        if result.rowcount:
+            logger.warning(f"Marked {result.rowcount} abandoned jobs as failed")
+        return result.rowcount
+    
+    def get_stats(self):
+        """Get job counts by status and the number of expired leases"""
+        counts = dict(
+            db.session.query(ProcessingJob.status, func.count(ProcessingJob.id))
+            .group_by(ProcessingJob.status)
+            .all()
+        )
+        expired = (ProcessingJob.query
+                   .filter(ProcessingJob.status == 'processing',
+                           ProcessingJob.lease_expires_at < datetime.utcnow())
+                   .count())
+        
+        return {
+            'pending': counts.get('pending', 0),
+            'processing': counts.get('processing', 0),
+            'completed': counts.get('completed', 0),
+            'error': counts.get('error', 0),
+            'expired_leases': expired,
+            'max_pending': self.max_pending
+        }
@@ -0,0 +1,217 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import numpy as np
+
+# Line item fields validate_invoice requires, and the ones that must be non-negative numbers
+LINE_ITEM_REQUIRED_FIELDS = ('description', 'quantity', 'rate', 'tax_percentage', 'amount')
+LINE_ITEM_NUMERIC_FIELDS = ('quantity', 'rate', 'tax_percentage', 'amount')
+
+# Differences up to this many paise between calculated and stated amounts are accepted
+TOLERANCE_PAISE = 5
+
+_PAISE = Decimal('0.01')
+
+LineItemTotals = namedtuple('LineItemTotals', ['subtotal', 'tax_amount'])
+
+def _label(field):
+    return field.replace('_', ' ').title()
+
+def _is_missing(value):
+    """None or a blank string, the line items' notion of a missing field"""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def _missing_mask(column):
+    # _is_missing inlined, as this runs once per row of a column
+    return np.array([value is None or (isinstance(value, str) and not value.strip()) for value in column], dtype=bool)
+
+def _parse_number(value):
+    """The number the row-by-row checks see for a value, or None if it is not a number"""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+class LineItemColumns:
+    """
+    Line items converted once into one column per field: the raw values, a missing
+    mask and, for numeric fields, a float64 array with an invalid mask. Numeric
+    columns are converted by NumPy in one step (which parses strings with float());
+    only columns holding blanks or values that are not numbers are parsed value by value.
+    """
+    def __init__(self, line_items):
+        self.line_items = line_items
+        self.count = len(line_items)
+        self._raw = {}
+        self._missing = {}
+        self._numeric = {}
+    
+    def raw(self, field):
+        """Field values in row order, None where the key is absent or the line item is not a dict"""
+        if field not in self._raw:
+            self._raw[field] = [item.get(field) if isinstance(item, dict) else None for item in self.line_items]
+        return self._raw[field]
+    
+    def missing(self, field):
+        """Rows where the field is absent, None or blank"""
+        if field not in self._missing:
+            self._missing[field] = _missing_mask(self.raw(field))
+        return self._missing[field]
+    
+    def numeric(self, field):
+        """(float64 values, invalid mask) for a field; missing values are NaN and not marked invalid"""
+        if field not in self._numeric:
+            self._numeric[field] = self._convert(field)
+        return self._numeric[field]
+    
+    def _convert(self, field):
+        column = self.raw(field)
+        try:
+            values = np.array(column, dtype=np.float64)
+        except (ValueError, TypeError):
+            values = None  # Blanks, text or nested values somewhere in the column
+        
+        if values is not None and values.shape == (self.count,):
+            # Only None and 'nan' become NaN here, so just those rows need a closer look
+            if field not in self._missing:
+                missing = np.zeros(self.count, dtype=bool)
+                nan_rows = np.flatnonzero(np.isnan(values))
+                missing[nan_rows] = [column[idx] is None for idx in nan_rows.tolist()]
+                self._missing[field] = missing
+            return values, np.zeros(self.count, dtype=bool)
+        
+        # Convert the plain numbers in one step and parse the other values one by one
+        other_rows = [idx for idx, value in enumerate(column) if value.__class__ is not float and value.__class__ is not int]
+        filled = list(column)
+        for idx in other_rows:
+            filled[idx] = 0
+        values = np.array(filled, dtype=np.float64)
+        missing = np.zeros(self.count, dtype=bool)
+        invalid = np.zeros(self.count, dtype=bool)
+        for idx in other_rows:
+            value = column[idx]
+            number = None if _is_missing(value) else _parse_number(value)
+            if number is None:
+                values[idx] = np.nan
+                missing[idx] = _is_missing(value)
+                invalid[idx] = not missing[idx]
+            else:
+                values[idx] = number
+        self._missing.setdefault(field, missing)
+        return values, invalid
+    
+    def to_paise(self, field):
+        """
+        Round a numeric column to whole paise as int64, half up like Decimal.quantize
+        Values with at most two decimals convert exactly in floating point; the few with
+        more decimals are rounded from their decimal representation
+        """
+        values = self.numeric(field)[0]
+        scaled = values * 100
+        paise = np.rint(scaled)
+        inexact = np.abs(scaled - paise) > 8 * np.spacing(np.abs(scaled))
+        paise = paise.astype(np.int64)
+        for idx in np.flatnonzero(inexact):
+            paise[idx] = int(to_paise(self.raw(field)[idx]))
+        return paise
+
+def to_paise(value):
+    """Round an amount to whole paise, half up, through its decimal representation"""
+    amount = Decimal(str(value).strip())
+    if not amount.is_finite():
+        raise InvalidOperation(f"{value} is not a finite amount")
+    return (amount / _PAISE).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+
+def validate_line_items_columnar(line_items, known_hsn, check_line_tax=False):
+    """
+    Validate line items column by column; returns (line_item_errors, columns)
+    line_item_errors has the same {'index', 'errors'} entries, messages and key order
+    as the row-by-row checks in InvoiceFieldValidator.validate_invoice. With
+    check_line_tax, each line's tax_amount must also be a number within
+    TOLERANCE_PAISE of amount * tax_percentage / 100.
+    """
+    extra_fields = ('tax_amount',) if check_line_tax else ()
+    columns = LineItemColumns(line_items)
+    numeric = {field: columns.numeric(field) for field in LINE_ITEM_NUMERIC_FIELDS + extra_fields}
+    
+    # Each check is (field, row mask, message or per-row message function), in the order errors are reported
+    checks = [(field, columns.missing(field), f"{_label(field)} is required")
+              for field in LINE_ITEM_REQUIRED_FIELDS + extra_fields]
+    
+    hsn = columns.raw('hsn_sac')
+    unknown_hsn = np.array([bool(code) and not (isinstance(code, str) and code in known_hsn) for code in hsn], dtype=bool)
+    checks.append(('hsn_sac', unknown_hsn, lambda idx: f"HSN/SAC code {hsn[idx]} not found in master data"))
+    
+    for field in LINE_ITEM_NUMERIC_FIELDS + extra_fields:
+        values, invalid = numeric[field]
+        with np.errstate(invalid='ignore'):
+            negative = values < 0
+        checks.append((field, invalid, f"{_label(field)} must be a number"))
+        checks.append((field, negative, f"{_label(field)} must be a positive number"))
+    
+    if check_line_tax:
+        clean = ~np.logical_or.reduce([mask for _, mask, _ in checks])
+        expected = numeric['amount'][0] * numeric['tax_percentage'][0] / 100
+        with np.errstate(invalid='ignore'):
+            mismatch = clean & (np.abs(numeric['tax_amount'][0] - expected) * 100 > TOLERANCE_PAISE)
+        checks.append(('tax_amount', mismatch, lambda idx: line_tax_error(line_items[idx], expected[idx])))
+    
+    # Build error dicts only for the rows that failed a check; the first message per field wins
+    failed = {}
+    for field, mask, message in checks:
+        for idx in np.flatnonzero(mask).tolist():
+            item_errors = failed.setdefault(idx, {})
+            if field not in item_errors:
+                item_errors[field] = message(idx) if callable(message) else message
+    
+    line_item_errors = [{'index': idx, 'errors': failed[idx]} for idx in sorted(failed)]
+    return line_item_errors, columns
+
+def line_tax_error(item, expected):
+    """Message for a line whose tax_amount is not tax_percentage of its amount"""
+    return f"Tax amount ({item['tax_amount']}) doesn't match {item['tax_percentage']}% of amount ({expected:.2f})"
+
+def line_item_totals(columns):
+    """
+    Sum line amounts and tax amounts in whole paise
+    Returns (LineItemTotals in paise, line_item_errors); lines whose amount or
+    tax_amount cannot be summed (missing, not a number, NaN or infinite) are
+    reported as errors instead of totals
+    """
+    errors = {}
+    for field in ('amount', 'tax_amount'):
+        values = columns.numeric(field)[0]
+        missing = columns.missing(field)  # Set while converting, so this is not another pass
+        for idx in np.flatnonzero(~np.isfinite(values)).tolist():
+            errors.setdefault(idx, {})[field] = f"{_label(field)} is required" if missing[idx] else f"{_label(field)} must be a number"
+    if errors:
+        return None, [{'index': idx, 'errors': errors[idx]} for idx in sorted(errors)]
+    
+    return LineItemTotals(int(columns.to_paise('amount').sum()), int(columns.to_paise('tax_amount').sum())), []
+
+def reconcile_totals(invoice_data, totals, errors):
+    """Compare paise totals with the invoice's subtotal, tax and total, adding mismatches to errors"""
+    stated = {}
+    for field in ('subtotal', 'tax_amount', 'total_amount', 'discount'):
+        try:
+            stated[field] = to_paise(invoice_data.get(field) or 0)
+        except InvalidOperation:
+            errors[field] = f"{_label(field)} must be a number"
+    if len(stated) < 4:
+        return
+    
+    calculated_subtotal = Decimal(totals.subtotal)
+    calculated_tax = Decimal(totals.tax_amount)
+    calculated_total = calculated_subtotal - stated['discount'] + calculated_tax
+    
+    if abs(calculated_subtotal - stated['subtotal']) > TOLERANCE_PAISE:
+        errors['subtotal'] = f"Calculated subtotal ({calculated_subtotal * _PAISE:.2f}) doesn't match invoice subtotal ({invoice_data['subtotal']})"
+    
+    if abs(calculated_tax - stated['tax_amount']) > TOLERANCE_PAISE:
+        errors['tax_amount'] = f"Calculated tax ({calculated_tax * _PAISE:.2f}) doesn't match invoice tax ({invoice_data['tax_amount']})"
+    
+    if abs(calculated_total - stated['total_amount']) > TOLERANCE_PAISE:
+        errors['total_amount'] = f"Calculated total ({calculated_total * _PAISE:.2f}) doesn't match invoice total ({invoice_data['total_amount']})"
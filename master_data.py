@@ -0,0 +1,248 @@
+import time
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from models import Company, MasterDataVersion, db
+
+logger = logging.getLogger(__name__)
+
+# MasterDataVersion row bumped whenever a Company row is written
+COMPANY_VERSION = 'company'
+
+# Incremental refreshes re-read rows updated this long before the newest timestamp
+# already seen, so transactions that commit out of timestamp order are not missed
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+_COMPANY_FIELDS = ['id', 'name', 'gstin', 'address', 'city', 'state', 'pin_code', 'country', 'updated_at']
+_COMPANY_COLUMNS = [getattr(Company, field) for field in _COMPANY_FIELDS]
+
+class CompanyRecord(namedtuple('CompanyRecord', _COMPANY_FIELDS)):
+    """Immutable snapshot of a Company row, safe to share between threads and requests"""
+    __slots__ = ()
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in _COMPANY_FIELDS[:-1]}
+
+def bump_master_data_version(session, name):
+    """Increment a master data version inside the session's current transaction"""
+    result = session.execute(
+        update(MasterDataVersion)
+        .where(MasterDataVersion.name == name)
+        .values(version=MasterDataVersion.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        session.add(MasterDataVersion(name=name, version=1))
+
+class CompanyIndex:
+    """
+    Process-local GSTIN -> company index over the Company master data.
+    The table is loaded once and then refreshed incrementally from Company.updated_at
+    when the shared MasterDataVersion counter changes. Writers bump that counter in
+    the same transaction as the change (see the session hooks below), and each process
+    checks it at most every check_interval seconds, so every gunicorn worker and queue
+    worker picks up master data edits without a company query per lookup.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = True
+        self.check_interval = 5.0
+        
+        self._companies = {}  # gstin -> CompanyRecord
+        self._gstins = {}  # id -> gstin, so a changed GSTIN drops its old key
+        self._version = None  # None until the first load
+        self._watermark = None  # Newest updated_at seen
+        self._checked_at = 0.0
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'version_checks': 0, 'refreshes': 0, 'full_loads': 0, 'errors': 0}
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.enabled = app.config.get('COMPANY_INDEX_ENABLED', True)
+        self.check_interval = app.config.get('COMPANY_INDEX_CHECK_INTERVAL', 5.0)
+    
+    def load(self):
+        """Create the version row if needed and load the full index; must run inside an app context"""
+        if db.session.get(MasterDataVersion, COMPANY_VERSION) is None:
+            try:
+                db.session.add(MasterDataVersion(name=COMPANY_VERSION, version=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()  # Created by another process at the same time
+        
+        with self._lock:
+            self._load_all(self._read_version())
+            self._checked_at = time.monotonic()
+    
+    def get(self, gstin):
+        """Look up a company by GSTIN; returns a CompanyRecord or None"""
+        if not self.enabled or not self._sync():
+            return self._query([gstin]).get(gstin)
+        
+        company = self._companies.get(gstin)
+        with self._lock:
+            self._stats['hits' if company else 'misses'] += 1
+        return company
+    
+    def get_many(self, gstins):
+        """Look up several GSTINs at once; returns {gstin: CompanyRecord} for the ones that exist"""
+        if not self.enabled or not self._sync():
+            return self._query(gstins)
+        
+        companies = self._companies
+        found = {gstin: companies[gstin] for gstin in gstins if gstin in companies}
+        with self._lock:
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(gstins) - len(found)
+        return found
+    
+    def _query(self, gstins):
+        """Look GSTINs up in the database with one query, when the index is disabled or unavailable"""
+        rows = db.session.execute(select(*_COMPANY_COLUMNS).where(Company.gstin.in_(set(gstins)))).all()
+        return {row.gstin: CompanyRecord(*row) for row in rows}
+    
+    def mark_stale(self):
+        """Check the shared version on the next lookup instead of waiting for the interval"""
+        self._checked_at = 0.0
+    
+    def _sync(self):
+        """
+        Bring the index up to date if the check interval has passed
+        Returns False when the index could not be loaded at all
+        """
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return True
+        
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock
+            if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return True
+            
+            try:
+                self._stats['version_checks'] += 1
+                version = self._read_version()
+                if self._version is None:
+                    self._load_all(version)
+                elif version != self._version:
+                    self._refresh(version)
+                self._checked_at = time.monotonic()
+            except SQLAlchemyError as e:
+                # Keep serving the last snapshot; the next lookup tries again
+                self._stats['errors'] += 1
+                logger.warning(f"Could not refresh company index: {str(e)}")
+            return self._version is not None
+    
+    def _read_version(self):
+        version = db.session.execute(
+            select(MasterDataVersion.version).where(MasterDataVersion.name == COMPANY_VERSION)
+        ).scalar()
+        return version or 0
+    
+    def _load_all(self, version):
+        """Replace the index with every company"""
+        rows = db.session.execute(select(*_COMPANY_COLUMNS)).all()
+        companies = {}
+        gstins = {}
+        for row in rows:
+            record = CompanyRecord(*row)
+            companies[record.gstin] = record
+            gstins[record.id] = record.gstin
+        
+        # Swap whole dicts so concurrent lookups never see a partial index
+        self._companies, self._gstins = companies, gstins
+        self._watermark = max((record.updated_at for record in companies.values() if record.updated_at), default=None)
+        self._version = version
+        self._stats['full_loads'] += 1
+        logger.info(f"Loaded {len(companies)} companies into the GSTIN index (version {version})")
+    
+    def _refresh(self, version):
+        """Apply companies changed since the watermark and drop deleted ones"""
+        query = select(*_COMPANY_COLUMNS)
+        if self._watermark is not None:
+            query = query.where(Company.updated_at >= self._watermark - REFRESH_OVERLAP)
+        rows = db.session.execute(query).all()
+        
+        companies = dict(self._companies)
+        gstins = dict(self._gstins)
+        for row in rows:
+            self._apply(CompanyRecord(*row), companies, gstins)
+        
+        # updated_at cannot show deletions, or rows committed behind the watermark,
+        # so reconcile the indexed ids with the ids in the table
+        ids = set(db.session.execute(select(Company.id)).scalars())
+        deleted = gstins.keys() - ids
+        for company_id in deleted:
+            gstin = gstins.pop(company_id)
+            if gstin in companies and companies[gstin].id == company_id:
+                del companies[gstin]
+        
+        missing = ids - gstins.keys()
+        if missing:
+            for row in db.session.execute(select(*_COMPANY_COLUMNS).where(Company.id.in_(missing))).all():
+                self._apply(CompanyRecord(*row), companies, gstins)
+        
+        self._companies, self._gstins = companies, gstins
+        self._version = version
+        self._stats['refreshes'] += 1
+        logger.info(f"Refreshed {len(rows) + len(missing)} and removed {len(deleted)} companies in the GSTIN index (version {version})")
+    
+    def _apply(self, record, companies, gstins):
+        """Add or replace a company in index dicts being rebuilt, advancing the watermark"""
+        old_gstin = gstins.get(record.id)
+        if old_gstin is not None and old_gstin != record.gstin:
+            companies.pop(old_gstin, None)
+        companies[record.gstin] = record
+        gstins[record.id] = record.gstin
+        if record.updated_at and (self._watermark is None or record.updated_at > self._watermark):
+            self._watermark = record.updated_at
+    
+    def get_stats(self):
+        """Get index size, version and lookup counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['companies'] = len(self._companies)
+        stats['version'] = self._version
+        stats['watermark'] = self._watermark.isoformat() if self._watermark else None
+        stats['check_interval'] = self.check_interval
+        return stats
+
+# Shared by every validator and route in the process
+company_index = CompanyIndex()
+
+@event.listens_for(Session, 'before_flush')
+def _bump_company_version_on_flush(session, flush_context, instances):
+    """Bump the company version in the transaction that adds, edits or deletes companies"""
+    changed = any(isinstance(obj, Company) for obj in session.new) or \
+        any(isinstance(obj, Company) and session.is_modified(obj) for obj in session.dirty) or \
+        any(isinstance(obj, Company) for obj in session.deleted)
+    if changed:
+        bump_master_data_version(session, COMPANY_VERSION)
+        session.info['company_changed'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_company_version_on_bulk_write(orm_execute_state):
+    """Bump the company version for bulk query.update()/delete() on companies"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is Company:
+        bump_master_data_version(orm_execute_state.session, COMPANY_VERSION)
+        orm_execute_state.session.info['company_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_company_index_after_commit(session):
+    """Make this process see its own company changes on the next lookup"""
+    if session.info.pop('company_changed', False):
+        company_index.mark_stale()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_company_changes(session):
+    session.info.pop('company_changed', None)
@@ -1,6 +1,13 @@
+import logging
 from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
 
+logger = logging.getLogger(__name__)
+
 class Company(db.Model):
     """Model for company data (vendors and customers)"""
     id = db.Column(db.Integer, primary_key=True)
@@ -12,7 +19,7 @@ class Company(db.Model):
     pin_code = db.Column(db.String(10))
     country = db.Column(db.String(100), default="India")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Drives CompanyIndex refreshes
     
     def to_dict(self):
         return {
@@ -30,7 +37,7 @@ class Item(db.Model):
     """Model for inventory items"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
-    hsn_sac = db.Column(db.String(20), nullable=False)
+    hsn_sac = db.Column(db.String(20), nullable=False, index=True)  # Looked up for every line item
     description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -45,6 +52,11 @@ class Item(db.Model):
 
 class Invoice(db.Model):
     """Model for invoice data"""
+    __table_args__ = (
+        db.Index('ix_invoice_date_id', 'invoice_date', 'id'),  # Listing order, see invoice_pagination
+        db.Index('ix_invoice_updated_at_id', 'updated_at', 'id'),  # Incremental export order, see invoice_export
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
     invoice_date = db.Column(db.Date, nullable=False)
@@ -72,7 +84,7 @@ class Invoice(db.Model):
     processing_status = db.Column(db.String(20), default="pending")  # pending, processing, completed, error
     validation_errors = db.Column(db.Text, nullable=True)  # JSON string of validation errors
     
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Dashboard order
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -104,7 +116,7 @@ class Invoice(db.Model):
 class InvoiceLineItem(db.Model):
     """Model for invoice line items"""
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False, index=True)
     
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=True)
     item = db.relationship('Item')
@@ -133,17 +145,56 @@ class InvoiceLineItem(db.Model):
             'item': self.item.to_dict() if self.item else None
         }
 
+def invoice_list_options():
+    """Loader options for pages that show each invoice's vendor and customer, joined into the invoice query"""
+    return (joinedload(Invoice.vendor), joinedload(Invoice.customer))
+
+def invoice_detail_options():
+    """
+    Loader options for everything Invoice.to_dict() reads: vendor and customer are joined,
+    line items and their master data items come in one extra SELECT ... IN per page
+    """
+    return invoice_list_options() + (selectinload(Invoice.line_items).joinedload(InvoiceLineItem.item),)
+
+class MasterDataVersion(db.Model):
+    """Change counter per master data table, bumped in the same transaction as the change"""
+    name = db.Column(db.String(50), primary_key=True)  # e.g. "company"
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UploadedDocument(db.Model):
+    """Model for stored upload files, deduplicated by content hash"""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest of the file bytes
+    file_path = db.Column(db.String(255), unique=True, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ProcessingJob(db.Model):
     """Model for tracking OCR processing jobs"""
+    __table_args__ = (
+        db.Index('ix_processing_job_status_id', 'status', 'id'),  # Queue claims and status counts, see JobQueue
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.String(50), unique=True, nullable=False)
     file_path = db.Column(db.String(255), nullable=False)
     status = db.Column(db.String(20), default="pending")  # pending, processing, completed, error
     result = db.Column(db.Text, nullable=True)  # JSON string of OCR results
     error_message = db.Column(db.Text, nullable=True)
-    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    metrics = db.Column(db.Text, nullable=True)  # JSON string of processing metrics (payload sizes, timings)
+    batch_id = db.Column(db.String(50), nullable=True, index=True)  # Shared by jobs from one batch upload
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # See UploadedDocument
+    extractor_id = db.Column(db.String(64), nullable=True)  # Extraction that produced result, see InvoiceOCRProcessor.extractor_id
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Dashboard order and job status time ranges
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    # Lease metadata used by queue workers to claim jobs and recover from crashes
+    attempts = db.Column(db.Integer, default=0)
+    lease_owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    
     invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=True)
     invoice = db.relationship('Invoice')
     
@@ -154,7 +205,86 @@ class ProcessingJob(db.Model):
             'file_path': self.file_path,
             'status': self.status,
             'error_message': self.error_message,
+            'batch_id': self.batch_id,
+            'content_hash': self.content_hash,
             'started_at': self.started_at.isoformat(),
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'attempts': self.attempts,
             'invoice_id': self.invoice_id
         }
+
+def add_missing_columns(bind):
+    """
+    Add the model columns an existing table does not have yet, returning their "table.column" names
+    db.create_all() never alters existing tables, so columns added to a model would
+    otherwise be missing from databases created before them, and every ORM query on
+    that model would fail. Columns are added as nullable, with the model's scalar default
+    for existing rows where it has one; constraints other than the type are not added.
+    """
+    inspector = inspect(bind)
+    preparer = bind.dialect.identifier_preparer
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=bind.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, (int, float, str)) and not isinstance(default, bool):
+                ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+            try:
+                with bind.begin() as connection:
+                    connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+            except Exception as e:
+                # Another process may be adding the same column
+                logger.warning(f"Could not add column {table.name}.{column.name}: {str(e)}")
+    return added
+
+def missing_indexes(bind):
+    """Return the model indexes an existing database does not have yet"""
+    inspector = inspect(bind)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+def create_missing_indexes(bind):
+    """
+    Create the model indexes an existing database does not have yet, returning their names
+    db.create_all() only creates indexes along with new tables, so indexes added to
+    existing models would otherwise never reach databases created before them. On
+    PostgreSQL each index is built with CREATE INDEX CONCURRENTLY outside a transaction,
+    so writes to the table continue while it is built. An index that cannot be created
+    is logged and skipped; a half-built PostgreSQL index is dropped so the next run retries it.
+    """
+    postgresql = bind.dialect.name == 'postgresql'
+    created = []
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for index in missing_indexes(bind):
+            # Set for this statement only: create_all() runs in a transaction, where CONCURRENTLY is not allowed
+            index.dialect_options['postgresql']['concurrently'] = postgresql
+            try:
+                index.create(connection)
+                created.append(index.name)
+            except Exception as e:
+                logger.warning(f"Could not create index {index.name}: {str(e)}")
+                if postgresql:
+                    # A failed concurrent build leaves an INVALID index behind under the same name
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {bind.dialect.identifier_preparer.quote(index.name)}"))
+            finally:
+                index.dialect_options['postgresql']['concurrently'] = False
+    return created
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes_command():
+    """Create missing model indexes, concurrently on PostgreSQL. Run once after deploying new indexes."""
+    created = create_missing_indexes(db.engine)
+    click.echo(f"Created indexes: {', '.join(created)}" if created else "No missing indexes created", err=True)
@@ -0,0 +1,181 @@
+import logging
+import threading
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # Optional, falls back to the pytesseract engine
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# Tesseract configuration for structured output
+TESSERACT_CONFIG = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
+
+# Keys of the word-level data dict, matching pytesseract.Output.DICT
+OCR_DATA_KEYS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                 'left', 'top', 'width', 'height', 'conf', 'text')
+
+def text_from_ocr_data(ocr_data):
+    """
+    Rebuild plain text from word-level OCR data
+    Words on a line are joined by spaces, lines by newlines and paragraphs by a blank line
+    """
+    lines = []
+    current_key = None
+    current_paragraph = None
+    words = []
+    
+    for i, text in enumerate(ocr_data['text']):
+        if ocr_data['level'][i] != 5 or not text or not text.strip():
+            continue
+        
+        line_key = (ocr_data['page_num'][i], ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+        if line_key != current_key:
+            if words:
+                lines.append(' '.join(words))
+            paragraph = line_key[:3]
+            if current_paragraph is not None and paragraph != current_paragraph:
+                lines.append('')
+            current_key = line_key
+            current_paragraph = paragraph
+            words = []
+        words.append(text.strip())
+    
+    if words:
+        lines.append(' '.join(words))
+    
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def merge_page_ocr(page_results):
+    """
+    Combine per-page OCR output into a single document
+    page_results is a list of (page_number, raw_text, ocr_data) in page order.
+    Texts are concatenated so that sections such as line-item tables continue
+    across page breaks, and word data is tagged with its page number.
+    """
+    ocr_data = {key: [] for key in OCR_DATA_KEYS}
+    texts = []
+    
+    for page_number, raw_text, page_data in page_results:
+        texts.append(raw_text.rstrip('\n'))
+        for key in OCR_DATA_KEYS:
+            if key == 'page_num':
+                ocr_data[key].extend([page_number] * len(page_data['text']))
+            else:
+                ocr_data[key].extend(page_data[key])
+    
+    return '\n'.join(texts) + '\n', ocr_data
+
+class PytesseractEngine:
+    """
+    OCR engine that runs the tesseract CLI once per page via pytesseract
+    and derives the raw text from the word-level data of that single pass
+    """
+    name = 'pytesseract'
+    
+    def __init__(self, config=TESSERACT_CONFIG):
+        self.config = config
+    
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+    
+    def recognize(self, image):
+        """
+        Run OCR on a PIL image
+        Returns (raw_text, ocr_data) where ocr_data matches pytesseract.Output.DICT
+        """
+        ocr_data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        return text_from_ocr_data(ocr_data), ocr_data
+
+class TesserocrEngine:
+    """
+    OCR engine backed by a long-lived in-process Tesseract API instance per thread.
+    The model is loaded once per worker thread instead of once per call, and a
+    single recognition pass yields both the word-level data and the raw text.
+    """
+    name = 'tesserocr'
+    
+    def __init__(self, tessdata_path=None, language='eng'):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.tessdata_path = tessdata_path
+        self.language = language
+        self._local = threading.local()
+    
+    def version(self):
+        return tesserocr.tesseract_version().split('\n')[0]
+    
+    def _get_api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            options = {'lang': self.language, 'psm': tesserocr.PSM.SINGLE_BLOCK, 'oem': tesserocr.OEM.DEFAULT}
+            if self.tessdata_path:
+                options['path'] = self.tessdata_path
+            api = tesserocr.PyTessBaseAPI(**options)
+            api.SetVariable('preserve_interword_spaces', '1')
+            self._local.api = api
+            logger.info(f"Initialized Tesseract API for thread {threading.current_thread().name}")
+        return api
+    
+    def recognize(self, image):
+        """
+        Run OCR on a PIL image
+        Returns (raw_text, ocr_data) where ocr_data matches pytesseract.Output.DICT
+        """
+        api = self._get_api()
+        api.SetImage(image)
+        api.Recognize()
+        raw_text = api.GetUTF8Text()
+        
+        ocr_data = {key: [] for key in OCR_DATA_KEYS}
+        block_num = par_num = line_num = word_num = 0
+        level = tesserocr.RIL.WORD
+        
+        iterator = api.GetIterator()
+        words = tesserocr.iterate_level(iterator, level) if iterator else []
+        for word in words:
+            if word.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block_num += 1
+                par_num = line_num = 0
+            if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par_num += 1
+                line_num = 0
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line_num += 1
+                word_num = 0
+            word_num += 1
+            
+            bounding_box = word.BoundingBox(level)
+            if bounding_box is None:
+                continue
+            left, top, right, bottom = bounding_box
+            
+            ocr_data['level'].append(5)
+            ocr_data['page_num'].append(1)
+            ocr_data['block_num'].append(block_num)
+            ocr_data['par_num'].append(par_num)
+            ocr_data['line_num'].append(line_num)
+            ocr_data['word_num'].append(word_num)
+            ocr_data['left'].append(left)
+            ocr_data['top'].append(top)
+            ocr_data['width'].append(right - left)
+            ocr_data['height'].append(bottom - top)
+            ocr_data['conf'].append(round(word.Confidence(level), 2))
+            ocr_data['text'].append(word.GetUTF8Text(level) or '')
+        
+        api.Clear()
+        return raw_text, ocr_data
+
+def create_ocr_engine(name='auto', tessdata_path=None):
+    """
+    Create the OCR engine selected by name: 'tesserocr', 'pytesseract',
+    or 'auto' to use tesserocr when it is installed
+    """
+    if name in ('auto', 'tesserocr') and tesserocr is not None:
+        return TesserocrEngine(tessdata_path=tessdata_path)
+    
+    if name == 'tesserocr':
+        raise RuntimeError("OCR_ENGINE is set to tesserocr but tesserocr is not installed")
+    
+    return PytesseractEngine()
@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import multiprocessing
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from job_metrics import collect_job_metrics, record_metric
+from image_preprocessor import preprocess_settings
+
+logger = logging.getLogger(__name__)
+
+def available_cores():
+    """Number of CPUs this process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker_ocr = None
+
+def _init_worker(settings):
+    """
+    Configure thread budgets and warm up the OCR engine in a new worker process
+    Only the OCR pipeline is built; the Flask app and database are never loaded here
+    """
+    global _worker_ocr
+    threads = str(settings['threads'])
+    
+    # Set before Tesseract is loaded so its OpenMP runtime (and the tesseract CLI)
+    # stays within this worker's budget
+    os.environ['OMP_THREAD_LIMIT'] = threads
+    os.environ['OMP_NUM_THREADS'] = threads
+    
+    import cv2
+    from document_ocr import DocumentOCR
+    
+    cv2.setNumThreads(settings['threads'])
+    
+    # Each worker handles one document at a time, so pages are OCRed on its own thread
+    document_ocr = DocumentOCR(
+        engine=settings['engine'],
+        tessdata_path=settings['tessdata_path'],
+        document_dpi=settings['document_dpi'],
+        skip_blank_pages=settings['skip_blank_pages'],
+        page_workers=1,
+        preprocess=settings['preprocess']
+    )
+    document_ocr.warm_up()
+    _worker_ocr = document_ocr
+    logger.info(f"OCR worker process {os.getpid()} ready")
+
+def _ocr_document(file_path):
+    """
+    Run standard OCR on a document inside a worker process
+    Metrics recorded by the worker (preprocessing timings, peak memory) are returned with the stats
+    """
+    start_times = os.times()
+    start = time.perf_counter()
+    
+    with collect_job_metrics() as metrics:
+        extracted_data, page_count = _worker_ocr.ocr_document(file_path)
+    
+    end_times = os.times()
+    # Include reaped child processes, where the pytesseract engine does its work
+    cpu_seconds = sum(end_times[:4]) - sum(start_times[:4])
+    return extracted_data, {
+        'pages': page_count,
+        'cpu_seconds': cpu_seconds,
+        'wall_seconds': time.perf_counter() - start,
+        'metrics': metrics
+    }
+
+class OCRProcessPool:
+    """
+    Pool of warm OCR worker processes for CPU-bound preprocessing, recognition and extraction.
+    Each worker loads the OCR engine once and is limited to a fixed number of OpenCV/OpenMP
+    threads, so workers * threads matches the available cores instead of oversubscribing them.
+    Job bookkeeping stays on the calling threads; only file paths and results cross processes.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.workers = available_cores()
+        self.threads_per_worker = 1
+        self.settings = {}
+        
+        self._executor = None
+        self._lock = Lock()
+        self._stats = {'documents': 0, 'pages': 0, 'errors': 0, 'cpu_seconds': 0.0, 'wall_seconds': 0.0, 'restarts': 0}
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.threads_per_worker = max(1, app.config.get('OCR_PROCESS_THREADS', 1))
+        self.workers = app.config.get('OCR_PROCESS_WORKERS') or max(1, available_cores() // self.threads_per_worker)
+        self.settings = {
+            'engine': app.config.get('OCR_ENGINE', 'auto'),
+            'tessdata_path': app.config.get('OCR_TESSDATA_PATH'),
+            'document_dpi': app.config.get('DOCUMENT_DPI', 200),
+            'skip_blank_pages': app.config.get('DOCUMENT_SKIP_BLANK_PAGES', True),
+            'preprocess': preprocess_settings(app.config),
+            'threads': self.threads_per_worker
+        }
+    
+    def _get_executor(self):
+        """Start the worker processes on first use"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.settings,)
+                )
+                logger.info(f"Started OCR process pool with {self.workers} workers x {self.threads_per_worker} threads")
+            return self._executor
+    
+    def _discard_executor(self, executor):
+        """Drop a broken pool (e.g. a worker was OOM-killed) so the next job starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._stats['restarts'] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def run(self, file_path):
+        """
+        OCR a document in a worker process and wait for its extracted data
+        Exceptions raised in the worker are re-raised in the caller
+        """
+        executor = self._get_executor()
+        try:
+            extracted_data, stats = executor.submit(_ocr_document, file_path).result()
+        except BrokenProcessPool:
+            logger.error("OCR process pool is broken, restarting it")
+            self._discard_executor(executor)
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        
+        with self._lock:
+            self._stats['documents'] += 1
+            self._stats['pages'] += stats['pages']
+            self._stats['cpu_seconds'] += stats['cpu_seconds']
+            self._stats['wall_seconds'] += stats['wall_seconds']
+        
+        for name, value in stats['metrics'].items():
+            record_metric(name, value)
+        record_metric('ocr_pages', stats['pages'])
+        record_metric('ocr_cpu_seconds', round(stats['cpu_seconds'], 3))
+        return extracted_data
+    
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+    
+    def get_stats(self):
+        """Get pool size and throughput in pages per second per core"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = self._executor is not None
+        
+        stats['workers'] = self.workers
+        stats['threads_per_worker'] = self.threads_per_worker
+        stats['cpu_seconds'] = round(stats['cpu_seconds'], 3)
+        stats['wall_seconds'] = round(stats['wall_seconds'], 3)
+        stats['pages_per_second_per_core'] = (
+            round(stats['pages'] / stats['cpu_seconds'], 3) if stats['cpu_seconds'] else None
+        )
+        return stats
+
+# Shared by every processor instance in the process
+ocr_process_pool = OCRProcessPool()
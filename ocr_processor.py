@@ -1,28 +1,46 @@
 import os
 import uuid
+import hashlib
 import logging
 import time
 import json
-import re
 from datetime import datetime
-import pytesseract
-from PIL import Image
-import cv2
-import numpy as np
-from openai_processor import OpenAIInvoiceProcessor
+from openai_processor import OpenAIInvoiceProcessor, OPENAI_MODEL
+from extraction_cache import extraction_cache, file_sha256
+from document_ocr import DocumentOCR, document_ocr_settings
+from job_queue import JobQueue
+from job_events import job_events
+from ocr_pool import ocr_process_pool
+from job_metrics import collect_job_metrics
 
-# Set the path to the Tesseract executable
-pytesseract.pytesseract.tesseract_cmd = '/nix/store/44vcjbcy1p2yhc974bcw250k2r5x5cpa-tesseract-5.3.4/bin/tesseract'
+# Bump when preprocessing or invoice_extractor/table_extractor output changes so cached extractions are recomputed
+EXTRACTOR_VERSION = "6"
 
 # Initialize OpenAI processor
 openai_processor = OpenAIInvoiceProcessor()
 from werkzeug.utils import secure_filename
-from threading import Thread
+from threading import BoundedSemaphore, Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-from models import ProcessingJob, db
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import ProcessingJob, UploadedDocument, db
 
 logger = logging.getLogger(__name__)
 
+class ProcessingQueueFull(Exception):
+    """Raised when the OCR worker pool cannot accept more jobs"""
+    def __init__(self, retry_after):
+        super().__init__("OCR processing queue is full")
+        self.retry_after = retry_after
+
+class BatchTooLarge(Exception):
+    """Raised when a batch has more new documents than the OCR pool can ever hold at once"""
+    def __init__(self, limit):
+        super().__init__(f"Batch exceeds the OCR capacity of {limit} documents")
+        self.limit = limit
+
 class InvoiceOCRProcessor:
     """
     Class for processing invoice images with OCR and extracting structured data
@@ -30,6 +48,22 @@ class InvoiceOCRProcessor:
     def __init__(self, app=None):
         self.app = app
         self.confidence_threshold = 80
+        self.max_workers = 2
+        self.queue_size = 50
+        self.backlog_size = 10000
+        self.retry_after = 10
+        self.execution_mode = 'thread'
+        self.job_queue = JobQueue()
+        self.document_ocr = DocumentOCR()
+        
+        # Worker pool state, created lazily on the first submitted job
+        self._executor = None
+        self._slots = None
+        self._pool_lock = Lock()
+        self._active_workers = 0
+        self._in_flight = 0
+        self._backlog = deque()
+        self._backlogged = 0
         
         if app:
             self.init_app(app)
@@ -39,6 +73,13 @@ class InvoiceOCRProcessor:
         self.app = app
         self.confidence_threshold = app.config.get('OCR_CONFIDENCE_THRESHOLD', 80)
         self.upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+        self.max_workers = max(1, app.config.get('OCR_MAX_WORKERS', 2))
+        self.queue_size = max(0, app.config.get('OCR_QUEUE_SIZE', 50))
+        self.backlog_size = max(0, app.config.get('OCR_BATCH_BACKLOG_SIZE', 10000))
+        self.retry_after = app.config.get('OCR_RETRY_AFTER', 10)
+        self.execution_mode = app.config.get('OCR_EXECUTION_MODE', 'thread')
+        self.job_queue.init_app(app)
+        self.document_ocr = DocumentOCR(**document_ocr_settings(app.config))
         
         # Ensure upload folder exists
         os.makedirs(self.upload_folder, exist_ok=True)
@@ -47,37 +88,309 @@ class InvoiceOCRProcessor:
         if openai_processor:
             openai_processor.init_app(app)
     
+    def _unique_upload_path(self, filename):
+        """Build a collision-free path in the upload folder"""
+        unique_filename = f"{uuid.uuid4()}_{secure_filename(filename)}"
+        return os.path.join(self.upload_folder, unique_filename)
+    
     def save_uploaded_file(self, file_obj):
         """Save an uploaded file and return the path"""
         if not file_obj:
             return None
-            
-        filename = secure_filename(file_obj.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(self.upload_folder, unique_filename)
-        file_obj.save(file_path)
+        
+        return self.save_file_stream(file_obj.stream, file_obj.filename)
+    
+    def save_file_stream(self, stream, filename):
+        """
+        Copy a readable binary stream (an upload or a ZIP member) to the upload folder and return the path
+        The content is hashed while it is written; if identical content was stored before,
+        the new copy is discarded and the path of the stored file is returned instead
+        """
+        file_path = self._unique_upload_path(filename)
+        hasher = hashlib.sha256()
+        size = 0
+        
+        with open(file_path, 'wb') as out:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        
+        return self._register_document(file_path, hasher.hexdigest(), size)
+    
+    def _register_document(self, file_path, content_hash, size):
+        """Record a stored file under its content hash, reusing an existing copy when there is one"""
+        existing = UploadedDocument.query.filter_by(content_hash=content_hash).first()
+        if existing and os.path.exists(existing.file_path):
+            os.remove(file_path)
+            return existing.file_path
+        
+        if existing:
+            # The stored copy was removed from disk, keep the new one in its place
+            existing.file_path = file_path
+            existing.size_bytes = size
+        else:
+            db.session.add(UploadedDocument(content_hash=content_hash, file_path=file_path, size_bytes=size))
+        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the same content at the same time
+            db.session.rollback()
+            existing = UploadedDocument.query.filter_by(content_hash=content_hash).first()
+            if not existing:
+                raise
+            os.remove(file_path)
+            return existing.file_path
+        
         return file_path
     
-    def process_async(self, file_path):
-        """Start asynchronous processing of an invoice image"""
-        job_id = str(uuid.uuid4())
+    def discard_uploads(self, file_paths):
+        """Delete stored uploads that no processing job refers to"""
+        file_paths = set(file_paths)
+        if not file_paths:
+            return
+        
+        referenced = {path for (path,) in db.session.query(ProcessingJob.file_path)
+                      .filter(ProcessingJob.file_path.in_(file_paths))
+                      .distinct()}
+        unreferenced = file_paths - referenced
+        if not unreferenced:
+            return
         
-        # Create a processing job record
+        UploadedDocument.query.filter(UploadedDocument.file_path.in_(unreferenced)).delete(synchronize_session=False)
+        db.session.commit()
+        for file_path in unreferenced:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    
+    def _get_executor(self):
+        """Create the worker pool on first use"""
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='ocr-worker'
+                )
+                # One slot per running job plus one per queued job
+                self._slots = BoundedSemaphore(self.max_workers + self.queue_size)
+            return self._executor
+    
+    def process_async(self, file_path, batch_id=None):
+        """
+        Start asynchronous processing of an invoice image
+        The file takes a free worker slot directly, or queues behind batch jobs already waiting in the backlog
+        Raises ProcessingQueueFull when every worker is busy and the queue is full
+        """
+        return self.process_batch_async([file_path], batch_id=batch_id, use_backlog=False)[0]
+    
+    def batch_limit(self):
+        """Most new documents a single batch can have, or None when unlimited"""
+        if self.execution_mode == 'queue':
+            return self.job_queue.max_pending or None
+        return self.max_workers + self.queue_size + self.backlog_size
+    
+    def process_batch_async(self, file_paths, batch_id=None, use_backlog=True):
+        """
+        Start asynchronous processing of several invoice images
+        The batch is accepted or rejected as a whole; returns the list of job ids
+        Files whose content was already processed complete immediately with the stored result
+        New files are recorded as pending jobs in a backlog that is fed to the worker pool
+        as slots free up; with use_backlog=False every new file needs a free slot instead,
+        unless jobs are already backlogged, so single uploads cannot starve waiting batches
+        Raises BatchTooLarge when the batch has more new files than batch_limit() and
+        ProcessingQueueFull when there is not enough capacity for every new file right now
+        """
         with self.app.app_context():
+            content_hashes, stored_results = self._find_processed_duplicates(file_paths)
+        new_paths = [path for path in file_paths if content_hashes.get(path) not in stored_results]
+        
+        limit = self.batch_limit()
+        if limit is not None and len(new_paths) > limit:
+            raise BatchTooLarge(limit)
+        
+        if self.execution_mode == 'queue':
+            with self.app.app_context():
+                if new_paths and self.job_queue.is_full(len(new_paths)):
+                    raise ProcessingQueueFull(self.retry_after)
+                jobs = self._create_jobs(file_paths, batch_id, content_hashes, stored_results)
+            return [job_id for job_id, _, _ in jobs]
+        
+        executor = self._get_executor()
+        with self._pool_lock:
+            use_backlog = use_backlog or self._backlogged > 0
+        if use_backlog:
+            return self._backlog_batch(file_paths, batch_id, content_hashes, stored_results, len(new_paths))
+        
+        acquired = 0
+        for _ in new_paths:
+            if not self._slots.acquire(blocking=False):
+                for _ in range(acquired):
+                    self._slots.release()
+                raise ProcessingQueueFull(self.retry_after)
+            acquired += 1
+        
+        try:
+            with self.app.app_context():
+                jobs = self._create_jobs(file_paths, batch_id, content_hashes, stored_results)
+            
+            with self._pool_lock:
+                self._in_flight += acquired
+        except Exception:
+            for _ in range(acquired):
+                self._slots.release()
+            raise
+        
+        # Hand the jobs that still need processing to the worker pool
+        for job_id, file_path, needs_processing in jobs:
+            if needs_processing:
+                executor.submit(self._run_pooled_job, job_id, file_path)
+        
+        return [job_id for job_id, _, _ in jobs]
+    
+    def _backlog_batch(self, file_paths, batch_id, content_hashes, stored_results, new_count):
+        """Record a batch as pending jobs and queue the new ones behind the worker pool"""
+        # Reserve backlog room before creating jobs so concurrent batches cannot overfill it
+        with self._pool_lock:
+            if self._in_flight + self._backlogged + new_count > self.batch_limit():
+                raise ProcessingQueueFull(self.retry_after)
+            self._backlogged += new_count
+        
+        try:
+            with self.app.app_context():
+                jobs = self._create_jobs(file_paths, batch_id, content_hashes, stored_results)
+        except Exception:
+            with self._pool_lock:
+                self._backlogged -= new_count
+            raise
+        
+        with self._pool_lock:
+            self._backlog.extend((job_id, file_path) for job_id, file_path, needs_processing in jobs if needs_processing)
+        self._feed_backlog()
+        
+        return [job_id for job_id, _, _ in jobs]
+    
+    def _feed_backlog(self):
+        """Move backlogged jobs onto the worker pool while it has free slots"""
+        while True:
+            with self._pool_lock:
+                if not self._backlog or not self._slots.acquire(blocking=False):
+                    return
+                job_id, file_path = self._backlog.popleft()
+                self._backlogged -= 1
+                self._in_flight += 1
+            self._executor.submit(self._run_pooled_job, job_id, file_path)
+    
+    def _find_processed_duplicates(self, file_paths):
+        """
+        Look up the content hash of each stored file and, for each hash, the latest result
+        completed by the extraction currently in use (see extractor_id)
+        Returns (file_path -> content_hash, content_hash -> result JSON)
+        """
+        content_hashes = dict(
+            db.session.query(UploadedDocument.file_path, UploadedDocument.content_hash)
+            .filter(UploadedDocument.file_path.in_(set(file_paths)))
+            .all()
+        )
+        if not content_hashes:
+            return content_hashes, {}
+        
+        try:
+            extractor_id = self.extractor_id()
+        except Exception as e:
+            # E.g. no OCR engine on a web tier that only queues jobs; process the files instead
+            logger.warning(f"Not reusing stored results, the current extractor is unknown: {str(e)}")
+            return content_hashes, {}
+        
+        latest_jobs = (db.session.query(func.max(ProcessingJob.id))
+                       .filter(ProcessingJob.content_hash.in_(set(content_hashes.values())),
+                               ProcessingJob.status == 'completed',
+                               ProcessingJob.extractor_id == extractor_id,
+                               ProcessingJob.result.isnot(None))
+                       .group_by(ProcessingJob.content_hash))
+        stored_results = dict(
+            db.session.query(ProcessingJob.content_hash, ProcessingJob.result)
+            .filter(ProcessingJob.id.in_(latest_jobs))
+            .all()
+        )
+        return content_hashes, stored_results
+    
+    def _create_jobs(self, file_paths, batch_id=None, content_hashes=None, stored_results=None):
+        """
+        Create processing job records in a single transaction
+        Returns a list of (job_id, file_path, needs_processing) tuples
+        """
+        content_hashes = content_hashes or {}
+        stored_results = stored_results or {}
+        now = datetime.utcnow()
+        jobs = []
+        
+        for file_path in file_paths:
+            job_id = str(uuid.uuid4())
+            content_hash = content_hashes.get(file_path)
             job = ProcessingJob(
                 job_id=job_id,
                 file_path=file_path,
-                status="pending"
+                status="pending",
+                batch_id=batch_id,
+                content_hash=content_hash
             )
+            
+            # Same bytes were processed before, reuse that result
+            if content_hash in stored_results:
+                job.status = "completed"
+                job.result = stored_results[content_hash]
+                job.extractor_id = self.extractor_id()
+                job.started_at = now
+                job.completed_at = now
+                logger.info(f"Job {job_id} reuses the stored result for content {content_hash[:12]}")
+            
             db.session.add(job)
-            db.session.commit()
+            jobs.append((job_id, file_path, job.status == "pending"))
         
-        # Start processing in a background thread
-        thread = Thread(target=self._process_invoice_job, args=(job_id, file_path))
-        thread.daemon = True
-        thread.start()
+        db.session.commit()
+        return jobs
+    
+    def _run_pooled_job(self, job_id, file_path):
+        """Run a job on a pool worker and free its slot when done"""
+        with self._pool_lock:
+            self._active_workers += 1
+        try:
+            self._process_invoice_job(job_id, file_path)
+        finally:
+            with self._pool_lock:
+                self._active_workers -= 1
+                self._in_flight -= 1
+            self._slots.release()
+            self._feed_backlog()
+    
+    def get_queue_stats(self):
+        """Get the current worker pool utilisation"""
+        if self.execution_mode == 'queue':
+            with self.app.app_context():
+                return dict(self.job_queue.get_stats(), mode='queue')
+        
+        with self._pool_lock:
+            active = self._active_workers
+            in_flight = self._in_flight
+            backlogged = self._backlogged
         
-        return job_id
+        stats = {
+            'mode': self.execution_mode,
+            'max_workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'active_workers': active,
+            'queue_depth': in_flight - active,
+            'available_slots': self.max_workers + self.queue_size - in_flight,
+            'backlog_depth': backlogged,
+            'backlog_size': self.backlog_size
+        }
+        if self.execution_mode == 'process':
+            stats['process_pool'] = ocr_process_pool.get_stats()
+        return stats
     
     def _process_invoice_job(self, job_id, file_path):
         """Background task to process an invoice image"""
@@ -91,15 +404,20 @@ class InvoiceOCRProcessor:
                 
                 job.status = "processing"
                 db.session.commit()
+                job_events.publish(job_id)
                 
                 # Process the invoice
-                results = self.process_invoice_image(file_path)
+                with collect_job_metrics() as metrics:
+                    results = self.process_invoice_image(file_path)
                 
                 # Update job with results
                 job.status = "completed"
                 job.result = json.dumps(results)
+                job.extractor_id = self.extractor_id()
+                job.metrics = json.dumps(metrics) if metrics else None
                 job.completed_at = datetime.utcnow()
                 db.session.commit()
+                job_events.publish(job_id)
                 
                 logger.info(f"Job {job_id} completed successfully")
                 
@@ -113,6 +431,7 @@ class InvoiceOCRProcessor:
                     job.error_message = str(e)
                     job.completed_at = datetime.utcnow()
                     db.session.commit()
+                    job_events.publish(job_id)
     
     def process_invoice_image(self, image_path):
         """
@@ -123,38 +442,29 @@ class InvoiceOCRProcessor:
         
         try:
             # Use OpenAI for processing instead of traditional OCR
-            if openai_processor and os.environ.get("OPENAI_API_KEY"):
+            if self._uses_openai():
                 logger.info("Using OpenAI Vision API for invoice processing")
-                # Initialize OpenAI processor with app
-                if self.app and not openai_processor.app:
-                    openai_processor.init_app(self.app)
-                
                 # Process with OpenAI
                 extracted_data = openai_processor.process_invoice_image(image_path)
                 logger.info(f"Successfully processed invoice image with OpenAI: {image_path}")
                 return extracted_data
             else:
                 logger.info("OpenAI processing not available, using standard OCR")
-                # Load image with OpenCV for preprocessing
-                img = cv2.imread(image_path)
-                if img is None:
-                    raise ValueError(f"Failed to load image from {image_path}")
-                
-                # Preprocess image for better OCR results
-                preprocessed_img = self._preprocess_image(img)
-                
-                # Convert back to PIL Image for Tesseract
-                pil_img = Image.fromarray(preprocessed_img)
                 
-                # Extract text with Tesseract OCR with additional configuration for structured output
-                ocr_config = r'--oem 3 --psm 6 -c preserve_interword_spaces=1'
-                ocr_data = pytesseract.image_to_data(pil_img, config=ocr_config, output_type=pytesseract.Output.DICT)
+                # Reuse a previous extraction of the same document with the same engine and extractor
+                cache_key = extraction_cache.make_key(file_sha256(image_path), *self.extraction_settings())
+                cached_data = extraction_cache.get(cache_key)
+                if cached_data is not None:
+                    logger.info(f"Using cached OCR extraction for {image_path}")
+                    return cached_data
                 
-                # Extract text with Tesseract OCR
-                raw_text = pytesseract.image_to_string(pil_img)
-                
-                # Process the OCR data to extract structured information
-                extracted_data = self._extract_invoice_data(raw_text, ocr_data)
+                # CPU-bound work runs in the warm worker processes in process mode,
+                # otherwise on the calling thread
+                if self.execution_mode == 'process':
+                    extracted_data = ocr_process_pool.run(image_path)
+                else:
+                    extracted_data, _ = self.document_ocr.ocr_document(image_path)
+                extraction_cache.set(cache_key, extracted_data)
                 
                 logger.info(f"Successfully processed invoice image with standard OCR: {image_path}")
                 return extracted_data
@@ -163,226 +473,48 @@ class InvoiceOCRProcessor:
             logger.exception(f"Error processing invoice image {image_path}: {str(e)}")
             raise
     
-    def _preprocess_image(self, img):
-        """Preprocess image for better OCR results"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Apply adaptive thresholding
-        thresh = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
-        # Apply morphological operations to clean up the image
-        kernel = np.ones((1, 1), np.uint8)
-        opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        
-        return opening
+    def _uses_openai(self):
+        """Whether documents are extracted by the OpenAI Vision API rather than standard OCR"""
+        if not (openai_processor and os.environ.get("OPENAI_API_KEY")):
+            return False
+        # Initialize OpenAI processor with app
+        if self.app and not openai_processor.app:
+            openai_processor.init_app(self.app)
+        return True
+    
+    def extraction_settings(self):
+        """(engine, model, version) of the extraction documents currently go through, as used in cache keys"""
+        if self._uses_openai():
+            return 'openai', OPENAI_MODEL, openai_processor.extraction_version()
+        return ('tesseract', self.document_ocr.get_ocr_engine_id(),
+                f"{EXTRACTOR_VERSION} {self.document_ocr.document_dpi}dpi {self.document_ocr.preprocessor.describe()}")
     
-    def _extract_invoice_data(self, raw_text, ocr_data):
+    def extractor_id(self):
         """
-        Extract structured data from OCR results
-        Returns a dict with extracted fields and confidence values
+        Digest of extraction_settings(), stored on completed jobs so a stored result is only
+        reused for a duplicate upload while the same engine, model and extractor version are in use
         """
-        # Calculate average confidence
-        conf_values = [c for c in ocr_data['conf'] if c != -1]
-        avg_confidence = sum(conf_values) / len(conf_values) if conf_values else 0
-        
-        # Split text into lines for processing
-        lines = raw_text.split('\n')
-        
-        # Initialize extracted data dict
-        extracted_data = {
-            'vendor': {'name': None, 'gstin': None, 'address': None},
-            'customer': {'name': None, 'gstin': None, 'address': None},
-            'invoice_number': None,
-            'invoice_date': None,
-            'due_date': None,
-            'po_number': None,
-            'place_of_supply': None,
-            'line_items': [],
-            'subtotal': None,
-            'tax_amount': None,
-            'discount': 0.0,
-            'total_amount': None,
-            'terms': None,
-            'ocr_confidence': avg_confidence
-        }
-        
-        # Extract vendor information
-        vendor_pattern = re.compile(r'^([A-Za-z0-9\s]+(?:Pvt|Private|Ltd|Limited|Co\.|Corporation|Industries|Technologies|Systems|Components)\s*(?:Ltd|Limited|LLP|Co\.|Corporation)?)', re.IGNORECASE)
-        gstin_pattern = re.compile(r'GSTIN:\s*([0-9A-Z]{15})')
-        
-        # Extract invoice details
-        invoice_num_pattern = re.compile(r'Invoice\s*No\s*[.:]\s*(INV-[0-9-]+)', re.IGNORECASE)
-        invoice_date_pattern = re.compile(r'Invoice\s*Date\s*[.:]\s*(\d{4}-\d{2}-\d{2})', re.IGNORECASE)
-        due_date_pattern = re.compile(r'Due\s*Date\s*[.:]\s*(\d{4}-\d{2}-\d{2})', re.IGNORECASE)
-        po_pattern = re.compile(r'P\.?O\.?\s*#?\s*[.:]\s*(PO-[0-9-]+)', re.IGNORECASE)
-        
-        # Extract billing and shipping information
-        bill_to_pattern = re.compile(r'Bill\s*To\s*([A-Za-z0-9\s]+)', re.IGNORECASE)
-        ship_to_pattern = re.compile(r'Ship\s*To\s*([A-Za-z0-9\s,]+)', re.IGNORECASE)
-        
-        # Extract totals
-        subtotal_pattern = re.compile(r'Subtotal\s*([0-9,.]+)', re.IGNORECASE)
-        tax_pattern = re.compile(r'(?:GST|Tax|IGST)\s*(?:18%|18)\s*([0-9,.]+)', re.IGNORECASE)
-        discount_pattern = re.compile(r'Discount\s*\([0-9%]+\)\s*-?([0-9,.]+)', re.IGNORECASE)
-        total_pattern = re.compile(r'Total\s*([₹₨]?\s*[0-9,.]+)', re.IGNORECASE)
-        
-        # Extract line items - this is more complex and depends on the table structure
-        item_section = False
-        item_rows = []
-        
-        # Process each line
-        for i, line in enumerate(lines):
-            # Skip empty lines
-            if not line.strip():
-                continue
-                
-            # Look for vendor name at the beginning
-            if i < 5 and not extracted_data['vendor']['name']:
-                vendor_match = vendor_pattern.search(line)
-                if vendor_match:
-                    extracted_data['vendor']['name'] = vendor_match.group(1).strip()
-                    continue
-            
-            # Look for GSTIN
-            gstin_match = gstin_pattern.search(line)
-            if gstin_match and not extracted_data['vendor']['gstin']:
-                extracted_data['vendor']['gstin'] = gstin_match.group(1).strip()
-                continue
-            
-            # Invoice number
-            invoice_match = invoice_num_pattern.search(line)
-            if invoice_match and not extracted_data['invoice_number']:
-                extracted_data['invoice_number'] = invoice_match.group(1).strip()
-                continue
-            
-            # Invoice date
-            date_match = invoice_date_pattern.search(line)
-            if date_match and not extracted_data['invoice_date']:
-                extracted_data['invoice_date'] = date_match.group(1).strip()
-                continue
-            
-            # Due date
-            due_date_match = due_date_pattern.search(line)
-            if due_date_match and not extracted_data['due_date']:
-                extracted_data['due_date'] = due_date_match.group(1).strip()
-                continue
-            
-            # PO number
-            po_match = po_pattern.search(line)
-            if po_match and not extracted_data['po_number']:
-                extracted_data['po_number'] = po_match.group(1).strip()
-                continue
-            
-            # Bill To
-            bill_match = bill_to_pattern.search(line)
-            if bill_match and not extracted_data['customer']['name']:
-                extracted_data['customer']['name'] = bill_match.group(1).strip()
-                # Look for customer GSTIN in the next few lines
-                for j in range(i+1, min(i+5, len(lines))):
-                    gstin_match = gstin_pattern.search(lines[j])
-                    if gstin_match:
-                        extracted_data['customer']['gstin'] = gstin_match.group(1).strip()
-                        break
-                continue
-            
-            # Ship To address
-            ship_match = ship_to_pattern.search(line)
-            if ship_match and not extracted_data['customer']['address']:
-                extracted_data['customer']['address'] = ship_match.group(1).strip()
-                continue
-            
-            # Look for place of supply
-            if "Place Of Supply" in line and not extracted_data['place_of_supply']:
-                pos_parts = line.split(":")
-                if len(pos_parts) > 1:
-                    extracted_data['place_of_supply'] = pos_parts[1].strip()
-                continue
-            
-            # Check for line items section start
-            if re.search(r'#\s*Item\s*&\s*Description|HSN/SAC\s*Qty\s*Rate', line, re.IGNORECASE):
-                item_section = True
-                continue
-            
-            # Check for the end of line items section
-            if item_section and re.search(r'Subtotal|Total\s*Taxable', line, re.IGNORECASE):
-                item_section = False
-            
-            # Collect line item rows
-            if item_section and re.search(r'\d+\s+\S+', line):
-                item_rows.append(line.strip())
-            
-            # Extract totals
-            subtotal_match = subtotal_pattern.search(line)
-            if subtotal_match and not extracted_data['subtotal']:
-                subtotal_str = subtotal_match.group(1).replace(',', '')
-                try:
-                    extracted_data['subtotal'] = float(subtotal_str)
-                except ValueError:
-                    pass
-                continue
-            
-            tax_match = tax_pattern.search(line)
-            if tax_match and not extracted_data['tax_amount']:
-                tax_str = tax_match.group(1).replace(',', '')
-                try:
-                    extracted_data['tax_amount'] = float(tax_str)
-                except ValueError:
-                    pass
-                continue
-            
-            discount_match = discount_pattern.search(line)
-            if discount_match:
-                discount_str = discount_match.group(1).replace(',', '')
-                try:
-                    extracted_data['discount'] = float(discount_str)
-                except ValueError:
-                    pass
-                continue
-            
-            total_match = total_pattern.search(line)
-            if total_match and not extracted_data['total_amount'] and 'Balance Due' in line:
-                total_str = total_match.group(1).replace('₹', '').replace('₨', '').replace(',', '').strip()
-                try:
-                    extracted_data['total_amount'] = float(total_str)
-                except ValueError:
-                    pass
-                continue
-        
-        # Process line items
-        for row in item_rows:
-            # This logic will depend on the specific format of line items in your invoices
-            # Using regex to parse line items with a common structure
-            item_match = re.search(r'(\d+)\s+([^0-9]+)\s+(\d+)\s+(\d+)\s+([0-9,.]+)\s+(\d+)%\s+([0-9,.]+)\s+([0-9,.]+)', row)
-            if item_match:
-                try:
-                    line_item = {
-                        'description': item_match.group(2).strip(),
-                        'hsn_sac': item_match.group(3).strip(),
-                        'quantity': float(item_match.group(4)),
-                        'rate': float(item_match.group(5).replace(',', '')),
-                        'tax_percentage': float(item_match.group(6)),
-                        'tax_amount': float(item_match.group(7).replace(',', '')),
-                        'amount': float(item_match.group(8).replace(',', ''))
-                    }
-                    extracted_data['line_items'].append(line_item)
-                except (ValueError, IndexError):
-                    pass
-        
-        # Set default terms
-        extracted_data['terms'] = "Immediate"  # Default observed in sample invoices
-        
-        return extracted_data
+        return hashlib.sha256('|'.join(str(part) for part in self.extraction_settings()).encode('utf-8')).hexdigest()
     
-    def get_job_status(self, job_id):
-        """Get the status of a processing job"""
+    def get_job_status(self, job_id, include_result=True):
+        """
+        Get the status of a processing job
+        With include_result=False only the status columns are read, not the result blob
+        """
         with self.app.app_context():
+            if not include_result:
+                job = (db.session.query(ProcessingJob.status, ProcessingJob.error_message, ProcessingJob.completed_at)
+                       .filter(ProcessingJob.job_id == job_id)
+                       .first())
+                if not job:
+                    return None
+                
+                return {
+                    'status': job.status,
+                    'error': job.error_message,
+                    'completed_at': job.completed_at.isoformat() if job.completed_at else None
+                }
+            
             job = ProcessingJob.query.filter_by(job_id=job_id).first()
             if not job:
                 return None
@@ -391,5 +523,134 @@ class InvoiceOCRProcessor:
                 'status': job.status,
                 'error': job.error_message,
                 'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-                'result': json.loads(job.result) if job.result else None
+                'result': json.loads(job.result) if job.result else None,
+                'metrics': json.loads(job.metrics) if job.metrics else None
+            }
+    
+    def get_jobs_status(self, job_ids=None, batch_id=None, since=None, until=None, include_result=False, limit=500,
+                        after=None):
+        """
+        Get the status of up to limit processing jobs with a single query
+        Jobs can be selected by id, by batch and/or by a started_at time window, and are
+        returned in (started_at, id) order starting after the position given as after
+        Returns (jobs, continuation): the (started_at, id) position to pass as after to get
+        the next jobs, or None when no jobs are left
+        """
+        columns = [
+            ProcessingJob.id,
+            ProcessingJob.job_id,
+            ProcessingJob.status,
+            ProcessingJob.error_message,
+            ProcessingJob.batch_id,
+            ProcessingJob.started_at,
+            ProcessingJob.completed_at
+        ]
+        if include_result:
+            columns.append(ProcessingJob.result)
+        
+        with self.app.app_context():
+            query = db.session.query(*columns)
+            if job_ids:
+                query = query.filter(ProcessingJob.job_id.in_(job_ids))
+            if batch_id:
+                query = query.filter(ProcessingJob.batch_id == batch_id)
+            if since:
+                query = query.filter(ProcessingJob.started_at >= since)
+            if until:
+                query = query.filter(ProcessingJob.started_at < until)
+            if after:
+                query = query.filter(tuple_(ProcessingJob.started_at, ProcessingJob.id) > tuple(after))
+            
+            # One extra row tells whether the selection continues past this page
+            rows = query.order_by(ProcessingJob.started_at, ProcessingJob.id).limit(limit + 1).all()
+        
+        continuation = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            continuation = (rows[-1].started_at, rows[-1].id)
+        
+        jobs = []
+        for row in rows:
+            job_status = {
+                'job_id': row.job_id,
+                'status': row.status,
+                'error': row.error_message,
+                'batch_id': row.batch_id,
+                'started_at': row.started_at.isoformat() if row.started_at else None,
+                'completed_at': row.completed_at.isoformat() if row.completed_at else None
+            }
+            if include_result:
+                job_status['result'] = json.loads(row.result) if row.result else None
+            jobs.append(job_status)
+        
+        # Keep the order the ids were requested in
+        if job_ids:
+            position = {job_id: index for index, job_id in enumerate(job_ids)}
+            jobs.sort(key=lambda job: position[job['job_id']])
+        
+        return jobs, continuation
+    
+    def wait_for_job_status(self, job_id, known_status, timeout, recheck_interval):
+        """
+        Wait until a job leaves known_status or the timeout expires
+        Local transitions wake the waiter immediately; changes made by other
+        processes are noticed on the next recheck. Returns the latest status-only payload
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            version = job_events.version(job_id)
+            job_status = self.get_job_status(job_id, include_result=False)
+            if not job_status or job_status['status'] != known_status:
+                return job_status
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job_status
+            job_events.wait(job_id, version, min(remaining, recheck_interval))
+    
+    def get_batch_status(self, batch_id):
+        """Get aggregate progress for all jobs in a batch"""
+        with self.app.app_context():
+            rows = (db.session.query(
+                        ProcessingJob.status,
+                        func.count(ProcessingJob.id),
+                        func.min(ProcessingJob.started_at),
+                        func.max(ProcessingJob.completed_at))
+                    .filter(ProcessingJob.batch_id == batch_id)
+                    .group_by(ProcessingJob.status)
+                    .all())
+            if not rows:
+                return None
+            
+            counts = {'pending': 0, 'processing': 0, 'completed': 0, 'error': 0}
+            started_at = None
+            last_completed_at = None
+            for status, count, first_started, last_completed in rows:
+                counts[status] = count
+                if first_started and (started_at is None or first_started < started_at):
+                    started_at = first_started
+                if last_completed and (last_completed_at is None or last_completed > last_completed_at):
+                    last_completed_at = last_completed
+            
+            total = sum(counts.values())
+            finished = counts['completed'] + counts['error']
+            
+            # Throughput over the time the batch has been running
+            elapsed = None
+            docs_per_minute = None
+            if started_at:
+                end = last_completed_at if finished == total and last_completed_at else datetime.utcnow()
+                elapsed = max((end - started_at).total_seconds(), 0.001)
+                docs_per_minute = round(finished / elapsed * 60, 2)
+            
+            return {
+                'batch_id': batch_id,
+                'total': total,
+                'counts': counts,
+                'finished': finished,
+                'done': finished == total,
+                'started_at': started_at.isoformat() if started_at else None,
+                'completed_at': last_completed_at.isoformat() if last_completed_at and finished == total else None,
+                'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+                'docs_per_minute': docs_per_minute
             }
@@ -0,0 +1,282 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
+from job_metrics import record_metric
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough prompt cost of one high-detail invoice image (6 tiles of 170 tokens plus 85)
+# used to reserve TPM capacity before the real usage is known
+IMAGE_TOKEN_ESTIMATE = 1105
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate.
+    Bursts are capped at one second's worth so that no 60 second window sees much
+    more than the quota; larger reservations (e.g. a request's estimated tokens)
+    put the bucket into debt that later callers wait out.
+    Only used from the client's event loop thread, so it needs no thread locking.
+    """
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount):
+        """Wait until the bucket can cover amount (or is full) and take it; waiters are served in order"""
+        needed = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+    
+    def adjust(self, amount):
+        """Charge (or refund, when negative) the difference between reserved and actual usage"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+def estimate_tokens(messages, max_tokens):
+    """Estimate the tokens a chat request counts against the TPM quota, including max_tokens"""
+    tokens = max_tokens or 0
+    for message in messages:
+        content = message.get('content')
+        parts = content if isinstance(content, list) else [{'type': 'text', 'text': content or ''}]
+        for part in parts:
+            if part.get('type') == 'image_url':
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                tokens += len(part.get('text') or '') // 4 + 4
+    return tokens
+
+def retry_after_seconds(error):
+    """Read the retry delay the API asked for, if any, from an error response"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    
+    headers = response.headers
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+class OpenAIClientPool:
+    """
+    Shared OpenAI client running on a background asyncio event loop.
+    Requests from job threads are capped by a concurrency semaphore, paced by
+    request-per-minute and token-per-minute buckets, and retried with jittered
+    exponential backoff that honours retry-after hints. A 429 pauses every
+    request in the process, not only the one that received it.
+    """
+    def __init__(self, app=None):
+        self.app = app
+        self.base_url = None
+        self.max_concurrency = 8
+        self.rpm_limit = 0
+        self.tpm_limit = 0
+        self.max_retries = 5
+        self.backoff_base = 1.0
+        self.backoff_max = 60.0
+        self.timeout = 120
+        
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._request_bucket = None
+        self._token_bucket = None
+        self._resume_at = 0.0
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0,
+                       'in_flight': 0, 'throttled_seconds': 0.0, 'tokens': 0}
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize with Flask app"""
+        self.app = app
+        self.base_url = app.config.get('OPENAI_BASE_URL')
+        self.max_concurrency = max(1, app.config.get('OPENAI_MAX_CONCURRENCY', 8))
+        self.rpm_limit = app.config.get('OPENAI_RPM_LIMIT', 0)
+        self.tpm_limit = app.config.get('OPENAI_TPM_LIMIT', 0)
+        self.max_retries = app.config.get('OPENAI_MAX_RETRIES', 5)
+        self.backoff_base = app.config.get('OPENAI_BACKOFF_BASE', 1.0)
+        self.backoff_max = app.config.get('OPENAI_BACKOFF_MAX', 60.0)
+        self.timeout = app.config.get('OPENAI_REQUEST_TIMEOUT', 120)
+    
+    def _get_loop(self):
+        """Start the event loop thread and create the client on first use"""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='openai-client', daemon=True)
+                thread.start()
+                try:
+                    asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                except Exception:
+                    loop.call_soon_threadsafe(loop.stop)
+                    raise
+                self._loop = loop
+            return self._loop
+    
+    async def _setup(self):
+        """Create the client and limiters inside the event loop they will run on"""
+        self._client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=self.base_url or None,
+            timeout=self.timeout,
+            max_retries=0  # Retries are handled here so they share the rate limiters
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._request_bucket = TokenBucket(self.rpm_limit) if self.rpm_limit else None
+        self._token_bucket = TokenBucket(self.tpm_limit) if self.tpm_limit else None
+    
+    def create_chat_completion(self, **kwargs):
+        """
+        Run a chat completion from a synchronous caller and wait for the response
+        Retry, throttling and token counts are recorded on the current job's metrics
+        """
+        future = asyncio.run_coroutine_threadsafe(self._create_with_retries(kwargs), self._get_loop())
+        response, call_stats = future.result()
+        
+        record_metric('openai_attempts', call_stats['attempts'])
+        record_metric('openai_throttle_ms', round(call_stats['throttled_seconds'] * 1000, 1))
+        if call_stats['tokens'] is not None:
+            record_metric('openai_tokens', call_stats['tokens'])
+        return response
+    
+    async def _create_with_retries(self, kwargs):
+        """Send a request through the limiters, retrying transient failures"""
+        estimated_tokens = estimate_tokens(kwargs.get('messages', []), kwargs.get('max_tokens'))
+        call_stats = {'attempts': 0, 'throttled_seconds': 0.0, 'tokens': None}
+        self._update_stats(requests=1)
+        
+        while True:
+            call_stats['attempts'] += 1
+            try:
+                response = await self._create_once(kwargs, estimated_tokens, call_stats)
+            except Exception as e:
+                delay = self._retry_delay(e, call_stats['attempts'])
+                if delay is None:
+                    self._update_stats(failed=1)
+                    raise
+                
+                if isinstance(e, RateLimitError):
+                    self._update_stats(rate_limited=1)
+                    # Hold back every request in this process, not just this one
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                
+                self._update_stats(retries=1)
+                logger.warning(f"OpenAI request failed ({str(e)}), retry {call_stats['attempts']} "
+                               f"of {self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            
+            usage = getattr(response, 'usage', None)
+            if usage is not None and getattr(usage, 'total_tokens', None) is not None:
+                call_stats['tokens'] = usage.total_tokens
+                if self._token_bucket:
+                    self._token_bucket.adjust(usage.total_tokens - estimated_tokens)
+            self._update_stats(succeeded=1, tokens=call_stats['tokens'] or 0)
+            return response, call_stats
+    
+    async def _create_once(self, kwargs, estimated_tokens, call_stats):
+        """Wait for rate limit capacity and a concurrency slot, then send one request"""
+        start = time.monotonic()
+        pause = self._resume_at - start
+        if pause > 0:
+            await asyncio.sleep(pause)
+        if self._request_bucket:
+            await self._request_bucket.acquire(1)
+        if self._token_bucket:
+            await self._token_bucket.acquire(estimated_tokens)
+        
+        async with self._semaphore:
+            waited = time.monotonic() - start
+            call_stats['throttled_seconds'] += waited
+            self._update_stats(in_flight=1, throttled_seconds=waited)
+            try:
+                return await self._client.chat.completions.create(**kwargs)
+            except Exception:
+                # Rejected or failed attempts are not billed, give the reservation back
+                if self._token_bucket:
+                    self._token_bucket.adjust(-estimated_tokens)
+                raise
+            finally:
+                self._update_stats(in_flight=-1)
+    
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying a failed attempt, or None when it should not be retried"""
+        if attempt > self.max_retries:
+            return None
+        
+        if isinstance(error, APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS_CODES:
+                return None
+            # Exhausted billing quota will not recover by waiting
+            if getattr(error, 'code', None) == 'insufficient_quota':
+                return None
+        elif not isinstance(error, APIConnectionError):
+            return None
+        
+        # Full jitter keeps many workers from retrying in lockstep
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after) + backoff * 0.1
+        return backoff
+    
+    def _update_stats(self, **changes):
+        with self._stats_lock:
+            for key, value in changes.items():
+                self._stats[key] += value
+    
+    def get_stats(self):
+        """Get request, retry and throttling counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 3)
+        stats['max_concurrency'] = self.max_concurrency
+        stats['rpm_limit'] = self.rpm_limit
+        stats['tpm_limit'] = self.tpm_limit
+        stats['max_retries'] = self.max_retries
+        stats['paused_seconds'] = round(max(0.0, self._resume_at - time.monotonic()), 3)
+        return stats
+
+# Shared by every processor instance in the process
+openai_client = OpenAIClientPool()
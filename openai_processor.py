@@ -1,16 +1,77 @@
 import os
 import json
+import time
 import base64
+import hashlib
 import logging
 from datetime import datetime
 import re
-from openai import OpenAI
+from itertools import islice
+from PIL import Image, ImageOps
+from extraction_cache import extraction_cache, file_sha256
+from document_loader import is_paged_document, iter_document_pages
+from image_normalizer import MIME_TYPES, normalize_image
+from job_metrics import record_metric
+from openai_client import openai_client
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+OPENAI_MODEL = "gpt-4o"
+
+# Prompt for invoice data extraction
+SYSTEM_PROMPT = """
+You are an expert invoice data extractor. Analyze the invoice image carefully and extract the following details:
+
+1. Vendor information (name, GSTIN, address)
+2. Customer information (name, GSTIN, address)
+3. Invoice details (number, date, due date, PO number)
+4. Line items (description, HSN/SAC code, quantity, rate, tax percentage, tax amount, amount)
+5. Financial details (subtotal, tax amount, discount, total amount)
+6. Other details (place of supply, terms)
+
+Format your response as a JSON object with these fields. Use the following structure:
+{
+  "vendor": {
+    "name": "Vendor Name", 
+    "gstin": "GSTIN Number",
+    "address": "Vendor Address"
+  },
+  "customer": {
+    "name": "Customer Name",
+    "gstin": "GSTIN Number",
+    "address": "Customer Address"
+  },
+  "invoice_number": "INV-12345",
+  "invoice_date": "YYYY-MM-DD",
+  "due_date": "YYYY-MM-DD",
+  "po_number": "PO-12345",
+  "place_of_supply": "Place",
+  "line_items": [
+    {
+      "description": "Item description",
+      "hsn_sac": "HSN/SAC code",
+      "quantity": 1,
+      "rate": 100.00,
+      "tax_percentage": 18,
+      "tax_amount": 18.00,
+      "amount": 118.00
+    }
+  ],
+  "subtotal": 100.00,
+  "tax_amount": 18.00,
+  "discount": 0.00,
+  "total_amount": 118.00,
+  "terms": "Payment terms"
+}
+
+If you can't find a value, use null. Be very precise and extract the exact values as they appear on the invoice.
+For numeric fields (quantity, rate, tax_percentage, tax_amount, amount, subtotal, discount, total_amount), 
+ensure they are numeric values, not strings.
+"""
+
+# Cached results are keyed on the prompt, so editing it invalidates old entries
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]
 
 class OpenAIInvoiceProcessor:
     """
@@ -18,6 +79,11 @@ class OpenAIInvoiceProcessor:
     """
     def __init__(self, app=None):
         self.app = app
+        self.document_dpi = 200
+        self.skip_blank_pages = True
+        self.max_pages = 10
+        self.max_image_dimension = 2048
+        self.image_format = 'auto'
         
         if app:
             self.init_app(app)
@@ -26,15 +92,86 @@ class OpenAIInvoiceProcessor:
         """Initialize with Flask app"""
         self.app = app
         self.upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+        self.document_dpi = app.config.get('DOCUMENT_DPI', 200)
+        self.skip_blank_pages = app.config.get('DOCUMENT_SKIP_BLANK_PAGES', True)
+        self.max_pages = app.config.get('OPENAI_MAX_PAGES', 10)
+        self.max_image_dimension = app.config.get('OPENAI_IMAGE_MAX_DIMENSION', 2048)
+        self.image_format = app.config.get('OPENAI_IMAGE_FORMAT', 'auto')
         
         # Ensure upload folder exists
         os.makedirs(self.upload_folder, exist_ok=True)
     
+    def extraction_version(self):
+        """The prompt and page image settings, which change what the model is asked and shown"""
+        return (f"{PROMPT_VERSION} {self.max_image_dimension}px {self.max_pages}pages {self.document_dpi}dpi "
+                f"{self.image_format} skip_blank={self.skip_blank_pages}")
+    
     def encode_image_to_base64(self, image_path):
         """Convert image to base64 for OpenAI API"""
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
     
+    def build_image_parts(self, image_path):
+        """
+        Build the image parts of the request message
+        Each image is decoded once, downsized to max_image_dimension, converted to grayscale
+        when it has no color and re-encoded with a matching MIME type. PDFs and TIFFs are
+        rasterized and sent as one part per non-blank page.
+        """
+        start = time.perf_counter()
+        original_bytes = os.path.getsize(image_path)
+        
+        if is_paged_document(image_path):
+            pages = iter_document_pages(image_path, dpi=self.document_dpi, skip_blank=self.skip_blank_pages)
+            encoded_images = [self._normalize(page.image) for page in islice(pages, self.max_pages)]
+        else:
+            encoded_images = [self._encode_single_image(image_path, original_bytes)]
+        
+        if not encoded_images:
+            raise ValueError(f"No non-blank pages found in {image_path}")
+        
+        image_parts = []
+        for data, mime_type in encoded_images:
+            base64_image = base64.b64encode(data).decode('utf-8')
+            image_parts.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}})
+        
+        image_bytes = sum(len(data) for data, _ in encoded_images)
+        normalize_ms = round((time.perf_counter() - start) * 1000, 1)
+        record_metric('openai_original_bytes', original_bytes)
+        record_metric('openai_image_bytes', image_bytes)
+        record_metric('openai_images', len(image_parts))
+        record_metric('openai_normalize_ms', normalize_ms)
+        logger.info(f"Normalized {image_path} for OpenAI: {original_bytes} -> {image_bytes} bytes "
+                    f"in {len(image_parts)} image(s), {normalize_ms} ms")
+        return image_parts
+    
+    def _normalize(self, image):
+        """Downsize and re-encode a decoded image, returning (bytes, MIME type)"""
+        normalized = normalize_image(image, self.max_image_dimension, self.image_format)
+        return normalized.data, normalized.mime_type
+    
+    def _encode_single_image(self, image_path, original_bytes):
+        """Decode a single-page image once and return (bytes, MIME type) for the smaller of it and its normalized form"""
+        try:
+            image = Image.open(image_path)
+            image.load()
+        except OSError as e:
+            raise ValueError(f"Failed to load image from {image_path}: {str(e)}")
+        
+        data, mime_type = self._normalize(ImageOps.exif_transpose(image))
+        
+        # Keep an already compact upload as-is when normalizing would not shrink it
+        if self._can_send_original(image) and original_bytes <= len(data):
+            with open(image_path, 'rb') as image_file:
+                return image_file.read(), MIME_TYPES[image.format]
+        return data, mime_type
+    
+    def _can_send_original(self, image):
+        """Check whether the undecoded upload is already acceptable to the API"""
+        return (image.format in MIME_TYPES
+                and max(image.size) <= self.max_image_dimension
+                and image.getexif().get(0x0112, 1) == 1)  # No EXIF rotation needed
+    
     def process_invoice_image(self, image_path):
         """
         Process an invoice image using OpenAI Vision API
@@ -43,82 +180,42 @@ class OpenAIInvoiceProcessor:
         logger.info(f"Processing invoice image with OpenAI: {image_path}")
         
         try:
-            # Encode the image to base64
-            base64_image = self.encode_image_to_base64(image_path)
-            
-            # Create the prompt for invoice data extraction
-            system_prompt = """
-            You are an expert invoice data extractor. Analyze the invoice image carefully and extract the following details:
-            
-            1. Vendor information (name, GSTIN, address)
-            2. Customer information (name, GSTIN, address)
-            3. Invoice details (number, date, due date, PO number)
-            4. Line items (description, HSN/SAC code, quantity, rate, tax percentage, tax amount, amount)
-            5. Financial details (subtotal, tax amount, discount, total amount)
-            6. Other details (place of supply, terms)
+            # Reuse a previous extraction of the same document with the same prompt, model and page images
+            cache_key = extraction_cache.make_key(file_sha256(image_path), 'openai', OPENAI_MODEL, self.extraction_version())
+            cached_data = extraction_cache.get(cache_key)
+            if cached_data is not None:
+                logger.info(f"Using cached OpenAI extraction for {image_path}")
+                return cached_data
             
-            Format your response as a JSON object with these fields. Use the following structure:
-            {
-              "vendor": {
-                "name": "Vendor Name", 
-                "gstin": "GSTIN Number",
-                "address": "Vendor Address"
-              },
-              "customer": {
-                "name": "Customer Name",
-                "gstin": "GSTIN Number",
-                "address": "Customer Address"
-              },
-              "invoice_number": "INV-12345",
-              "invoice_date": "YYYY-MM-DD",
-              "due_date": "YYYY-MM-DD",
-              "po_number": "PO-12345",
-              "place_of_supply": "Place",
-              "line_items": [
-                {
-                  "description": "Item description",
-                  "hsn_sac": "HSN/SAC code",
-                  "quantity": 1,
-                  "rate": 100.00,
-                  "tax_percentage": 18,
-                  "tax_amount": 18.00,
-                  "amount": 118.00
-                }
-              ],
-              "subtotal": 100.00,
-              "tax_amount": 18.00,
-              "discount": 0.00,
-              "total_amount": 118.00,
-              "terms": "Payment terms"
-            }
-            
-            If you can't find a value, use null. Be very precise and extract the exact values as they appear on the invoice.
-            For numeric fields (quantity, rate, tax_percentage, tax_amount, amount, subtotal, discount, total_amount), 
-            ensure they are numeric values, not strings.
-            """
+            # Normalize and encode the image, or each page of a multi-page document
+            image_parts = self.build_image_parts(image_path)
+            if len(image_parts) > 1:
+                instruction = (f"These {len(image_parts)} images are consecutive pages of one invoice. "
+                               "Extract all invoice data as a single structured JSON, combining line items from every page.")
+            else:
+                instruction = "Extract all invoice data from this image as a structured JSON."
             
             logger.info("Sending request to OpenAI API")
+            request_start = time.perf_counter()
             
-            # Call OpenAI API with the image
-            response = client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+            # Call OpenAI API with the image through the shared rate-limited client
+            response = openai_client.create_chat_completion(
+                model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "system",
-                        "content": system_prompt
+                        "content": SYSTEM_PROMPT
                     },
                     {
                         "role": "user", 
-                        "content": [
-                            {"type": "text", "text": "Extract all invoice data from this image as a structured JSON."},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                        ]
+                        "content": [{"type": "text", "text": instruction}] + image_parts
                     }
                 ],
                 response_format={"type": "json_object"},
                 max_tokens=4000
             )
             
+            record_metric('openai_api_ms', round((time.perf_counter() - request_start) * 1000, 1))
             logger.info("Received response from OpenAI API")
             
             # Get the JSON content from the response
@@ -139,6 +236,8 @@ class OpenAIInvoiceProcessor:
                 line_items_count = len(extracted_data.get('line_items', []))
                 logger.info(f"Extracted: Vendor={vendor_name}, Invoice={invoice_num}, Items={line_items_count}")
             
+            extraction_cache.set(cache_key, extracted_data)
+            
             logger.info(f"Successfully processed invoice image with OpenAI: {image_path}")
             return extracted_data
             
@@ -0,0 +1,299 @@
+import re
+from collections import namedtuple
+import numpy as np
+
+# Columns in the order they appear on the invoices, used to infer columns without a readable header
+COLUMN_ORDER = ('index', 'description', 'hsn_sac', 'quantity', 'rate', 'tax_percentage', 'tax_amount', 'amount')
+INDEX, DESCRIPTION, HSN_SAC, QUANTITY, RATE, TAX_PERCENTAGE, TAX_AMOUNT, AMOUNT = range(len(COLUMN_ORDER))
+
+# Header words (lowercased, surrounding punctuation removed) and the column they label
+HEADER_LABELS = {
+    '#': INDEX, 'sl': INDEX, 's.no': INDEX, 'sr.no': INDEX, 'sno': INDEX,
+    'item': DESCRIPTION, 'items': DESCRIPTION, 'description': DESCRIPTION, 'particulars': DESCRIPTION,
+    'hsn/sac': HSN_SAC, 'hsn': HSN_SAC, 'sac': HSN_SAC,
+    'qty': QUANTITY, 'quantity': QUANTITY,
+    'rate': RATE, 'price': RATE,
+    'tax%': TAX_PERCENTAGE, 'gst%': TAX_PERCENTAGE,
+    'amount': AMOUNT
+}
+HEADER_PUNCTUATION = ' .,:;!?_-|()[]{}\'"'
+
+# Sorted label words for vectorized lookup with searchsorted
+_LABEL_WORDS = np.array(sorted(HEADER_LABELS))
+_LABEL_COLUMNS = np.array([HEADER_LABELS[word] for word in _LABEL_WORDS])
+
+# Content of a column segment
+TEXT, NUMBER, PERCENT = range(3)
+
+# Words that end the line item table (Subtotal, Total Taxable)
+TABLE_END_WORDS = ('subtotal', 'taxable')
+
+NUMBER_PATTERN = re.compile(r'[^0-9.]')
+
+WordBoxes = namedtuple('WordBoxes', ['text', 'page', 'left', 'right', 'top', 'bottom', 'height'])
+
+def load_word_boxes(ocr_data):
+    """Load the non-empty words of pytesseract-style OCR data into NumPy arrays"""
+    text = np.strings.strip(np.array(ocr_data['text'], dtype=str))
+    keep = (np.asarray(ocr_data['level']) == 5) & (np.strings.str_len(text) > 0)
+    
+    left = np.asarray(ocr_data['left'], dtype=np.int32)[keep]
+    top = np.asarray(ocr_data['top'], dtype=np.int32)[keep]
+    height = np.asarray(ocr_data['height'], dtype=np.int32)[keep]
+    return WordBoxes(
+        text=text[keep],
+        page=np.asarray(ocr_data['page_num'], dtype=np.int32)[keep],
+        left=left,
+        right=left + np.asarray(ocr_data['width'], dtype=np.int32)[keep],
+        top=top,
+        bottom=top + height,
+        height=height
+    )
+
+def cluster_rows(words):
+    """
+    Group words into visual rows by their vertical centers
+    Returns (order, row) where order sorts the words by page, row and x position
+    and row holds the row index of each word in that order
+    """
+    center = (words.top + words.bottom) / 2.0
+    order = np.lexsort((center, words.page))
+    tolerance = max(1.0, float(np.median(words.height)) * 0.5)
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (np.diff(center[order]) > tolerance) | (np.diff(words.page[order]) != 0)
+    row = np.cumsum(breaks) - 1
+    
+    # Within a row read left to right
+    by_x = np.lexsort((words.left[order], row))
+    return order[by_x], row[by_x]
+
+def cluster_columns(left, right):
+    """
+    Merge word x-extents into column segments separated by vertical gutters
+    Returns the segment lefts (sorted) and rights
+    """
+    order = np.argsort(left, kind='stable')
+    left, right = left[order], right[order]
+    reach = np.maximum.accumulate(right)
+    starts = np.ones(len(left), dtype=bool)
+    starts[1:] = left[1:] > reach[:-1]
+    start_index = np.flatnonzero(starts)
+    return left[start_index], np.maximum.reduceat(right, start_index)
+
+def parse_number(text):
+    """Parse an OCR'd amount such as '1,200.00', '18%' or '₹5,760.00'; returns None if no number is left"""
+    candidate = text.replace(',', '').rstrip('%')
+    if candidate.isascii() and candidate.replace('.', '', 1).isdigit():
+        return float(candidate)
+    
+    # Drop currency symbols and stray characters OCR picked up around the digits
+    cleaned = NUMBER_PATTERN.sub('', text)
+    if not cleaned or cleaned.count('.') > 1:
+        return None
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+def _header_columns(lowered):
+    """Map lowercased words to the column they label, or -1 for words that are not header labels"""
+    normalized = np.strings.strip(lowered, HEADER_PUNCTUATION)
+    position = np.searchsorted(_LABEL_WORDS, normalized).clip(max=len(_LABEL_WORDS) - 1)
+    return np.where(_LABEL_WORDS[position] == normalized, _LABEL_COLUMNS[position], -1)
+
+def _infer_columns(segment_columns, segment_kinds):
+    """
+    Fill in columns the header did not label from their position between labelled ones
+    Text segments join the description; numeric segments take the free columns in
+    COLUMN_ORDER between their labelled neighbours, right-aligned since the amount
+    columns come last and their headers are the ones most often misread
+    """
+    columns = list(segment_columns)
+    known = [i for i, column in enumerate(columns) if column >= 0]
+    
+    for previous, following in zip([-1] + known, known + [len(columns)]):
+        low = columns[previous] if previous >= 0 else -1
+        high = columns[following] if following < len(columns) else len(COLUMN_ORDER)
+        free = [column for column in range(low + 1, high) if column not in columns and column != DESCRIPTION]
+        
+        numeric = []
+        for i in range(previous + 1, following):
+            if segment_kinds[i] == TEXT:
+                if low <= DESCRIPTION <= high:
+                    columns[i] = DESCRIPTION
+            elif segment_kinds[i] == PERCENT and TAX_PERCENTAGE in free:
+                columns[i] = TAX_PERCENTAGE
+                free.remove(TAX_PERCENTAGE)
+            else:
+                numeric.append(i)
+        
+        for i, column in zip(reversed(numeric), reversed(free)):
+            columns[i] = column
+    return columns
+
+def _code_points(text):
+    """View a fixed-width unicode array as an (n, width) array of code points, zero padded"""
+    return text.view(np.uint32).reshape(len(text), -1)
+
+def _lower_ascii(text):
+    """Lowercase the ASCII letters of a unicode array; the header and end words are ASCII"""
+    codes = _code_points(text)
+    upper = (codes >= ord('A')) & (codes <= ord('Z'))
+    return (codes + upper * np.uint32(32)).view(text.dtype).reshape(len(text))
+
+def parse_numbers(texts):
+    """
+    Parse a list of cell texts as numbers; NaN where nothing parses
+    Plain numbers (digits, at most one dot, after removing thousands separators and
+    a trailing %) are converted in one go; the rest go through parse_number
+    """
+    values = np.full(len(texts), np.nan)
+    if not texts:
+        return values
+    
+    candidates = np.strings.rstrip(np.strings.replace(np.array(texts, dtype=str), ',', ''), '%')
+    codes = _code_points(candidates)
+    digits = (codes >= ord('0')) & (codes <= ord('9'))
+    dots = codes == ord('.')
+    plain = (digits | dots | (codes == 0)).all(axis=1) & digits.any(axis=1) & (dots.sum(axis=1) <= 1)
+    values[plain] = candidates[plain].astype(np.float64)
+    for i in np.flatnonzero(~plain).tolist():
+        number = parse_number(texts[i])
+        if number is not None:
+            values[i] = number
+    return values
+
+def extract_line_items(ocr_data):
+    """
+    Extract line items from the word boxes of the item table
+    The table starts at the first row with at least two header labels and ends at the
+    Subtotal/Total Taxable row; it may continue across pages, where repeated header rows
+    are skipped. Returns a list of line item dicts, or None when no table header is found.
+    """
+    words = load_word_boxes(ocr_data)
+    if len(words.text) == 0:
+        return None
+    
+    order, row = cluster_rows(words)
+    text = words.text[order]
+    left, right = words.left[order], words.right[order]
+    row_count = row[-1] + 1
+    
+    # Header rows have two or more distinct column labels
+    lowered = _lower_ascii(text)
+    label = _header_columns(lowered)
+    labelled = label >= 0
+    row_labels = np.unique(row[labelled] * len(COLUMN_ORDER) + label[labelled])
+    header_rows = np.flatnonzero(np.bincount(row_labels // len(COLUMN_ORDER), minlength=row_count) >= 2)
+    if len(header_rows) == 0:
+        return None
+    header_row = header_rows[0]
+    
+    # The body runs from the header to the first row mentioning Subtotal/Total Taxable
+    end_word = np.zeros(len(text), dtype=bool)
+    for end in TABLE_END_WORDS:
+        end_word |= np.strings.find(lowered, end) >= 0
+    end_rows = row[end_word & (row > header_row)]
+    end_row = end_rows.min() if len(end_rows) else row_count
+    body = (row > header_row) & (row < end_row) & ~np.isin(row, header_rows)
+    if not body.any():
+        return []
+    
+    # Columns are separated by gutters no body word crosses; header labels name the
+    # segments they overlap and the rest are classified by content
+    segment_left, segment_right = cluster_columns(left[body], right[body])
+    header = (row == header_row) & labelled
+    overlap = (np.minimum(segment_right[:, None], right[header][None, :])
+               - np.maximum(segment_left[:, None], left[header][None, :]))
+    if overlap.shape[1]:
+        segment_columns = np.where(overlap.max(axis=1) > 0, label[header][overlap.argmax(axis=1)], -1)
+    else:
+        segment_columns = np.full(len(segment_left), -1)
+    
+    body_index = np.flatnonzero(body)
+    body_segment = np.searchsorted(segment_left, left[body_index], side='right') - 1
+    codes = _code_points(text[body_index])
+    has_digit = ((codes >= ord('0')) & (codes <= ord('9'))).any(axis=1)
+    has_percent = (codes == ord('%')).any(axis=1)
+    word_counts = np.bincount(body_segment, minlength=len(segment_left))
+    digit_counts = np.bincount(body_segment, weights=has_digit, minlength=len(segment_left))
+    percent_counts = np.bincount(body_segment, weights=has_percent, minlength=len(segment_left))
+    segment_kinds = np.where(percent_counts * 2 > word_counts, PERCENT,
+                             np.where(digit_counts * 2 > word_counts, NUMBER, TEXT))
+    segment_columns = np.array(_infer_columns(segment_columns.tolist(), segment_kinds.tolist()))
+    
+    # Group body words into cells by (row, column), keeping x order within a cell
+    column = segment_columns[body_segment]
+    in_column = column >= 0
+    cell_key = row[body_index][in_column] * len(COLUMN_ORDER) + column[in_column]
+    by_cell = np.argsort(cell_key, kind='stable')
+    cell_key = cell_key[by_cell]
+    cell_words = text[body_index][in_column][by_cell].tolist()
+    cell_starts = np.flatnonzero(np.r_[True, cell_key[1:] != cell_key[:-1]])
+    bounds = cell_starts.tolist() + [len(cell_words)]
+    cell_texts = [' '.join(cell_words[start:end]) for start, end in zip(bounds, bounds[1:])]
+    cell_rows = cell_key[cell_starts] // len(COLUMN_ORDER)
+    cell_columns = cell_key[cell_starts] % len(COLUMN_ORDER)
+    
+    # Lay the cells out as one array per column over the body rows that have cells
+    table_rows, cell_positions = np.unique(cell_rows, return_inverse=True)
+    columns = {}
+    for column_number in range(len(COLUMN_ORDER)):
+        in_cell_column = np.flatnonzero(cell_columns == column_number).tolist()
+        columns[column_number] = (cell_positions[in_cell_column], [cell_texts[i] for i in in_cell_column])
+    
+    def text_column(column_number):
+        values = [None] * len(table_rows)
+        for position, value in zip(*columns[column_number]):
+            values[position] = value
+        return values
+    
+    def number_column(column_number):
+        values = np.full(len(table_rows), np.nan)
+        positions, texts = columns[column_number]
+        values[positions] = parse_numbers(texts)
+        return values
+    
+    descriptions = text_column(DESCRIPTION)
+    hsn_sac = text_column(HSN_SAC)
+    amounts = number_column(AMOUNT)
+    is_item = (~np.isnan(amounts) & np.array([bool(description) for description in descriptions])).tolist()
+    # Cells that are empty or unreadable stay None so validation flags them instead of accepting 0
+    numbers = {column_number: [None if np.isnan(value) else value for value in number_column(column_number).tolist()]
+               for column_number in (QUANTITY, RATE, TAX_PERCENTAGE, TAX_AMOUNT)}
+    numbers[AMOUNT] = amounts.tolist()
+    
+    # Rows with only a description may be the wrapped continuation of the item above
+    cell_counts = np.bincount(cell_positions, minlength=len(table_rows))
+    description_only = ((cell_counts == 1) & np.isin(np.arange(len(table_rows)), columns[DESCRIPTION][0])).tolist()
+    row_top = np.full(row_count, np.iinfo(np.int32).max)
+    row_bottom = np.zeros(row_count, dtype=np.int32)
+    np.minimum.at(row_top, row, words.top[order])
+    np.maximum.at(row_bottom, row, words.bottom[order])
+    row_page = np.zeros(row_count, dtype=np.int32)
+    row_page[row] = words.page[order]
+    table_rows = table_rows.tolist()
+    line_height = float(np.median(words.height))
+    
+    line_items = []
+    previous_row = None
+    for position, row_number in enumerate(table_rows):
+        if is_item[position]:
+            line_items.append({
+                'description': descriptions[position],
+                'hsn_sac': hsn_sac[position],
+                'quantity': numbers[QUANTITY][position],
+                'rate': numbers[RATE][position],
+                'tax_percentage': numbers[TAX_PERCENTAGE][position],
+                'tax_amount': numbers[TAX_AMOUNT][position],
+                'amount': numbers[AMOUNT][position]
+            })
+        elif (line_items and description_only[position] and row_page[row_number] == row_page[previous_row]
+              and row_top[row_number] - row_bottom[previous_row] < line_height):
+            # A wrapped description continues on the line right below its item
+            line_items[-1]['description'] += ' ' + descriptions[position]
+        else:
+            continue
+        previous_row = row_number
+    
+    return line_items
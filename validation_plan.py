@@ -0,0 +1,195 @@
+import re
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+# Keys a field rule may use; anything else in a rules file is rejected
+RULE_KEYS = {'field', 'required', 'pattern', 'date_format', 'min_value', 'error_msg'}
+
+# strptime directives with a fixed-width fast path, and the regex group each becomes
+_DATE_DIRECTIVES = {'%Y': r'(?P<year>[0-9]{4})', '%m': r'(?P<month>[0-9]{2})', '%d': r'(?P<day>[0-9]{2})'}
+_DATE_DIRECTIVE_PATTERN = re.compile(r'%.')
+
+# Field rules used unless VALIDATION_RULES_FILE overrides them; 'field' is a dotted path into the invoice
+DEFAULT_VALIDATION_RULES = {
+    'invoice_number': {
+        'required': True,
+        'pattern': r'^INV-\d{2}-\d{3}$',
+        'error_msg': 'Invoice number must be in format INV-XX-XXX'
+    },
+    'invoice_date': {
+        'required': True,
+        'date_format': '%Y-%m-%d',
+        'error_msg': 'Invoice date must be in format YYYY-MM-DD'
+    },
+    'due_date': {
+        'required': False,
+        'date_format': '%Y-%m-%d',
+        'error_msg': 'Due date must be in format YYYY-MM-DD'
+    },
+    'po_number': {
+        'required': False,
+        'pattern': r'^PO-\d{2}-\d{3}$',
+        'error_msg': 'PO number must be in format PO-XX-XXX'
+    },
+    'vendor_gstin': {
+        'field': 'vendor.gstin',
+        'required': True,
+        'pattern': r'^\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}$',
+        'error_msg': 'GSTIN must be a valid 15-character code'
+    },
+    'customer_gstin': {
+        'field': 'customer.gstin',
+        'required': True,
+        'pattern': r'^\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}$',
+        'error_msg': 'GSTIN must be a valid 15-character code'
+    },
+    'place_of_supply': {
+        'required': False,
+        'error_msg': 'Place of supply must be a valid state name'
+    },
+    'subtotal': {
+        'required': True,
+        'min_value': 0,
+        'error_msg': 'Subtotal must be a positive number'
+    },
+    'tax_amount': {
+        'required': True,
+        'min_value': 0,
+        'error_msg': 'Tax amount must be a positive number'
+    },
+    'total_amount': {
+        'required': True,
+        'min_value': 0,
+        'error_msg': 'Total amount must be a positive number'
+    }
+}
+
+# Valid Indian states and union territories for place of supply
+INDIAN_STATES = [
+    'Andhra Pradesh', 'Arunachal Pradesh', 'Assam', 'Bihar', 'Chhattisgarh',
+    'Goa', 'Gujarat', 'Haryana', 'Himachal Pradesh', 'Jharkhand', 'Karnataka',
+    'Kerala', 'Madhya Pradesh', 'Maharashtra', 'Manipur', 'Meghalaya', 'Mizoram',
+    'Nagaland', 'Odisha', 'Punjab', 'Rajasthan', 'Sikkim', 'Tamil Nadu',
+    'Telangana', 'Tripura', 'Uttar Pradesh', 'Uttarakhand', 'West Bengal',
+    'Andaman and Nicobar Islands', 'Chandigarh', 'Dadra and Nagar Haveli',
+    'Daman and Diu', 'Delhi', 'Jammu and Kashmir', 'Ladakh', 'Lakshadweep', 'Puducherry'
+]
+
+FieldCheck = namedtuple('FieldCheck', [
+    'name', 'path', 'required', 'match', 'parse_date', 'min_value', 'error_msg', 'required_msg', 'number_msg'
+])
+
+def _date_parser(date_format):
+    """
+    Build a date validity check for a strptime format
+    Formats made only of %Y, %m, %d and literal text are matched with a precompiled regex and
+    date(); anything the fast path does not accept (e.g. single-digit months) goes to strptime,
+    so the result is always the same as strptime's
+    """
+    directives = _DATE_DIRECTIVE_PATTERN.findall(date_format)
+    if sorted(directives) != sorted(_DATE_DIRECTIVES):
+        return lambda value: datetime.strptime(value, date_format)
+    
+    parts = []
+    position = 0
+    for match in _DATE_DIRECTIVE_PATTERN.finditer(date_format):
+        parts.append(re.escape(date_format[position:match.start()]))
+        parts.append(_DATE_DIRECTIVES[match.group()])
+        position = match.end()
+    parts.append(re.escape(date_format[position:]))
+    fast_match = re.compile(''.join(parts) + r'\Z').match
+    
+    def parse(value):
+        match = fast_match(value)
+        if match is None:
+            return datetime.strptime(value, date_format)
+        return date(int(match['year']), int(match['month']), int(match['day']))
+    return parse
+
+def compile_field_check(name, rule):
+    """Compile one field rule from the validation_rules format"""
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown keys in validation rule {name}: {', '.join(sorted(unknown))}")
+    
+    try:
+        match = re.compile(rule['pattern']).match if rule.get('pattern') else None
+    except re.error as e:
+        raise ValueError(f"Invalid pattern in validation rule {name}: {str(e)}")
+    
+    label = name.replace('_', ' ').title()
+    return FieldCheck(
+        name=name,
+        path=tuple(rule.get('field', name).split('.')),
+        required=rule.get('required', False),
+        match=match,
+        parse_date=_date_parser(rule['date_format']) if rule.get('date_format') else None,
+        min_value=rule.get('min_value'),
+        error_msg=rule.get('error_msg', f"{label} is invalid"),
+        required_msg=f"{label} is required",
+        number_msg=f"{label} must be a number"
+    )
+
+class ValidationPlan:
+    """
+    Field rules compiled once for InvoiceFieldValidator: patterns are precompiled,
+    nested fields are resolved from dotted paths instead of being special-cased by name,
+    dates take a regex fast path and valid states are a frozenset
+    """
+    def __init__(self, rules, valid_states):
+        self.checks = tuple(compile_field_check(name, rule) for name, rule in rules.items())
+        self.valid_states = frozenset(valid_states)
+    
+    def check_fields(self, invoice_data, errors):
+        """Apply the field rules to an invoice, adding messages to errors by field name"""
+        for check in self.checks:
+            value = invoice_data
+            for key in check.path:
+                value = value.get(key) if isinstance(value, dict) else None
+            
+            if not value:
+                # Falsy values (None, '', 0) only matter for required fields
+                if check.required:
+                    errors[check.name] = check.required_msg
+                continue
+            
+            if check.match is not None and not check.match(value):
+                errors[check.name] = check.error_msg
+            
+            if check.parse_date is not None:
+                try:
+                    check.parse_date(value)
+                except ValueError:
+                    errors[check.name] = check.error_msg
+            
+            if check.min_value is not None:
+                try:
+                    if float(value) < check.min_value:
+                        errors[check.name] = check.error_msg
+                except (ValueError, TypeError):
+                    errors[check.name] = check.number_msg
+    
+    def is_valid_state(self, state):
+        return isinstance(state, str) and state in self.valid_states
+
+def load_rules_file(path, rules, valid_states):
+    """
+    Merge a JSON rules file into the default rules and states
+    The file may hold "rules" (field name -> rule, or null to drop a rule) and "valid_states";
+    returns the merged (rules, valid_states)
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    
+    unknown = set(config) - {'rules', 'valid_states'}
+    if unknown:
+        raise ValueError(f"Unknown keys in validation rules file {path}: {', '.join(sorted(unknown))}")
+    
+    rules = dict(rules)
+    for name, rule in config.get('rules', {}).items():
+        if rule is None:
+            rules.pop(name, None)
+        else:
+            rules[name] = rule
+    return rules, config.get('valid_states', valid_states)
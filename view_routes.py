@@ -3,7 +3,8 @@ import logging
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from werkzeug.utils import secure_filename
-from models import db, Invoice, Company, Item, ProcessingJob
+from models import db, Invoice, Company, Item, ProcessingJob, invoice_detail_options, invoice_list_options
+from invoice_pagination import InvalidCursor, invoice_count, keyset_page, offset_page
 from ocr_processor import InvoiceOCRProcessor
 from field_validator import InvoiceFieldValidator
 from mock_data import create_mock_data, create_sample_invoice
@@ -44,7 +45,7 @@ def upload_page():
 def dashboard():
     """Render the dashboard page"""
     # Get recent invoices
-    recent_invoices = Invoice.query.order_by(Invoice.created_at.desc()).limit(10).all()
+    recent_invoices = Invoice.query.options(*invoice_list_options()).order_by(Invoice.created_at.desc()).limit(10).all()
     
     # Get processing jobs
     processing_jobs = ProcessingJob.query.order_by(ProcessingJob.started_at.desc()).limit(5).all()
@@ -58,20 +59,29 @@ def dashboard():
 @view_bp.route('/invoices')
 def invoices_list():
     """Render the invoices list page"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = max(1, request.args.get('per_page', 10, type=int))
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', type=int)
     
-    invoices = Invoice.query.order_by(Invoice.invoice_date.desc()).paginate(page=page, per_page=per_page)
+    query = Invoice.query.options(*invoice_list_options())
+    if page is not None and cursor is None:
+        invoices = offset_page(query, page, per_page)  # Old ?page=N links
+    else:
+        try:
+            invoices = keyset_page(query, per_page, cursor)
+        except InvalidCursor:
+            return redirect(url_for('views.invoices_list', per_page=per_page))
     
     return render_template(
         'invoices.html',
-        invoices=invoices
+        invoices=invoices,
+        total=invoice_count.get()
     )
 
 @view_bp.route('/invoices/<int:invoice_id>')
 def invoice_detail(invoice_id):
     """Render the invoice detail page"""
-    invoice = Invoice.query.get_or_404(invoice_id)
+    invoice = db.get_or_404(Invoice, invoice_id, options=invoice_detail_options())
     
     return render_template(
         'invoice_details.html',
@@ -0,0 +1,165 @@
+"""
+Standalone OCR worker that claims ProcessingJob rows from the database.
+
+Set OCR_EXECUTION_MODE=queue on the web tier so uploads are only recorded, then
+run any number of workers on one or more nodes against the same database:
+
+    python worker.py --processes 4
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from job_metrics import collect_job_metrics
+
+logger = logging.getLogger(__name__)
+
+class QueueWorker:
+    """
+    Worker loop that claims jobs from the JobQueue, processes them and
+    keeps the lease alive with heartbeats while OCR is running
+    """
+    def __init__(self, app, processor, worker_id=None):
+        self.app = app
+        self.processor = processor
+        self.queue = processor.job_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 2)
+        self.heartbeat_interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 30)
+        self._stop = threading.Event()
+    
+    def stop(self):
+        """Finish the current job and exit the loop"""
+        self._stop.set()
+    
+    def run(self):
+        """Claim and process jobs until stopped"""
+        logger.info(f"Worker {self.worker_id} started")
+        last_reclaim = 0
+        
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    # Housekeeping runs at heartbeat cadence, not on every poll
+                    if time.monotonic() - last_reclaim >= self.heartbeat_interval:
+                        self.queue.reclaim_expired()
+                        last_reclaim = time.monotonic()
+                    
+                    claimed = self.queue.claim(self.worker_id)
+                
+                if not claimed:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                
+                self.process_job(*claimed)
+            
+            except Exception as e:
+                logger.exception(f"Worker {self.worker_id} error: {str(e)}")
+                self._stop.wait(self.poll_interval)
+        
+        logger.info(f"Worker {self.worker_id} stopped")
+    
+    def process_job(self, job_id, file_path):
+        """Process a claimed job and record its outcome"""
+        logger.info(f"Worker {self.worker_id} claimed job {job_id}")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job_id, done), daemon=True)
+        heartbeat.start()
+        
+        results = None
+        error = None
+        try:
+            with self.app.app_context(), collect_job_metrics() as metrics:
+                results = self.processor.process_invoice_image(file_path)
+        except Exception as e:
+            logger.exception(f"Error processing job {job_id}: {str(e)}")
+            error = str(e)
+        finally:
+            done.set()
+            heartbeat.join()
+        
+        with self.app.app_context():
+            if error is not None:
+                self.queue.fail(job_id, self.worker_id, error)
+            elif self.queue.complete(job_id, self.worker_id, results, metrics, self.processor.extractor_id()):
+                logger.info(f"Job {job_id} completed successfully")
+    
+    def _heartbeat_loop(self, job_id, done):
+        """Renew the job lease until processing finishes"""
+        while not done.wait(self.heartbeat_interval):
+            try:
+                with self.app.app_context():
+                    if not self.queue.heartbeat(job_id, self.worker_id):
+                        logger.warning(f"Worker {self.worker_id} no longer holds the lease on job {job_id}")
+                        return
+            except Exception as e:
+                logger.error(f"Heartbeat failed for job {job_id}: {str(e)}")
+
+def run_worker_process():
+    """Entry point for a single worker process"""
+    # Import inside the process so every worker gets its own engine and connection pool
+    from app import app
+    from ocr_processor import InvoiceOCRProcessor
+    
+    processor = InvoiceOCRProcessor(app)
+    worker = QueueWorker(app, processor)
+    
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    
+    worker.run()
+
+def main():
+    parser = argparse.ArgumentParser(description='Run OCR queue workers')
+    parser.add_argument(
+        '--processes', '-n', type=int,
+        default=int(os.environ.get('OCR_WORKER_PROCESSES', os.cpu_count() or 1)),
+        help='Number of worker processes to run on this node'
+    )
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    if args.processes <= 1:
+        run_worker_process()
+        return
+    
+    ctx = multiprocessing.get_context('spawn')
+    stopping = threading.Event()
+    processes = []
+    
+    def shutdown(signum, frame):
+        stopping.set()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    for _ in range(args.processes):
+        process = ctx.Process(target=run_worker_process)
+        process.start()
+        processes.append(process)
+    
+    logger.info(f"Started {args.processes} worker processes")
+    
+    # Replace workers that die unexpectedly (e.g. OOM kills); their jobs are
+    # reclaimed once the lease expires
+    while not stopping.is_set():
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping.is_set():
+                logger.warning(f"Worker process {process.pid} exited with code {process.exitcode}, restarting")
+                processes[index] = ctx.Process(target=run_worker_process)
+                processes[index].start()
+        stopping.wait(1)
+    
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()